@@ -0,0 +1,350 @@
+"""
+Historique local des activités (base SQLite), pour les questions portant sur plusieurs séances
+(tous les laps d'intensité du mois, baisse moyenne de FC en récupération...) sans relire les CSV.
+
+extract_fit_file.py y ajoute chaque activité traitée avec l'option --store (cf. process_fit_file) :
+
+    activities : une ligne par activité, identifiée par l'empreinte SHA-256 du fichier FIT (un même
+                 contenu traité à nouveau remplace l'activité) : début et fin, durées, distance,
+                 vitesse et fréquences cardiaques moyennes, nombres de records et de laps.
+    laps       : lignes de la table des laps (build_lap_table), clé (activity_id, lap_number), avec
+                 les bornes start_elapsed_s / end_elapsed_s du lap dans les records.
+    records    : lignes de la table des records, clé (activity_id, elapsed_time_s).
+
+Les colonnes de laps et de records suivent les tables produites par l'extraction : une colonne
+apparue avec une nouvelle activité (autre capteur, autre montre) est ajoutée à la table.
+Index : date de début des activités, nature des laps, activité (clés primaires).
+
+Usage :
+    with ActivityStore('results/activities.sqlite') as store:
+        store.laps(nature='Intensity', start='2025-09-01', end='2025-10-01')
+        store.recovery_heart_rate_drop(start='2025-09-01', per_activity=True)
+
+La commande a lancer : python activity_store.py results/activities.sqlite laps --nature Intensity --start 2025-09-01
+    (ou activities, recovery-hr [--per-activity])
+"""
+import sys
+import json
+import sqlite3
+import argparse
+from pathlib import Path
+from datetime import datetime
+
+import pandas as pd
+
+DEFAULT_STORE_NAME = 'activities.sqlite'
+
+# Attente maximale (s) du verrou d'écriture : plusieurs workers peuvent ajouter des activités en parallèle
+BUSY_TIMEOUT_S = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS activities (
+    activity_id INTEGER PRIMARY KEY,
+    fit_sha256 TEXT NOT NULL UNIQUE,
+    fit_file TEXT,
+    pipeline_version INTEGER,
+    ingested_at TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    duration_s REAL,
+    moving_time_s REAL,
+    distance_m REAL,
+    avg_speed_kmh REAL,
+    avg_heart_rate REAL,
+    max_heart_rate INTEGER,
+    n_records INTEGER,
+    n_laps INTEGER,
+    n_intensity_laps INTEGER
+);
+CREATE INDEX IF NOT EXISTS activities_start_time ON activities (start_time);
+
+CREATE TABLE IF NOT EXISTS laps (
+    activity_id INTEGER NOT NULL,
+    lap_number INTEGER NOT NULL,
+    lap_nature TEXT,
+    start_elapsed_s REAL,
+    end_elapsed_s REAL,
+    PRIMARY KEY (activity_id, lap_number)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS laps_lap_nature ON laps (lap_nature, activity_id);
+
+CREATE TABLE IF NOT EXISTS records (
+    activity_id INTEGER NOT NULL,
+    elapsed_time_s REAL NOT NULL,
+    PRIMARY KEY (activity_id, elapsed_time_s)
+) WITHOUT ROWID;
+"""
+
+# Résumé d'une activité : expression SQL sur ses records (colonne nécessaire), ou sur ses laps
+_RECORD_SUMMARY = {
+    'start_time': ('timestamp', "MIN(timestamp)"),
+    'end_time': ('timestamp', "MAX(timestamp)"),
+    'duration_s': ('elapsed_time_s', "MAX(elapsed_time_s)"),
+    'moving_time_s': ('moving_elapsed_time_s', "MAX(moving_elapsed_time_s)"),
+    'distance_m': ('distance', "MAX(distance)"),
+    'avg_speed_kmh': ('speed_kmh', "ROUND(AVG(speed_kmh), 2)"),
+    'avg_heart_rate': ('heart_rate', "ROUND(AVG(heart_rate), 1)"),
+    'max_heart_rate': ('heart_rate', "MAX(heart_rate)"),
+    'n_records': ('elapsed_time_s', "COUNT(*)"),
+}
+
+
+def _quote(name):
+    """Nom de colonne SQL (les colonnes viennent des tables produites, pas de l'utilisateur)."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _sql_type(dtype):
+    if dtype.kind in 'iub':
+        return 'INTEGER'
+    if dtype.kind == 'f':
+        return 'REAL'
+    return 'TEXT'
+
+
+def _iso_timestamps(series):
+    """Dates au format 'AAAA-MM-JJ HH:MM:SS' (microsecondes si présentes), comparables en texte."""
+    timestamps = pd.to_datetime(series)
+    formatted = timestamps.dt.strftime('%Y-%m-%d %H:%M:%S').astype(object)
+    fractional = timestamps.dt.microsecond != 0
+    if fractional.any():
+        formatted[fractional] = timestamps[fractional].dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+    return formatted
+
+
+def _sql_values(series):
+    """Valeurs Python d'une colonne (None pour les valeurs manquantes), liables par sqlite3."""
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        values = _iso_timestamps(series)
+    else:
+        values = series.astype(object)
+    return values.where(series.notna(), None).tolist()
+
+
+def _date_bound(value):
+    """Borne de date (str, date ou datetime) au format des colonnes start_time, ou None."""
+    return None if value is None else str(pd.Timestamp(value))
+
+
+class ActivityStore(object):
+    """Base SQLite de l'historique des activités (créée au besoin)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Transactions gérées explicitement (BEGIN IMMEDIATE : verrou d'écriture pris dès le début)
+        self.conn = sqlite3.connect(str(self.path), timeout=BUSY_TIMEOUT_S, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # --- Écriture ---
+
+    def find_activity(self, fit_sha256, pipeline_version=None):
+        """activity_id de l'activité de ce contenu FIT (et de cette version du pipeline), ou None."""
+        row = self.conn.execute("SELECT activity_id, pipeline_version FROM activities WHERE fit_sha256 = ?",
+                                (fit_sha256,)).fetchone()
+        if row is None or (pipeline_version is not None and row[1] != pipeline_version):
+            return None
+        return row[0]
+
+    def add_activity(self, fit_sha256, records, laps=None, fit_file=None, pipeline_version=None):
+        """
+        Ajoute (ou remplace) une activité en une transaction.
+
+        Args:
+            fit_sha256 (str): Empreinte du contenu du fichier FIT (identité de l'activité).
+            records (pd.DataFrame | iterable): Table des records, ou ses blocs (mode streaming).
+            laps (pd.DataFrame | None): Table des laps.
+            fit_file (str | None): Nom du fichier FIT d'origine.
+            pipeline_version (int | None): Version du pipeline d'extraction (cf. extract_fit_file).
+
+        Returns:
+            int: activity_id.
+        """
+        if isinstance(records, pd.DataFrame):
+            records = [records]
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._delete_activity(fit_sha256)
+            cursor = self.conn.execute(
+                "INSERT INTO activities (fit_sha256, fit_file, pipeline_version, ingested_at) VALUES (?, ?, ?, ?)",
+                (fit_sha256, fit_file, pipeline_version, datetime.now().isoformat(timespec='seconds')))
+            activity_id = cursor.lastrowid
+            for chunk in records:
+                self._insert_rows('records', activity_id, chunk)
+            if laps is not None and not laps.empty:
+                self._insert_rows('laps', activity_id, laps)
+            self._update_lap_bounds(activity_id)
+            self._update_summary(activity_id)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return activity_id
+
+    def _delete_activity(self, fit_sha256):
+        row = self.conn.execute("SELECT activity_id FROM activities WHERE fit_sha256 = ?", (fit_sha256,)).fetchone()
+        if row is not None:
+            for table in ('records', 'laps', 'activities'):
+                self.conn.execute(f"DELETE FROM {table} WHERE activity_id = ?", row)
+
+    def _columns(self, table):
+        return [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+
+    def _insert_rows(self, table, activity_id, df):
+        df = df.drop(columns=['activity_id'], errors='ignore')
+        existing = set(self._columns(table))
+        for col in df.columns:
+            if col not in existing:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {_quote(col)} {_sql_type(df[col].dtype)}")
+
+        columns = ['activity_id'] + list(df.columns)
+        sql = (f"INSERT OR REPLACE INTO {table} ({', '.join(_quote(col) for col in columns)}) "
+               f"VALUES ({', '.join('?' * len(columns))})")
+        values = [[activity_id] * len(df)] + [_sql_values(df[col]) for col in df.columns]
+        self.conn.executemany(sql, zip(*values))
+
+    def _update_lap_bounds(self, activity_id):
+        if 'lap_number' not in self._columns('records'):
+            return
+        self.conn.execute("""
+            UPDATE laps SET start_elapsed_s = bounds.start_s, end_elapsed_s = bounds.end_s
+            FROM (SELECT lap_number, MIN(elapsed_time_s) AS start_s, MAX(elapsed_time_s) AS end_s
+                  FROM records WHERE activity_id = :id GROUP BY lap_number) AS bounds
+            WHERE laps.activity_id = :id AND laps.lap_number = bounds.lap_number
+        """, {'id': activity_id})
+
+    def _update_summary(self, activity_id):
+        record_columns = set(self._columns('records'))
+        expressions = [expression if column in record_columns else "NULL"
+                       for column, expression in _RECORD_SUMMARY.values()]
+        summary = self.conn.execute(f"SELECT {', '.join(expressions)} FROM records WHERE activity_id = ?",
+                                    (activity_id,)).fetchone()
+        n_laps, n_intensity_laps = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(lap_nature = 'Intensity'), 0) FROM laps WHERE activity_id = ?",
+            (activity_id,)).fetchone()
+
+        values = dict(zip(_RECORD_SUMMARY, summary), n_laps=n_laps, n_intensity_laps=n_intensity_laps)
+        assignments = ', '.join(f"{name} = :{name}" for name in values)
+        self.conn.execute(f"UPDATE activities SET {assignments} WHERE activity_id = :activity_id",
+                          {**values, 'activity_id': activity_id})
+
+    # --- Requêtes ---
+
+    def query(self, sql, params=()):
+        """Requête SQL libre sur la base, résultat en DataFrame."""
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def activities(self, start=None, end=None):
+        """Activités commencées dans [start, end[ (bornes facultatives), par date de début."""
+        return self.query("""
+            SELECT * FROM activities
+            WHERE (:start IS NULL OR start_time >= :start) AND (:end IS NULL OR start_time < :end)
+            ORDER BY start_time
+        """, {'start': _date_bound(start), 'end': _date_bound(end)})
+
+    def laps(self, nature=None, start=None, end=None, activity_id=None):
+        """
+        Laps (d'une nature donnée : 'Intensity', 'Recovery'...) des activités commencées dans [start, end[,
+        avec la date de début et le fichier de leur activité.
+        """
+        return self.query("""
+            SELECT a.start_time AS activity_start_time, a.fit_file, l.*
+            FROM laps AS l JOIN activities AS a ON a.activity_id = l.activity_id
+            WHERE (:nature IS NULL OR l.lap_nature = :nature)
+              AND (:start IS NULL OR a.start_time >= :start) AND (:end IS NULL OR a.start_time < :end)
+              AND (:activity_id IS NULL OR l.activity_id = :activity_id)
+            ORDER BY a.start_time, l.lap_number
+        """, {'nature': nature, 'start': _date_bound(start), 'end': _date_bound(end), 'activity_id': activity_id})
+
+    def records(self, activity_id, columns=None, start_elapsed_s=None, end_elapsed_s=None):
+        """Records d'une activité (colonnes choisies), éventuellement limités à [start_elapsed_s, end_elapsed_s]."""
+        selected = ', '.join(_quote(col) for col in columns) if columns else '*'
+        return self.query(f"""
+            SELECT {selected} FROM records
+            WHERE activity_id = :id
+              AND (:start IS NULL OR elapsed_time_s >= :start) AND (:end IS NULL OR elapsed_time_s <= :end)
+            ORDER BY elapsed_time_s
+        """, {'id': activity_id, 'start': start_elapsed_s, 'end': end_elapsed_s})
+
+    def recovery_heart_rate_drop(self, start=None, end=None, per_activity=False):
+        """
+        Baisse de FC de chaque récupération qui suit un lap d'intensité : FC du premier record du lap
+        de récupération (fin de l'effort) moins FC de son dernier record.
+
+        Returns:
+            pd.DataFrame: Une ligne par récupération (activité, lap, FC de début et de fin, baisse, durée),
+            ou par activité (moyenne de la baisse sur la série, nombre de récupérations) si per_activity.
+        """
+        drops = self.query("""
+            WITH recoveries AS (
+                SELECT a.activity_id, a.start_time AS activity_start_time, r.lap_number,
+                       r.start_elapsed_s, r.end_elapsed_s
+                FROM laps AS r
+                JOIN laps AS i ON i.activity_id = r.activity_id AND i.lap_number = r.lap_number - 1
+                JOIN activities AS a ON a.activity_id = r.activity_id
+                WHERE r.lap_nature = 'Recovery' AND i.lap_nature = 'Intensity'
+                  AND (:start IS NULL OR a.start_time >= :start) AND (:end IS NULL OR a.start_time < :end)
+            )
+            SELECT activity_id, activity_start_time, lap_number,
+                   end_elapsed_s - start_elapsed_s AS recovery_duration_s,
+                   (SELECT heart_rate FROM records
+                    WHERE activity_id = rc.activity_id AND elapsed_time_s >= rc.start_elapsed_s
+                      AND elapsed_time_s <= rc.end_elapsed_s AND heart_rate IS NOT NULL
+                    ORDER BY elapsed_time_s LIMIT 1) AS hr_start,
+                   (SELECT heart_rate FROM records
+                    WHERE activity_id = rc.activity_id AND elapsed_time_s >= rc.start_elapsed_s
+                      AND elapsed_time_s <= rc.end_elapsed_s AND heart_rate IS NOT NULL
+                    ORDER BY elapsed_time_s DESC LIMIT 1) AS hr_end
+            FROM recoveries AS rc
+            ORDER BY activity_start_time, lap_number
+        """, {'start': _date_bound(start), 'end': _date_bound(end)})
+        drops['hr_drop'] = drops['hr_start'] - drops['hr_end']
+        if not per_activity:
+            return drops
+        return (drops.groupby(['activity_id', 'activity_start_time'], as_index=False)
+                .agg(recoveries=('hr_drop', 'size'), avg_hr_drop=('hr_drop', 'mean'),
+                     avg_recovery_duration_s=('recovery_duration_s', 'mean'))
+                .round(1))
+
+
+def default_store_path(output_dir):
+    """Base de l'historique dans le dossier de résultats."""
+    return Path(output_dir) / DEFAULT_STORE_NAME
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Requêtes sur l'historique des activités")
+    parser.add_argument("store_path")
+    parser.add_argument("what", choices=("activities", "laps", "recovery-hr"))
+    parser.add_argument("--start", default=None, help="Début (inclus) de la période, ex: 2025-09-01")
+    parser.add_argument("--end", default=None, help="Fin (exclue) de la période")
+    parser.add_argument("--nature", default=None, help="Nature des laps (laps)")
+    parser.add_argument("--per-activity", action="store_true", help="Moyenne par activité (recovery-hr)")
+    args = parser.parse_args()
+
+    if not Path(args.store_path).exists():
+        print(json.dumps({"status": "error", "message": f"Base introuvable: {args.store_path}"}))
+        sys.exit(1)
+    with ActivityStore(args.store_path) as store:
+        if args.what == "activities":
+            df = store.activities(args.start, args.end)
+        elif args.what == "laps":
+            df = store.laps(args.nature, args.start, args.end)
+        else:
+            df = store.recovery_heart_rate_drop(args.start, args.end, per_activity=args.per_activity)
+    print(df.to_json(orient='records', force_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
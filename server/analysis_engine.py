@@ -0,0 +1,319 @@
+"""
+Moteur d'analyse des séances fractionnées : les POINTS 1 à 6 de analysis_script.py et
+correlations_script.py (qui l'appellent avec leurs seuils), calculés directement sur la table des
+records (DataFrame de parse_fit ou de read_records, ou dictionnaire de tableaux).
+
+La séance est segmentée une seule fois (cf. segmentation.py), chaque lap coupé en effort (jusqu'au
+record le plus proche de DISTANCE_EFFORT_M mètres) et récupération ; les métriques d'effort sont
+des réductions sur segments (reduceat), la récupération se lit aux bornes des segments. Le reste
+(allure, drifts S1 / S2, corrélations) ne porte que sur la petite table des laps.
+
+Les valeurs float32 de l'extraction sont ramenées à celles écrites dans le CSV (cf. records_io) :
+mêmes résultats que l'analyse parte de la mémoire ou d'un fichier de records.
+
+Dans l'extraction : fichier annexe "analysis" (<base>_analysis.json, cf. sidecars.py).
+La commande a lancer : python analysis_engine.py results/xxx_records.csv
+"""
+import sys
+import json
+
+import numpy as np
+import pandas as pd
+
+from segmentation import find_lap_boundaries, LAPS_PER_SERIES
+from records_io import read_records, as_csv_dtypes
+
+DISTANCE_EFFORT_M = 200
+MIN_SPEED_EFFORT_KMH = 15  # Vitesse minimale pour considérer une phase d'effort
+MIN_STEP_LENGTH = 1000  # Longueur de pas minimale pour exclure les arrêts
+# Fin de lap : première pause à au moins REST_DISTANCE_M du début, une fois TRIGGER_DISTANCE_M parcourus
+TRIGGER_DISTANCE_M = 280
+REST_DISTANCE_M = 280
+
+# Colonnes des records utilisées par l'analyse
+ANALYSIS_COLUMNS = (
+    'elapsed_time_s', 'distance', 'speed_kmh', 'heart_rate', 'step_length',
+    'cadence_step_per_min', 'vertical_ratio', 'stance_time_percent',
+)
+REQUIRED_COLUMNS = ('speed_kmh', 'heart_rate')
+# Métriques de la table des laps entre lesquelles les corrélations de Pearson sont calculées
+CORRELATED_METRICS = (
+    'Duration_s', 'Avg_Speed_kmh', 'Max_Speed_kmh', 'Max_HR_bpm', 'Avg_Cadence_step_per_min',
+    'Avg_VR', 'Avg_STP_percent', 'Pacing_Drift_percent',
+)
+DRIFT_METRICS = {
+    'Avg_Duration_s': 'Duration_s', 'Avg_Speed_kmh': 'Avg_Speed_kmh', 'Avg_Max_HR_bpm': 'Max_HR_bpm',
+    'Avg_VR': 'Avg_VR', 'Avg_STP_percent': 'Avg_STP_percent',
+}
+N_PREDICTORS = 5
+NO_LAP_MESSAGE = "Aucun segment de lap valide n'a été trouvé. Veuillez ajuster les seuils."
+
+
+def record_arrays(records, required_columns=REQUIRED_COLUMNS):
+    """
+    Colonnes de l'analyse en float64 (NaN si absentes), records sans valeur pour required_columns retirés.
+    """
+    df = records if isinstance(records, pd.DataFrame) else pd.DataFrame(records)
+    df = df.set_axis(df.columns.astype(str).str.replace('[^A-Za-z0-9_]+', '', regex=True).str.lower(), axis=1)
+    df = as_csv_dtypes(df[[col for col in ANALYSIS_COLUMNS if col in df.columns]].copy())
+
+    n = len(df)
+    arrays = {col: df[col].to_numpy(dtype=np.float64, na_value=np.nan) if col in df.columns else np.full(n, np.nan)
+              for col in ANALYSIS_COLUMNS}
+    keep = np.ones(n, dtype=bool)
+    for col in required_columns:
+        keep &= ~np.isnan(arrays[col])
+    return {col: values[keep] for col, values in arrays.items()}
+
+
+def _segment_mean_max(values, bounds):
+    """Moyenne et max (NaN ignorés) des segments [début, fin) ; bounds = [début_0, fin_0, début_1, ...]."""
+    finite = ~np.isnan(values)
+    n = np.add.reduceat(finite, bounds)[::2]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.add.reduceat(np.where(finite, values, 0.0), bounds)[::2] / n
+    return mean, np.fmax.reduceat(values, bounds)[::2]
+
+
+def split_effort_recovery(distance, boundaries):
+    """
+    Point de bascule effort / récupération de chaque lap : record le plus proche de DISTANCE_EFFORT_M
+    mètres après le début du lap (premier en cas d'égalité).
+
+    Returns:
+        np.ndarray: Position du dernier record d'effort de chaque lap.
+    """
+    cuts = np.empty(len(boundaries), dtype=np.int64)
+    for lap, (start, end) in enumerate(boundaries):
+        gap = np.abs(distance[start:end] - (distance[start] + DISTANCE_EFFORT_M))
+        cuts[lap] = start + (int(np.nanargmin(gap)) if not np.isnan(gap).all() else end - start - 1)
+    return cuts
+
+
+def _json_records(df):
+    """Lignes d'une table en dictionnaires JSON (NaN -> None)."""
+    return [{key: (None if isinstance(value, float) and value != value else value) for key, value in row.items()}
+            for row in df.to_dict(orient='records')]
+
+
+def _json_number(value):
+    return None if value is None or value != value else float(value)
+
+
+def segment_session(arrays, trigger_distance_m=TRIGGER_DISTANCE_M, rest_distance_m=REST_DISTANCE_M,
+                    min_step_length=MIN_STEP_LENGTH):
+    """
+    POINT 1 : segmentation unique de la séance (pauses, bornes des laps, bascule effort / récupération).
+
+    Args:
+        arrays (dict): Colonnes de record_arrays.
+        trigger_distance_m, rest_distance_m (float): Seuils de fin de lap (cf. segmentation.find_lap_boundaries).
+        min_step_length (float | None): Un pas plus court marque aussi une pause (None : vitesse seule,
+        comme correlations_script.py).
+
+    Returns:
+        tuple: (bornes (début, fin exclue) de chaque lap, dernier record d'effort de chaque lap) ; aucune
+        borne si aucun lap n'est trouvé.
+    """
+    is_resting = arrays['speed_kmh'] < MIN_SPEED_EFFORT_KMH
+    if min_step_length is not None:
+        is_resting |= arrays['step_length'] < min_step_length
+    boundaries = find_lap_boundaries(arrays['distance'], is_resting, trigger_distance_m, rest_distance_m)
+    return boundaries, split_effort_recovery(arrays['distance'], boundaries)
+
+
+def analyse_repetitions(arrays, boundaries, cuts):
+    """POINT 2 : métriques de chaque effort (table des laps)."""
+    starts = np.array([start for start, _ in boundaries], dtype=np.int64)
+    bounds = np.column_stack((starts, cuts + 1)).ravel()
+    elapsed = arrays['elapsed_time_s']
+    lap_numbers = np.arange(1, len(boundaries) + 1)
+
+    avg_speed, max_speed = _segment_mean_max(arrays['speed_kmh'], bounds)
+    _, max_hr = _segment_mean_max(arrays['heart_rate'], bounds)
+    return pd.DataFrame({
+        'lap_number': lap_numbers,
+        'series': np.where(lap_numbers <= LAPS_PER_SERIES, 1, 2),
+        'Duration_s': elapsed[cuts] - elapsed[starts],
+        'Avg_Speed_kmh': avg_speed,
+        'Max_Speed_kmh': max_speed,
+        'Max_HR_bpm': max_hr,
+        'Avg_Cadence_step_per_min': _segment_mean_max(arrays['cadence_step_per_min'], bounds)[0],
+        'Avg_VR': _segment_mean_max(arrays['vertical_ratio'], bounds)[0],
+        'Avg_STP_percent': _segment_mean_max(arrays['stance_time_percent'], bounds)[0],
+    }).round({'Duration_s': 1, 'Avg_Speed_kmh': 1, 'Max_Speed_kmh': 1,
+              'Avg_Cadence_step_per_min': 0, 'Avg_VR': 2, 'Avg_STP_percent': 1})
+
+
+def analyse_pacing(lap_metrics):
+    """
+    POINT 3 : style d'allure de chaque lap et synthèse par style.
+
+    Returns:
+        tuple: (table des laps complétée de 'Pacing_Drift_percent' et 'Pacing_Style', synthèse)
+    """
+    lap_metrics = lap_metrics.copy()
+    # Pacing Drift : (vitesse max - vitesse moyenne) / vitesse moyenne ; élevé = départ rapide puis ralentissement
+    lap_metrics['Pacing_Drift_percent'] = \
+        (lap_metrics['Max_Speed_kmh'] - lap_metrics['Avg_Speed_kmh']) / lap_metrics['Avg_Speed_kmh'] * 100
+    lap_metrics['Pacing_Style'] = np.where(
+        lap_metrics['Pacing_Drift_percent'] > lap_metrics['Pacing_Drift_percent'].median(),
+        'Rapid_Start', 'Progressive_Start')
+    pacing_summary = lap_metrics.groupby('Pacing_Style').agg(
+        Nb_Laps=('lap_number', 'count'),
+        Avg_Duration_s=('Duration_s', 'mean'),
+        Avg_Max_HR=('Max_HR_bpm', 'mean'),
+        Avg_VR=('Avg_VR', 'mean')
+    ).round(2).reset_index()
+    return lap_metrics, pacing_summary
+
+
+def analyse_recoveries(arrays, boundaries, cuts):
+    """POINT 4 : baisse de la FC pendant chaque récupération (au moins 2 records), et moyenne par série."""
+    heart_rate = arrays['heart_rate']
+    elapsed = arrays['elapsed_time_s']
+    rows = []
+    for lap, ((_, end), cut) in enumerate(zip(boundaries, cuts), start=1):
+        first, last = cut + 1, end - 1
+        if last - first < 1:
+            continue
+        hr_drop = heart_rate[first] - heart_rate[last]
+        duration = elapsed[last] - elapsed[first]
+        rows.append({
+            'lap_number': lap,
+            'series': 1 if lap <= LAPS_PER_SERIES else 2,
+            'HR_Start_Recovery_bpm': heart_rate[first],
+            'HR_End_Recovery_bpm': heart_rate[last],
+            'HR_Drop_bpm': hr_drop,
+            'Recovery_Rate_bpm_s': hr_drop / duration if duration > 0 else 0.0,
+        })
+
+    recoveries = pd.DataFrame(rows, columns=['lap_number', 'series', 'HR_Start_Recovery_bpm', 'HR_End_Recovery_bpm',
+                                             'HR_Drop_bpm', 'Recovery_Rate_bpm_s']).round(2)
+    series_summary = recoveries.groupby('series').agg(
+        Avg_HR_Start=('HR_Start_Recovery_bpm', 'mean'),
+        Avg_HR_End=('HR_End_Recovery_bpm', 'mean'),
+        Avg_Recovery_Rate=('Recovery_Rate_bpm_s', 'mean')
+    ).round(2).reset_index()
+    return recoveries, series_summary
+
+
+def analyse_drifts(lap_metrics):
+    """
+    POINT 5 : moyennes de la série 1 et de la série 2, écart et écart relatif (%).
+
+    Returns:
+        pd.DataFrame: Une ligne par métrique de DRIFT_METRICS ; colonnes S1_Avg, S2_Avg, Drift_Change, Drift_Percent.
+    """
+    means = lap_metrics.groupby('series')[list(DRIFT_METRICS.values())].mean().reindex([1, 2])
+    drifts = pd.DataFrame({'S1_Avg': means.loc[1].to_numpy(), 'S2_Avg': means.loc[2].to_numpy()},
+                          index=list(DRIFT_METRICS))
+    drifts['Drift_Change'] = drifts['S2_Avg'] - drifts['S1_Avg']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        drifts['Drift_Percent'] = drifts['Drift_Change'].to_numpy() / drifts['S1_Avg'].to_numpy() * 100
+    return drifts.round(3)
+
+
+def analyse_correlations(lap_metrics):
+    """
+    POINT 6 : matrice de corrélation de Pearson entre les métriques des laps (laps complets, métriques
+    absentes des records ignorées), corrélations clés et, pour la durée, la vitesse moyenne et la FC max,
+    les métriques les plus corrélées.
+
+    Returns:
+        tuple: (matrice, corrélations clés, métriques les plus corrélées : nom -> pd.Series)
+    """
+    metrics = lap_metrics[list(CORRELATED_METRICS)].dropna(axis=1, how='all').dropna()
+    matrix = metrics.corr().reindex(index=list(CORRELATED_METRICS), columns=list(CORRELATED_METRICS)).round(3)
+
+    def predictors(target, ascending):
+        return matrix[target].drop(target).dropna().sort_values(ascending=ascending).head(N_PREDICTORS)
+
+    key_correlations = {
+        # Performance / économie (négative : meilleure économie à vitesse égale)
+        "Speed_vs_VR": _json_number(matrix.loc['Avg_Speed_kmh', 'Avg_VR']),
+        # Performance / coût cardiaque
+        "Speed_vs_MaxHR": _json_number(matrix.loc['Avg_Speed_kmh', 'Max_HR_bpm']),
+        # Économie / fatigue
+        "VR_vs_MaxHR": _json_number(matrix.loc['Avg_VR', 'Max_HR_bpm']),
+    }
+    # Négatives : ce qui fait baisser le temps ; positives : ce qui fait monter la vitesse / la FC
+    best_correlates = {
+        "Duration_s_Best_Predictors": predictors('Duration_s', True),
+        "Avg_Speed_kmh_Best_Predictors": predictors('Avg_Speed_kmh', False),
+        "Max_HR_bpm_Best_Correlates": predictors('Max_HR_bpm', False),
+    }
+    return matrix, key_correlations, best_correlates
+
+
+def analyse_session(records, trigger_distance_m=TRIGGER_DISTANCE_M, rest_distance_m=REST_DISTANCE_M,
+                    min_step_length=MIN_STEP_LENGTH, required_columns=REQUIRED_COLUMNS):
+    """
+    Analyse complète d'une séance fractionnée (cf. docstring du module), en JSON.
+
+    Args:
+        records (pd.DataFrame | dict): Records de la séance, dans l'ordre chronologique.
+        trigger_distance_m, rest_distance_m, min_step_length: Cf. segment_session.
+        required_columns (tuple): Records ignorés s'il leur manque une de ces valeurs.
+
+    Returns:
+        dict: {"parameters", "n_laps", "laps", "pacing", "recovery": {"laps", "series"}, "drifts",
+        "correlations"} ; n_laps = 0 (et "message") si aucun lap n'est trouvé.
+    """
+    arrays = record_arrays(records, required_columns)
+    analysis = {"parameters": {
+        "trigger_distance_m": trigger_distance_m, "rest_distance_m": rest_distance_m,
+        "min_step_length": min_step_length, "effort_distance_m": DISTANCE_EFFORT_M,
+        "min_speed_effort_kmh": MIN_SPEED_EFFORT_KMH,
+    }}
+
+    # 1. Segmentation
+    boundaries, cuts = segment_session(arrays, trigger_distance_m, rest_distance_m, min_step_length)
+    analysis["n_laps"] = len(boundaries)
+    if not boundaries:
+        analysis["message"] = NO_LAP_MESSAGE
+        return analysis
+
+    # 2-3. Performance par répétition et stratégie d'allure
+    lap_metrics, pacing_summary = analyse_pacing(analyse_repetitions(arrays, boundaries, cuts))
+    # 4. Qualité de la récupération
+    recoveries, recovery_summary = analyse_recoveries(arrays, boundaries, cuts)
+    # 5. Drifts globaux (S1 vs S2)
+    drifts = analyse_drifts(lap_metrics)
+    # 6. Corrélations
+    matrix, key_correlations, best_correlates = analyse_correlations(lap_metrics)
+
+    analysis.update({
+        "laps": _json_records(lap_metrics),
+        "pacing": _json_records(pacing_summary),
+        "recovery": {"laps": _json_records(recoveries), "series": _json_records(recovery_summary)},
+        "drifts": {name: {col: _json_number(value) for col, value in row.items()}
+                   for name, row in drifts.to_dict(orient='index').items()},
+        "correlations": {
+            "matrix": {row: {col: _json_number(matrix.loc[row, col]) for col in matrix.columns}
+                       for row in matrix.index},
+            "key": key_correlations,
+            **{name: {col: float(value) for col, value in values.items()}
+               for name, values in best_correlates.items()},
+        },
+    })
+    return analysis
+
+
+def write_analysis(df, path):
+    """Écrit l'analyse de la séance (JSON, cf. sidecars.py)."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(analyse_session(df), f, separators=(',', ':'))
+    return path
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print(json.dumps({"status": "error", "message": "Usage: python analysis_engine.py path/to/xxx_records.csv"}))
+        sys.exit(1)
+    try:
+        session = analyse_session(read_records(sys.argv[1], columns=list(ANALYSIS_COLUMNS)))
+    except FileNotFoundError as e:
+        print(json.dumps({"status": "error", "message": str(e)}))
+        sys.exit(1)
+    print(json.dumps({"status": "success", **session}))
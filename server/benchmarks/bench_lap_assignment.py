@@ -0,0 +1,115 @@
+"""
+Benchmark de non-régression de l'assignation des laps (add_lap_info).
+
+Compare l'implémentation actuelle (recherche dans les débuts de laps triés) à
+l'ancienne implémentation (un masque booléen par lap + merge) sur une séance
+synthétique de plusieurs centaines de laps, vérifie que les résultats sont
+identiques et affiche les temps.
+
+La commande a lancer : python server/benchmarks/bench_lap_assignment.py [--laps 500] [--lap-duration 60]
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from extract_fit_file import add_lap_info, classify_lap_nature_by_speed, MS_TO_KMH  # noqa: E402
+
+
+def reference_add_lap_info(lap_messages, df):
+    """Ancienne implémentation O(laps x records) de add_lap_info (référence)."""
+    laps = [dict(lap) for lap in lap_messages]
+    laps_sorted = sorted([lap for lap in laps if 'start_time' in lap and lap['start_time']],
+                         key=lambda x: x['start_time'])
+
+    df['lap_number'] = 0
+    for lap_num, lap in enumerate(laps_sorted, 1):
+        lap['lap_number'] = lap_num
+        lap_start = pd.to_datetime(lap['start_time'])
+
+        if lap_num < len(laps_sorted):
+            next_lap_start = pd.to_datetime(laps_sorted[lap_num]['start_time'])
+        else:
+            next_lap_start = df['timestamp'].max() + timedelta(seconds=1)
+
+        mask = (df['timestamp'] >= lap_start) & (df['timestamp'] < next_lap_start)
+        df.loc[mask, 'lap_number'] = lap_num
+
+    df.loc[df['lap_number'] == 0, 'lap_number'] = len(laps_sorted)
+
+    df_lap_summary = pd.DataFrame(laps_sorted)
+    df_lap_summary['avg_speed_kmh'] = pd.to_numeric(df_lap_summary['avg_speed'], errors='coerce')
+    df_lap_summary['avg_speed_kmh'] = np.round(df_lap_summary['avg_speed_kmh'] * MS_TO_KMH, 2)
+    df_lap_summary = classify_lap_nature_by_speed(df_lap_summary)
+
+    df_nature = df_lap_summary[['lap_number', 'lap_nature']].copy()
+    df = df.drop(columns=['lap_nature'], errors='ignore')
+    df = df.merge(df_nature, on='lap_number', how='left')
+    df['lap_nature'] = df['lap_nature'].fillna('Unknown')
+    return df
+
+
+def build_session(n_laps, lap_duration_s, seed=0):
+    """
+    Séance fractionnée synthétique à 1 Hz : alternance effort / récupération.
+    Les premiers records précèdent le premier lap (cas de repli sur le dernier lap).
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime(2025, 1, 1, 8, 0, 0)
+    lap_messages = []
+    for lap_index in range(n_laps):
+        speed = 5.2 if lap_index % 2 else 2.0  # m/s
+        lap_messages.append({
+            'start_time': start + timedelta(seconds=lap_index * lap_duration_s),
+            'avg_speed': speed + rng.normal(0, 0.1),
+            'total_timer_time': float(lap_duration_s),
+        })
+
+    n_records = n_laps * lap_duration_s + 30
+    timestamps = pd.date_range(start - timedelta(seconds=30), periods=n_records, freq='s')
+    df = pd.DataFrame({
+        'timestamp': timestamps,
+        'distance': np.cumsum(rng.uniform(2.0, 5.0, n_records)),
+        'heart_rate': rng.integers(110, 190, n_records),
+    })
+    return lap_messages, df
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de l'assignation des laps (add_lap_info)")
+    parser.add_argument("--laps", type=int, default=500)
+    parser.add_argument("--lap-duration", type=int, default=60, help="Durée de chaque lap en secondes (1 record/s)")
+    args = parser.parse_args()
+
+    lap_messages, df = build_session(args.laps, args.lap_duration)
+
+    expected, reference_s = timed(reference_add_lap_info, lap_messages, df.copy())
+    result, current_s = timed(add_lap_info, lap_messages, df.copy())
+
+    # Même contenu ; l'implémentation actuelle renvoie les types compacts (cf. compact_schema)
+    pd.testing.assert_frame_equal(result, expected.astype({col: result[col].dtype for col in ('lap_number', 'lap_nature')}))
+
+    print(json.dumps({
+        "laps": args.laps,
+        "records": len(df),
+        "reference_s": round(reference_s, 4),
+        "current_s": round(current_s, 4),
+        "speedup": round(reference_s / current_s, 1) if current_s else None,
+        "identical": True,
+    }, indent=4))
+
+
+if __name__ == "__main__":
+    main()
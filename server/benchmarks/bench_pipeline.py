@@ -0,0 +1,394 @@
+"""
+Suite de benchmarks des pipelines d'extraction (server/) et d'analyse (src/utils/).
+
+Fonctions mesurées :
+    - extraction : décodage FIT (fitparse, numpy), parse_fit, add_lap_info, export_lap_csv,
+      parse_fit_records et extract_activity_summary (V3)
+    - analyse : load_and_preprocess_data et segment_activity de analysis_script.py et correlations_script.py,
+      puis les fonctions analyse_* de analysis_engine.py avec la segmentation de chaque script
+
+Jeux de données :
+    - fichiers FIT de référence (src/utils/20355680594_ACTIVITY.fit, server/uploads/*.fit, dédoublonnés
+      par contenu) et CSV de records (server/results/*_records.csv, public/activity_data.csv)
+    - activités synthétiques allongées (1 h -> 30 h, 10 -> 500 laps) : les records de l'activité de
+      référence sont répétés à 1 Hz, la distance étant recalculée à partir de la vitesse
+
+Pour chaque cas : temps (meilleur de --repeat exécutions), débit en records/s et pic mémoire (tracemalloc,
+exécution séparée). Une fonction qui échoue sur un jeu de données (colonnes manquantes...) est rapportée
+en erreur sans interrompre la suite.
+
+--save-baseline enregistre les résultats comme référence ; les exécutions suivantes s'y comparent et
+signalent les cas plus lents (ou plus gourmands en mémoire) que la référence au-delà de --tolerance
+(code de sortie 1).
+
+La commande a lancer : python server/benchmarks/bench_pipeline.py [--scales 1:10,5:50,10:100,30:500] [--repeat 3]
+    [--cases parse_fit,segment_activity] [--skip-fixtures] [--no-memory] [--save-baseline] [--baseline fichier.json]
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import platform
+import tempfile
+import contextlib
+import tracemalloc
+from pathlib import Path
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+REPO_DIR = SERVER_DIR.parent
+UTILS_DIR = REPO_DIR / "src" / "utils"
+sys.path.insert(0, str(SERVER_DIR))
+sys.path.insert(0, str(UTILS_DIR))
+
+import extract_fit_file  # noqa: E402
+import extract_fit_file_for_V3  # noqa: E402
+import analysis_script  # noqa: E402
+import correlations_script  # noqa: E402
+import analysis_engine  # noqa: E402
+from fit_messages import load_fit_messages, DECODER_ENGINES  # noqa: E402
+
+DEFAULT_BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+# Activité de référence (dynamiques de course présentes) servant de modèle aux activités synthétiques
+TEMPLATE_FIT_PATH = UTILS_DIR / "20355680594_ACTIVITY.fit"
+
+# Durée (h) : nombre de laps des activités synthétiques
+DEFAULT_SCALES = "1:10,5:50,10:100,30:500"
+
+# Messages décodés pour les cas d'extraction (records et laps pour extract_fit_file, session pour V3)
+BENCH_MESSAGES = ('record', 'lap', 'session')
+
+# Écart relatif toléré par rapport à la référence avant de signaler une régression
+DEFAULT_TOLERANCE = 0.25
+
+ANALYSIS_MODULES = {'analysis': analysis_script, 'correlations': correlations_script}
+
+
+# --- Jeux de données ---
+
+def fixture_fit_files():
+    """Fichiers FIT de référence, dédoublonnés par contenu (les uploads sont souvent identiques)."""
+    candidates = [TEMPLATE_FIT_PATH] + sorted((SERVER_DIR / "uploads").glob("*.fit"))
+    files, seen = [], set()
+    for path in candidates:
+        if not path.exists():
+            continue
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        if digest not in seen:
+            seen.add(digest)
+            files.append(path)
+    return files
+
+
+def fixture_records_csvs():
+    """CSV de records de référence (sorties d'extraction versionnées)."""
+    csvs = sorted((SERVER_DIR / "results").glob("*_records.csv"))
+    public_csv = REPO_DIR / "public" / "activity_data.csv"
+    if public_csv.exists():
+        csvs.append(public_csv)
+    return csvs
+
+
+def parse_scales(value):
+    """ "1:10,30:500" -> [(1.0, 10), (30.0, 500)] (durée en heures, nombre de laps)."""
+    scales = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        hours, laps = item.split(':')
+        scales.append((float(hours), int(laps)))
+    return scales
+
+
+def synthetic_fit_messages(template, hours, n_laps):
+    """
+    Activité synthétique de `hours` heures à 1 Hz découpée en n_laps laps réguliers, construite
+    en répétant les records (et les laps) de l'activité modèle.
+
+    Args:
+        template (dict): Messages décodés de l'activité modèle (record, lap, session).
+        hours (float): Durée de l'activité.
+        n_laps (int): Nombre de laps.
+
+    Returns:
+        dict: Messages au format de fit_messages.collect_fit_messages.
+    """
+    records = template['record']
+    n_records = int(hours * 3600)
+    start = pd.Timestamp(records[0]['timestamp']).to_pydatetime()
+
+    # Distance cumulée recalculée à partir de la vitesse (un record par seconde)
+    speeds = np.array([record.get('enhanced_speed') or record.get('speed') or 0.0 for record in records], dtype=np.float64)
+    distances = np.round(np.cumsum(np.resize(speeds, n_records)), 2)
+
+    rows = []
+    for i in range(n_records):
+        row = dict(records[i % len(records)])
+        row['timestamp'] = start + timedelta(seconds=i)
+        row['distance'] = float(distances[i])
+        rows.append(row)
+
+    lap_duration_s = n_records / n_laps
+    laps = []
+    for lap_index in range(n_laps):
+        first = int(lap_index * lap_duration_s)
+        last = min(int((lap_index + 1) * lap_duration_s), n_records) - 1
+        lap = dict(template['lap'][lap_index % len(template['lap'])])
+        lap.update(start_time=start + timedelta(seconds=first), timestamp=start + timedelta(seconds=last),
+                   total_timer_time=float(last - first + 1), total_elapsed_time=float(last - first + 1),
+                   total_distance=float(distances[last] - (distances[first - 1] if first else 0.0)))
+        laps.append(lap)
+
+    session = dict(template['session'][-1]) if template['session'] else {}
+    session.update(total_elapsed_time=float(n_records), total_timer_time=float(n_records),
+                   total_distance=float(distances[-1]), timestamp=start + timedelta(seconds=n_records - 1))
+    return {'record': rows, 'lap': laps, 'session': [session]}
+
+
+# --- Cas mesurés ---
+
+def extraction_cases(fit_messages, tmp_dir, fit_file_path=None):
+    """
+    Cas d'extraction : (nom, préparation des arguments, fonction). La préparation n'est pas chronométrée.
+    Le décodage n'est mesuré que pour les fichiers FIT réels. Renvoie aussi la table des records.
+    """
+    records_df = extract_fit_file.parse_fit(fit_messages)
+    cases = []
+    if fit_file_path is not None:
+        for engine in DECODER_ENGINES:
+            cases.append((f"decode_{engine}", lambda engine=engine: (fit_file_path,), lambda path, engine=engine: load_fit_messages(
+                path, message_names=extract_fit_file.EXTRACTED_MESSAGES, engine=engine,
+                field_selection=extract_fit_file.FIT_FIELD_SELECTION)))
+    cases += [
+        ("parse_fit", lambda: (fit_messages,), extract_fit_file.parse_fit),
+        ("add_lap_info", lambda: (fit_messages['lap'], records_df.copy()), extract_fit_file.add_lap_info),
+        ("export_lap_csv", lambda: (fit_messages['lap'], Path(tmp_dir) / "laps.csv"), extract_fit_file.export_lap_csv),
+        ("parse_fit_records", lambda: (fit_messages,), extract_fit_file_for_V3.parse_fit_records),
+        ("extract_activity_summary", lambda: (fit_messages,), extract_fit_file_for_V3.extract_activity_summary),
+    ]
+    return cases, records_df
+
+
+def _analysis_steps(module, records_csv_path):
+    """
+    Étapes de run_full_analysis d'un script d'analyse, calculées une seule fois à la demande :
+    step('arrays'), step('segments'), step('lap_metrics'), step('lap_metrics_with_pacing').
+    """
+    steps = {}
+
+    def step(name):
+        if name not in steps:
+            if name == 'arrays':
+                steps[name] = module.load_and_preprocess_data(records_csv_path)
+                if steps[name] is None:
+                    raise RuntimeError("données non chargées (fichier ou colonnes manquants)")
+            elif name == 'segments':
+                steps[name] = module.segment_activity(step('arrays'))
+                if not steps[name][0]:
+                    raise RuntimeError("aucun lap trouvé")
+            elif name == 'lap_metrics':
+                steps[name] = analysis_engine.analyse_repetitions(step('arrays'), *step('segments'))
+            elif name == 'lap_metrics_with_pacing':
+                steps[name] = analysis_engine.analyse_pacing(step('lap_metrics'))[0]
+        return steps[name]
+
+    return step
+
+
+def analysis_cases(records_csv_path):
+    """
+    Cas d'analyse de chaque script, enchaînés comme dans run_full_analysis : les entrées d'un cas sont
+    les sorties (non chronométrées) des étapes précédentes. Si une étape précédente échoue, le cas
+    est rapporté avec son erreur.
+    """
+    cases = []
+    for prefix, module in ANALYSIS_MODULES.items():
+        step = _analysis_steps(module, records_csv_path)
+        cases += [
+            (f"{prefix}.load_and_preprocess_data", lambda: (records_csv_path,), module.load_and_preprocess_data),
+            (f"{prefix}.segment_activity", lambda step=step: (step('arrays'),), module.segment_activity),
+            (f"{prefix}.analyse_repetitions", lambda step=step: (step('arrays'), *step('segments')),
+             analysis_engine.analyse_repetitions),
+            (f"{prefix}.analyse_pacing", lambda step=step: (step('lap_metrics'),), analysis_engine.analyse_pacing),
+            (f"{prefix}.analyse_recoveries", lambda step=step: (step('arrays'), *step('segments')),
+             analysis_engine.analyse_recoveries),
+            (f"{prefix}.analyse_drifts", lambda step=step: (step('lap_metrics_with_pacing'),),
+             analysis_engine.analyse_drifts),
+            (f"{prefix}.analyse_correlations", lambda step=step: (step('lap_metrics_with_pacing'),),
+             analysis_engine.analyse_correlations),
+        ]
+    return cases
+
+
+# --- Mesures ---
+
+class SetupError(Exception):
+    """Échec de la préparation d'un cas (étape précédente en erreur) : le cas n'est pas mesuré."""
+
+
+def measure(setup, func, repeat, with_memory):
+    """
+    Meilleur temps sur `repeat` exécutions (préparation exclue) puis, si demandé, pic mémoire
+    alloué pendant une exécution supplémentaire sous tracemalloc.
+    """
+    # Les print() des scripts ne doivent pas polluer le JSON de résultats sur stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            setup()
+        except Exception as e:
+            raise SetupError(f"{type(e).__name__}: {e}")
+
+        best = None
+        for _ in range(repeat):
+            args = setup()
+            start = time.perf_counter()
+            func(*args)
+            duration = time.perf_counter() - start
+            best = duration if best is None else min(best, duration)
+
+        peak_mb = None
+        if with_memory:
+            args = setup()
+            tracemalloc.start()
+            try:
+                func(*args)
+                peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            finally:
+                tracemalloc.stop()
+    return best, peak_mb
+
+
+def run_cases(dataset, n_records, cases, args, results):
+    for name, setup, func in cases:
+        if args.cases and name not in args.cases and name.split('.')[-1] not in args.cases:
+            continue
+        entry = {"dataset": dataset, "case": name, "records": n_records}
+        try:
+            wall_s, peak_mb = measure(setup, func, args.repeat, not args.no_memory)
+        except SetupError as e:
+            entry["skipped"] = f"étape précédente en erreur ({e})"
+        except Exception as e:
+            entry["error"] = f"{type(e).__name__}: {e}"
+        else:
+            entry["wall_s"] = round(wall_s, 4)
+            entry["records_per_s"] = round(n_records / wall_s) if wall_s > 0 else None
+            if peak_mb is not None:
+                entry["peak_mb"] = round(peak_mb, 2)
+        print(f"{dataset:>40} {name:<50} " + (entry.get("error") or entry.get("skipped") or
+              f"{entry['wall_s']:.4f} s  {entry['records_per_s'] or 0:>10} rec/s  {entry.get('peak_mb', '-')} MB"),
+              file=sys.stderr)
+        results.append(entry)
+
+
+def run_datasets(args, tmp_dir, results):
+    """Exécute les cas sur les fichiers de référence puis sur les activités synthétiques."""
+    if not args.skip_fixtures:
+        for fit_file_path in fixture_fit_files():
+            fit_messages = load_fit_messages(fit_file_path, message_names=BENCH_MESSAGES)
+            cases, _ = extraction_cases(fit_messages, tmp_dir, fit_file_path)
+            run_cases(str(fit_file_path.relative_to(REPO_DIR)), len(fit_messages['record']), cases, args, results)
+        for csv_path in fixture_records_csvs():
+            n_records = sum(1 for _ in open(csv_path)) - 1
+            run_cases(str(csv_path.relative_to(REPO_DIR)), n_records, analysis_cases(csv_path), args, results)
+
+    scales = parse_scales(args.scales)
+    if not scales:
+        return
+    template = load_fit_messages(TEMPLATE_FIT_PATH, message_names=BENCH_MESSAGES)
+    for hours, n_laps in scales:
+        dataset = f"synthetic_{hours:g}h_{n_laps}laps"
+        fit_messages = synthetic_fit_messages(template, hours, n_laps)
+        cases, records_df = extraction_cases(fit_messages, tmp_dir)
+        run_cases(dataset, len(fit_messages['record']), cases, args, results)
+
+        # Les analyses lisent le CSV de records produit par l'extraction
+        csv_path = Path(tmp_dir) / f"{dataset}_records.csv"
+        records_df.to_csv(csv_path, index=False)
+        run_cases(dataset, len(records_df), analysis_cases(csv_path), args, results)
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Compare chaque cas à la référence (même jeu de données, même cas).
+
+    Returns:
+        list: Cas comparés, avec les ratios temps / pic mémoire et l'indicateur de régression.
+    """
+    reference = {(entry["dataset"], entry["case"]): entry for entry in baseline.get("results", [])}
+    comparisons = []
+    for entry in results:
+        ref = reference.get((entry["dataset"], entry["case"]))
+        if ref is None or "wall_s" not in ref or "wall_s" not in entry:
+            continue
+        comparison = {"dataset": entry["dataset"], "case": entry["case"],
+                      "wall_ratio": round(entry["wall_s"] / ref["wall_s"], 3) if ref["wall_s"] else None}
+        if entry.get("peak_mb") is not None and ref.get("peak_mb"):
+            comparison["peak_ratio"] = round(entry["peak_mb"] / ref["peak_mb"], 3)
+        comparison["regression"] = any(comparison.get(ratio) is not None and comparison[ratio] > 1 + tolerance
+                                       for ratio in ("wall_ratio", "peak_ratio"))
+        comparisons.append(comparison)
+    return comparisons
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks des pipelines d'extraction et d'analyse")
+    parser.add_argument("--scales", default=DEFAULT_SCALES,
+                        help="Activités synthétiques 'heures:laps' séparées par des virgules ('' pour aucune)")
+    parser.add_argument("--repeat", type=int, default=3, help="Nombre d'exécutions chronométrées par cas")
+    parser.add_argument("--cases", default="", help="Cas à exécuter, séparés par des virgules (tous par défaut)")
+    parser.add_argument("--skip-fixtures", action="store_true", help="Ne pas mesurer les fichiers de référence")
+    parser.add_argument("--no-memory", action="store_true", help="Ne pas mesurer le pic mémoire")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE_PATH), help="Fichier JSON de référence")
+    parser.add_argument("--save-baseline", action="store_true", help="Enregistrer les résultats comme référence")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Écart relatif toléré avant de signaler une régression (0.25 = +25%%)")
+    args = parser.parse_args()
+    args.cases = {case.strip() for case in args.cases.split(',') if case.strip()}
+    if args.repeat < 1:
+        parser.error("--repeat doit être >= 1")
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as tmp_dir:
+        run_datasets(args, tmp_dir, results)
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+    baseline_path = Path(args.baseline)
+    regressions = []
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump(report, f, indent=4)
+        report["baseline_saved"] = str(baseline_path)
+    elif baseline_path.exists():
+        with open(baseline_path) as f:
+            comparisons = compare_with_baseline(results, json.load(f), args.tolerance)
+        regressions = [comparison for comparison in comparisons if comparison["regression"]]
+        report["baseline"] = str(baseline_path)
+        report["comparisons"] = comparisons
+        report["regressions"] = len(regressions)
+
+    print(json.dumps(report, indent=4))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark de non-régression du formatage des durées (time_format).
+
+Compare les versions vectorisées (format_seconds_column_min_sec, format_seconds_column_hms)
+aux fonctions ligne par ligne appliquées avec .apply, sur une colonne de temps de
+déplacement synthétique (1 record/s, arrondi à 0.1 s, quelques valeurs manquantes),
+vérifie que les résultats sont identiques et affiche les temps.
+
+La commande a lancer : python server/benchmarks/bench_time_format.py [--records 30000] [--repeat 5]
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from time_format import (format_seconds_to_min_sec, format_seconds_to_hms,  # noqa: E402
+                         format_seconds_column_min_sec, format_seconds_column_hms)
+
+
+def build_moving_time(n_records, seed=0):
+    """Temps de déplacement à 1 Hz avec quelques pauses et 0.1 % de valeurs manquantes."""
+    rng = np.random.default_rng(seed)
+    steps = np.where(rng.random(n_records) < 0.001, rng.uniform(10, 120, n_records), 1.0)
+    moving_time = np.round(np.cumsum(steps) - steps[0], 1)
+    moving_time[rng.random(n_records) < 0.001] = np.nan
+    return pd.Series(moving_time, name='moving_elapsed_time_s')
+
+
+def best_time(func, *args, repeat=5):
+    """Meilleur temps sur repeat exécutions, et le résultat de la dernière."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du formatage des durées (MM:SS, H:MM:SS)")
+    parser.add_argument("--records", type=int, default=30000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    moving_time = build_moving_time(args.records)
+
+    report = {"records": args.records, "duration_h": round(float(np.nanmax(moving_time)) / 3600, 2)}
+    for name, scalar_formatter, column_formatter in (
+            ("min_sec", format_seconds_to_min_sec, format_seconds_column_min_sec),
+            ("hms", format_seconds_to_hms, format_seconds_column_hms)):
+        expected, reference_s = best_time(moving_time.apply, scalar_formatter, repeat=args.repeat)
+        result, current_s = best_time(column_formatter, moving_time, repeat=args.repeat)
+
+        pd.testing.assert_series_equal(result, expected, check_names=False)
+
+        report[name] = {
+            "apply_s": round(reference_s, 4),
+            "vectorized_s": round(current_s, 4),
+            "speedup": round(reference_s / current_s, 1) if current_s else None,
+            "identical": True,
+        }
+
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Rapport mémoire du schéma compact des tables de records et de laps (compact_schema).
+
+Pour chaque fichier FIT de référence (cf. bench_pipeline.fixture_fit_files), construit les tables
+de parse_fit, build_lap_table et parse_fit_records (V3), puis compare, colonne par colonne, leur
+taille en mémoire (memory_usage(deep=True)) à celle des mêmes tables avec les types inférés par
+pandas (ceux d'avant le schéma compact : int64/float64, chaînes).
+
+La commande a lancer : python server/benchmarks/report_dtype_memory.py [--engine fitparse|numpy] [fichier.fit ...]
+"""
+import sys
+import json
+import argparse
+import contextlib
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import extract_fit_file  # noqa: E402
+import extract_fit_file_for_V3  # noqa: E402
+from fit_messages import load_fit_messages, DECODER_ENGINES  # noqa: E402
+from bench_pipeline import fixture_fit_files  # noqa: E402
+
+REPORT_MESSAGES = ('record', 'lap', 'session')
+
+
+def inferred_dtypes(df):
+    """Même table avec les types inférés par pandas (entiers nullables -> int64 ou float64, float32 -> float64...)."""
+    df = df.copy()
+    for col in df.columns:
+        dtype = df[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(dtype.categories.dtype)
+        elif isinstance(dtype, pd.api.extensions.ExtensionDtype) and dtype.kind in 'iu':
+            df[col] = df[col].astype('float64') if df[col].hasnans else df[col].astype('int64')
+        elif dtype.kind in 'iu':
+            df[col] = df[col].astype('int64')
+        elif dtype.kind == 'f':
+            df[col] = df[col].astype('float64')
+    return df
+
+
+def table_report(df):
+    """Taille de chaque colonne avant / après le schéma compact, et total."""
+    before_df = inferred_dtypes(df)
+    before = before_df.memory_usage(index=False, deep=True)
+    after = df.memory_usage(index=False, deep=True)
+    columns = {}
+    for col in df.columns:
+        columns[col] = {
+            "dtype_before": str(before_df[col].dtype),
+            "dtype_after": str(df[col].dtype),
+            "bytes_before": int(before[col]),
+            "bytes_after": int(after[col]),
+            "saved_pct": round(100 * (1 - after[col] / before[col]), 1) if before[col] else 0.0,
+        }
+    return {
+        "rows": len(df),
+        "bytes_before": int(before.sum()),
+        "bytes_after": int(after.sum()),
+        "saved_pct": round(100 * (1 - after.sum() / before.sum()), 1) if before.sum() else 0.0,
+        "columns": columns,
+    }
+
+
+def fit_file_report(fit_file_path, engine):
+    fit_messages = load_fit_messages(fit_file_path, message_names=REPORT_MESSAGES, engine=engine)
+    # Les print() des extracteurs ne doivent pas se mêler au rapport JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        tables = {
+            "records": extract_fit_file.parse_fit(fit_messages),
+            "laps": extract_fit_file.build_lap_table(fit_messages['lap']),
+            "records_v3": extract_fit_file_for_V3.parse_fit_records(fit_messages),
+        }
+    return {name: table_report(df) for name, df in tables.items() if df is not None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rapport mémoire du schéma compact des records et des laps")
+    parser.add_argument("fit_files", nargs="*", help="Fichiers FIT (par défaut : fichiers de référence)")
+    parser.add_argument("--engine", choices=DECODER_ENGINES, default="fitparse")
+    args = parser.parse_args()
+
+    fit_files = [Path(path) for path in args.fit_files] or fixture_fit_files()
+    report = {str(path): fit_file_report(path, args.engine) for path in fit_files}
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
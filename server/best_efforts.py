@@ -0,0 +1,251 @@
+"""
+Courbes de meilleurs efforts d'une activité, calculées à partir des records (distance, elapsed_time_s,
+speed_kmh, heart_rate, power des tables de parse_fit et de parse_fit_records) :
+
+- distance : meilleur temps pour chaque distance de DISTANCE_STEPS_M (100 m, 200 m... jusqu'à la
+  distance totale), en partant de n'importe quel record. L'arrivée est l'instant où la distance
+  cumulée atteint départ + distance, interpolé entre les deux records qui l'encadrent.
+- durée : meilleure moyenne de speed_kmh, heart_rate et power pour chaque durée de DURATION_STEPS_S
+  (5 s, 10 s... jusqu'à la durée totale), sur les fenêtres ]t - durée, t] de elapsed_time_s qui
+  tiennent dans l'activité (valeurs manquantes ignorées).
+
+Pas de parcours de toutes les paires de records : pour chaque distance (durée), l'arrivée (le début)
+de la fenêtre partant de chaque record est trouvée d'un coup par recherche dichotomique dans les
+distances (temps) cumulées, et chaque moyenne est une différence de sommes cumulées.
+
+Les courbes d'une activité sont enregistrées à côté des records (<base>_best_efforts.json, cf.
+sidecars) et servent de cache : les meilleurs efforts sur plusieurs séances (personal_bests) ne
+relisent que ces fichiers.
+
+La commande a lancer : python best_efforts.py results/xxx_records.csv [results/ ...]
+    (records d'une ou plusieurs activités, ou dossiers de résultats ; fichiers annexes calculés au besoin)
+"""
+import sys
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from compact_schema import metric_values, json_values
+
+BEST_EFFORTS_X = 'elapsed_time_s'
+BEST_EFFORTS_DISTANCE = 'distance'
+DURATION_METRICS = ('speed_kmh', 'heart_rate', 'power')
+BEST_EFFORTS_COLUMNS = (BEST_EFFORTS_X, BEST_EFFORTS_DISTANCE) + DURATION_METRICS
+# Grilles : (jusqu'à, pas) ; la distance et la durée totales de l'activité terminent chaque courbe
+DISTANCE_STEPS_M = ((5000.0, 100.0), (21000.0, 500.0), (float('inf'), 1000.0))
+STANDARD_DISTANCES_M = (1609.344, 21097.5, 42195.0)
+DURATION_STEPS_S = ((300.0, 5.0), (1200.0, 15.0), (3600.0, 60.0), (float('inf'), 300.0))
+BEST_EFFORTS_DECIMALS = 3
+MS_TO_KMH = 3.6
+
+
+def _grid(steps, total, extra=()):
+    """Valeurs de la grille (pas successifs) jusqu'à total inclus, plus les valeurs extra <= total et total."""
+    values, start = [], 0.0
+    for until, step in steps:
+        stop = min(until, total)
+        if stop > start:
+            values.append(np.arange(start + step, stop + step / 2, step))
+        start = until
+    values.append([v for v in extra if v <= total] + [total])
+    grid = np.unique(np.concatenate(values))
+    return grid[grid > 0]
+
+
+def best_times(times, distance, targets):
+    """
+    Meilleur temps pour parcourir chaque distance cible.
+
+    Args:
+        times (np.ndarray): elapsed_time_s des records (croissants).
+        distance (np.ndarray): Distance cumulée des records (non décroissante).
+        targets (np.ndarray): Distances cibles (m).
+
+    Returns:
+        tuple: (temps (s), elapsed_time_s du départ), NaN si la distance n'est jamais parcourue.
+    """
+    best = np.full(len(targets), np.nan)
+    start = np.full(len(targets), np.nan)
+    for k, target in enumerate(targets):
+        ends = distance + target
+        valid = ends <= distance[-1]
+        if not valid.any():
+            continue
+        ends = ends[valid]
+        # Premier record qui atteint l'arrivée (j >= 1 puisque target > 0), arrivée interpolée depuis le précédent
+        j = np.searchsorted(distance, ends, side='left')
+        fraction = (ends - distance[j - 1]) / (distance[j] - distance[j - 1])
+        starts = times[valid]
+        durations = times[j - 1] + fraction * (times[j] - times[j - 1]) - starts
+        i = int(np.argmin(durations))
+        best[k] = durations[i]
+        start[k] = starts[i]
+    return best, start
+
+
+def best_averages(times, metrics, durations):
+    """
+    Meilleure moyenne de chaque métrique pour chaque durée, sur les fenêtres ]t - durée, t] qui tiennent
+    dans l'activité (bornes des fenêtres cherchées une fois par durée, pour toutes les métriques).
+
+    Args:
+        times (np.ndarray): elapsed_time_s des records (croissants).
+        metrics (dict): Nom -> valeurs (float64, NaN pour les valeurs manquantes).
+        durations (np.ndarray): Durées (s).
+
+    Returns:
+        dict: Nom -> (moyenne, elapsed_time_s du début de la fenêtre), NaN si aucune fenêtre n'a de valeur.
+    """
+    cumulative = {}
+    for name, values in metrics.items():
+        finite = ~np.isnan(values)
+        cumulative[name] = (np.concatenate(([0.0], np.cumsum(np.where(finite, values, 0.0)))),
+                            np.concatenate(([0], np.cumsum(finite))))
+    hi = np.arange(1, len(times) + 1)
+    bests = {name: (np.full(len(durations), np.nan), np.full(len(durations), np.nan)) for name in metrics}
+    for k, duration in enumerate(durations):
+        lo = np.searchsorted(times, times - duration, side='right')
+        covered = times - duration >= times[0]
+        for name, (sums, counts) in cumulative.items():
+            n = counts[hi] - counts[lo]
+            valid = covered & (n > 0)
+            if not valid.any():
+                continue
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means = np.where(valid, (sums[hi] - sums[lo]) / n, -np.inf)
+            i = int(np.argmax(means))
+            bests[name][0][k] = means[i]
+            bests[name][1][k] = times[i] - duration
+    return bests
+
+
+def build_best_efforts(df):
+    """
+    Courbes de meilleurs efforts de la table des records (cf. docstring du module).
+
+    Returns:
+        dict: {"distance": {"distance_m", "time_s", "speed_kmh", "start_elapsed_s"},
+               "duration": {"duration_s", <métrique>: {"values", "start_elapsed_s"}...}}, listes alignées
+               sur la grille (courbes vides si la table n'a pas les colonnes nécessaires).
+    """
+    curves = {"distance": {"distance_m": [], "time_s": [], "speed_kmh": [], "start_elapsed_s": []},
+              "duration": {"duration_s": []}}
+    if len(df) == 0 or BEST_EFFORTS_X not in df.columns:
+        return curves
+
+    times = df[BEST_EFFORTS_X].to_numpy(dtype=np.float64, na_value=np.nan)
+    order = np.argsort(times, kind='stable')
+    keep = order[~np.isnan(times[order])]
+    times = times[keep]
+    if len(times) == 0:
+        return curves
+
+    if BEST_EFFORTS_DISTANCE in df.columns:
+        # Distance cumulée : valeurs manquantes remplacées par la dernière connue, jamais décroissante
+        distance = pd.Series(df[BEST_EFFORTS_DISTANCE].to_numpy(dtype=np.float64, na_value=np.nan)[keep]).ffill()
+        known = distance.notna().to_numpy()
+        distance = np.maximum.accumulate(distance.to_numpy()[known]) if known.any() else np.zeros(0)
+        if len(distance) > 1 and distance[-1] > distance[0]:
+            targets = _grid(DISTANCE_STEPS_M, distance[-1] - distance[0], STANDARD_DISTANCES_M)
+            best, start = best_times(times[known], distance, targets)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                speed = targets / best * MS_TO_KMH
+            curves["distance"] = {key: json_values(values, BEST_EFFORTS_DECIMALS) for key, values in (
+                ("distance_m", targets), ("time_s", best), ("speed_kmh", speed), ("start_elapsed_s", start))}
+
+    total_s = times[-1] - times[0]
+    metrics = [col for col in DURATION_METRICS if col in df.columns and df[col].notna().any()]
+    if total_s > 0 and metrics:
+        durations = _grid(DURATION_STEPS_S, total_s)
+        curves["duration"] = {"duration_s": json_values(durations, BEST_EFFORTS_DECIMALS)}
+        values = {col: metric_values(df[col])[keep] for col in metrics}
+        for col, (best, start) in best_averages(times, values, durations).items():
+            curves["duration"][col] = {"values": json_values(best, BEST_EFFORTS_DECIMALS),
+                                       "start_elapsed_s": json_values(start, BEST_EFFORTS_DECIMALS)}
+    return curves
+
+
+def write_best_efforts(df, path):
+    """Écrit les courbes de meilleurs efforts (JSON, cf. server/sidecars.py)."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(build_best_efforts(df), f, separators=(',', ':'))
+    return path
+
+
+def combine_best_efforts(activities):
+    """
+    Meilleurs efforts sur plusieurs activités : meilleur temps par distance, meilleure moyenne par durée.
+
+    Args:
+        activities (dict): Nom de l'activité -> courbes (cf. build_best_efforts).
+
+    Returns:
+        dict: {"distance": [{"distance_m", "time_s", "speed_kmh", "activity", "start_elapsed_s"}...],
+               "duration": {<métrique>: [{"duration_s", "value", "activity", "start_elapsed_s"}...]}},
+               triés par distance / durée.
+    """
+    distance_bests, duration_bests = {}, {}
+    for name, curves in activities.items():
+        distance = curves["distance"]
+        for i, target in enumerate(distance["distance_m"]):
+            time_s = distance["time_s"][i]
+            if time_s is not None and (target not in distance_bests or time_s < distance_bests[target]["time_s"]):
+                distance_bests[target] = {"distance_m": target, "time_s": time_s, "speed_kmh": distance["speed_kmh"][i],
+                                          "activity": name, "start_elapsed_s": distance["start_elapsed_s"][i]}
+        duration = curves["duration"]
+        for col in DURATION_METRICS:
+            if col not in duration:
+                continue
+            bests = duration_bests.setdefault(col, {})
+            for i, seconds in enumerate(duration["duration_s"]):
+                value = duration[col]["values"][i]
+                if value is not None and (seconds not in bests or value > bests[seconds]["value"]):
+                    bests[seconds] = {"duration_s": seconds, "value": value, "activity": name,
+                                      "start_elapsed_s": duration[col]["start_elapsed_s"][i]}
+    return {
+        "distance": [distance_bests[d] for d in sorted(distance_bests)],
+        "duration": {col: [bests[s] for s in sorted(bests)] for col, bests in duration_bests.items()},
+    }
+
+
+def _records_files(paths):
+    """Fichiers de records : chemins donnés, et fichiers <base>_records.* des dossiers (un par activité)."""
+    from table_outputs import OUTPUT_SUFFIXES
+    files = {}
+    for path in map(Path, paths):
+        candidates = sorted(path.glob('*_records.*')) if path.is_dir() else [path]
+        for candidate in candidates:
+            fmt = next((fmt for fmt, suffix in OUTPUT_SUFFIXES.items() if candidate.suffix == suffix), None)
+            if fmt is not None:
+                files.setdefault(candidate.with_suffix(''), {})[fmt] = str(candidate)
+    return files
+
+
+def personal_bests(paths):
+    """
+    Meilleurs efforts de plusieurs activités (cf. combine_best_efforts), à partir de leurs fichiers
+    <base>_best_efforts.json, calculés puis gardés à côté des records s'ils manquent ou sont périmés.
+    """
+    from sidecars import write_sidecars
+    activities = {}
+    for base, records_paths in _records_files(paths).items():
+        sidecar = write_sidecars(('best_efforts',), records_paths, reuse=True)['best_efforts']
+        with open(sidecar, encoding='utf-8') as f:
+            # Activité désignée par le chemin de ses fichiers, sans le suffixe _records
+            activities[str(base)[:-len('_records')] if base.name.endswith('_records') else str(base)] = json.load(f)
+    return combine_best_efforts(activities)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(json.dumps({"status": "error",
+                          "message": "Usage: python best_efforts.py path/to/xxx_records.csv|path/to/results/ [...]"}))
+        sys.exit(1)
+    try:
+        bests = personal_bests(sys.argv[1:])
+    except FileNotFoundError as e:
+        print(json.dumps({"status": "error", "message": str(e)}))
+        sys.exit(1)
+    print(json.dumps({"status": "success", **bests}))
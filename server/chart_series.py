@@ -0,0 +1,189 @@
+"""
+Séries sous-échantillonnées pour les graphiques du dashboard (Largest-Triangle-Three-Buckets).
+
+Les graphiques (SpeedChart, HeartRateChart, MultiMetricChart...) n'ont pas besoin des 28 000 points
+d'une longue activité : pour chaque métrique et chaque taille cible (CHART_SIZES), LTTB garde dans
+chaque tranche de records le point qui forme le plus grand triangle avec le point gardé dans la
+tranche précédente et la moyenne de la tranche suivante, ce qui conserve les pics et les creux.
+
+Les limites de laps sont conservées : les tranches ne chevauchent jamais deux laps, et le premier
+et le dernier record de chaque lap sont toujours gardés. Le nombre de points d'un lap est
+proportionnel à son nombre de records (au moins ses deux extrémités), si bien qu'une série peut
+dépasser légèrement la taille cible quand l'activité compte beaucoup de laps courts.
+
+Le calcul est vectorisé : une seule boucle sur les tranches, qui traite toutes les métriques
+à la fois (le point gardé dépend de celui de la tranche précédente).
+
+Fichier produit (JSON compact) :
+    {"x": "elapsed_time_s", "records": n, "sizes": [500, 2000, 8000],
+     "laps": [{"lap_number", "lap_nature", "start_s", "end_s"}, ...],
+     "series": {"500": {"speed_kmh": {"elapsed_time_s": [...], "values": [...]}, ...}, ...}}
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+from compact_schema import metric_values, json_values
+
+CHART_SIZES = (500, 2000, 8000)
+CHART_X = 'elapsed_time_s'
+CHART_METRICS = (
+    'speed_kmh', 'heart_rate', 'cadence_step_per_min', 'altitude', 'temperature', 'power',
+    'stance_time', 'step_length', 'vertical_oscillation', 'vertical_ratio',
+)
+CHART_COLUMNS = (CHART_X, 'lap_number', 'lap_nature') + CHART_METRICS
+# Décimales conservées dans le JSON
+VALUE_DECIMALS = 3
+
+
+def lap_starts(lap_numbers):
+    """Indices du premier record de chaque lap (records triés dans le temps)."""
+    lap_numbers = np.asarray(lap_numbers)
+    if len(lap_numbers) == 0:
+        return np.zeros(0, dtype=np.intp)
+    return np.concatenate(([0], np.flatnonzero(lap_numbers[1:] != lap_numbers[:-1]) + 1))
+
+
+def lttb_buckets(segment_starts, n_points, n_out):
+    """
+    Tranches [start, end[ de LTTB pour n_out points environ, sans chevaucher deux segments (laps).
+
+    Chaque segment reçoit un nombre de points proportionnel à sa longueur : son premier et son dernier
+    record forment des tranches d'un point, les records intermédiaires sont répartis dans les autres
+    tranches. Un segment qui a moins de records que de points reçus est gardé en entier.
+
+    Returns:
+        tuple: (starts, ends), tableaux d'indices.
+    """
+    segment_starts = np.asarray(segment_starts, dtype=np.intp)
+    segment_ends = np.append(segment_starts[1:], n_points)
+    lengths = segment_ends - segment_starts
+    budgets = np.floor(n_out * lengths / n_points).astype(np.intp)
+    budgets = np.clip(budgets, np.minimum(lengths, 2), lengths)
+
+    starts, ends = [], []
+    for start, length, budget in zip(segment_starts, lengths, budgets):
+        if budget >= length:
+            bucket_starts = start + np.arange(length)
+            bucket_ends = bucket_starts + 1
+        else:
+            # Extrémités du segment + (budget - 2) tranches sur les records intermédiaires
+            n_middle = budget - 2
+            middle_starts = start + 1 + (np.arange(n_middle) * (length - 2)) // max(n_middle, 1)
+            middle_ends = np.append(middle_starts[1:], start + length - 1)[:n_middle]
+            bucket_starts = np.concatenate(([start], middle_starts, [start + length - 1]))
+            bucket_ends = np.concatenate(([start + 1], middle_ends, [start + length]))
+        starts.append(bucket_starts)
+        ends.append(bucket_ends)
+    return np.concatenate(starts), np.concatenate(ends)
+
+
+def lttb_select(x, values, starts, ends):
+    """
+    Sélection LTTB d'un point par tranche, pour plusieurs séries partageant le même axe x.
+
+    Args:
+        x (np.ndarray): Abscisses (n,), croissantes.
+        values (np.ndarray): Valeurs (m, n) en float, NaN pour les valeurs manquantes.
+        starts, ends (np.ndarray): Tranches [start, end[ (cf. lttb_buckets) ; la première et la
+            dernière ne contiennent qu'un point.
+
+    Returns:
+        np.ndarray: Indices des points gardés (m, nombre de tranches).
+    """
+    n_metrics = values.shape[0]
+    n_buckets = len(starts)
+    widths = ends - starts
+    columns = np.arange(widths.max())
+    # Tranches en matrice (tranches x largeur max), complétées par le dernier indice de la tranche
+    bucket_index = np.minimum(starts[:, None] + columns, (ends - 1)[:, None])
+
+    # Moyennes de chaque tranche (sans les NaN) par sommes cumulées
+    finite = ~np.isnan(values)
+    value_sums = np.concatenate((np.zeros((n_metrics, 1)), np.cumsum(np.where(finite, values, 0.0), axis=1)), axis=1)
+    value_counts = np.concatenate((np.zeros((n_metrics, 1)), np.cumsum(finite, axis=1)), axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_values = (value_sums[:, ends] - value_sums[:, starts]) / (value_counts[:, ends] - value_counts[:, starts])
+    x_sums = np.concatenate(([0.0], np.cumsum(x)))
+    mean_x = (x_sums[ends] - x_sums[starts]) / widths
+
+    rows = np.arange(n_metrics)
+    selected = np.empty((n_metrics, n_buckets), dtype=np.intp)
+    selected[:, 0] = starts[0]
+    for bucket in range(1, n_buckets):
+        candidates = bucket_index[bucket]
+        if widths[bucket] == 1 or bucket == n_buckets - 1:
+            selected[:, bucket] = candidates[0]
+            continue
+        anchor = selected[:, bucket - 1]
+        anchor_x = x[anchor][:, None]
+        anchor_y = values[rows, anchor]
+        next_x = mean_x[bucket + 1]
+        next_y = mean_values[:, bucket + 1]
+        # Point précédent ou tranche suivante sans valeur : l'autre sert de référence
+        anchor_y, next_y = np.where(np.isnan(anchor_y), next_y, anchor_y), np.where(np.isnan(next_y), anchor_y, next_y)
+
+        # Aire (au facteur 1/2 près) du triangle point gardé / candidat / moyenne de la tranche suivante
+        areas = np.abs((anchor_x - next_x) * (values[:, candidates] - anchor_y[:, None])
+                       - (anchor_x - x[candidates]) * (next_y - anchor_y)[:, None])
+        areas[np.isnan(areas)] = -1.0
+        selected[:, bucket] = candidates[np.argmax(areas, axis=1)]
+    return selected
+
+
+def _lap_table(df, starts):
+    if 'lap_number' not in df.columns:
+        return []
+    x = df[CHART_X].to_numpy(dtype=np.float64)
+    ends = np.append(starts[1:], len(df)) - 1
+    natures = df['lap_nature'].astype(object).to_numpy() if 'lap_nature' in df.columns else [None] * len(df)
+    lap_numbers = df['lap_number'].to_numpy()
+    return [{"lap_number": int(lap_numbers[start]),
+             "lap_nature": None if pd.isna(natures[start]) else str(natures[start]),
+             "start_s": float(x[start]), "end_s": float(x[end])}
+            for start, end in zip(starts, ends)]
+
+
+def build_chart_series(df, sizes=CHART_SIZES, metrics=CHART_METRICS):
+    """
+    Séries sous-échantillonnées (LTTB) de chaque métrique présente dans la table des records.
+
+    Returns:
+        dict: Contenu du fichier JSON (cf. docstring du module).
+    """
+    metrics = [col for col in metrics if col in df.columns and df[col].notna().any()]
+    x = df[CHART_X].to_numpy(dtype=np.float64)
+    starts = lap_starts(df['lap_number'].to_numpy()) if 'lap_number' in df.columns else np.zeros(min(len(df), 1), dtype=np.intp)
+    values = np.vstack([metric_values(df[col]) for col in metrics]) \
+        if metrics else np.zeros((0, len(df)))
+
+    series = {}
+    for size in sizes:
+        if len(df) == 0 or not metrics:
+            selected = np.zeros((len(metrics), 0), dtype=np.intp)
+        elif len(df) <= size:
+            selected = np.broadcast_to(np.arange(len(df)), (len(metrics), len(df)))
+        else:
+            bucket_starts, bucket_ends = lttb_buckets(starts, len(df), size)
+            selected = lttb_select(x, values, bucket_starts, bucket_ends)
+        series[str(size)] = {
+            col: {CHART_X: json_values(x[selected[row]], VALUE_DECIMALS),
+                  "values": json_values(values[row, selected[row]], VALUE_DECIMALS)}
+            for row, col in enumerate(metrics)
+        }
+
+    return {
+        "x": CHART_X,
+        "records": len(df),
+        "sizes": list(sizes),
+        "laps": _lap_table(df, starts),
+        "series": series,
+    }
+
+
+def write_chart_series(df, path, sizes=CHART_SIZES):
+    """Écrit les séries des graphiques (JSON compact) et renvoie le chemin."""
+    with open(path, 'w') as f:
+        json.dump(build_chart_series(df, sizes), f, separators=(',', ':'))
+    return path
@@ -0,0 +1,143 @@
+"""
+Schéma compact des tables de records et de laps.
+
+Le type de chaque champ FIT est déduit du profil FIT (fitparse.profile) :
+entier sans échelle -> entier nullable de même taille (UInt8 pour heart_rate,
+UInt16 pour power, Int8 pour temperature...), champ avec échelle -> float32 si
+le type de base tient sur 8 ou 16 bits, float64 au-delà (distance, vitesses et
+altitudes 32 bits). Les énumérations, chaînes, tableaux et champs inconnus
+(unknown_*) gardent le type inféré par pandas.
+
+Les colonnes calculées par le pipeline ont leur type dans RECORD_DERIVED_DTYPES ;
+lap_nature est une catégorie (LAP_NATURE_DTYPE). Les temps (timestamp en
+datetime64, c'est-à-dire un entier epoch sur 8 octets, et les secondes écoulées)
+restent en 64 bits.
+
+La conversion se fait colonne par colonne à la construction du DataFrame
+(build_compact_frame) : la table n'est jamais matérialisée avec les types larges.
+Une colonne dont les valeurs ne tiennent pas dans le type du profil (valeur hors
+bornes, tableau...) garde le type inféré.
+
+Les fichiers annexes (cf. sidecars.py) lisent les métriques avec metric_values, dans
+le type compact quelle que soit la provenance de la table, et écrivent leurs JSON
+avec json_values.
+"""
+import numpy as np
+import pandas as pd
+from fitparse.profile import MESSAGE_TYPES
+from fitparse.records import BaseType
+
+# Natures de lap (cf. classify_lap_nature_by_speed de extract_fit_file.py)
+LAP_NATURES = ['Warm-up', 'Intensity', 'Recovery', 'Cool-down', 'Unknown']
+LAP_NATURE_DTYPE = pd.CategoricalDtype(LAP_NATURES)
+
+# Types des colonnes calculées par les extracteurs (records et laps)
+RECORD_DERIVED_DTYPES = {
+    'speed_kmh': np.dtype(np.float32),
+    'cadence_step_per_min': pd.UInt16Dtype(),
+    'stance_time': pd.UInt16Dtype(),
+    'step_length': pd.UInt16Dtype(),
+    'altitude': pd.Int16Dtype(),
+    'lap_number': np.dtype(np.uint16),
+    'lap_nature': LAP_NATURE_DTYPE,
+}
+LAP_DERIVED_DTYPES = {
+    'lap_number': np.dtype(np.uint16),
+    'lap_nature': LAP_NATURE_DTYPE,
+    'avg_speed_kmh': np.dtype(np.float32),
+    'max_speed_kmh': np.dtype(np.float32),
+    'avg_running_cadence_step_per_min': pd.UInt16Dtype(),
+}
+
+# Type de base FIT -> entier nullable pandas
+_INTEGER_DTYPES = {
+    'sint8': pd.Int8Dtype(), 'uint8': pd.UInt8Dtype(), 'uint8z': pd.UInt8Dtype(),
+    'sint16': pd.Int16Dtype(), 'uint16': pd.UInt16Dtype(), 'uint16z': pd.UInt16Dtype(),
+    'sint32': pd.Int32Dtype(), 'uint32': pd.UInt32Dtype(), 'uint32z': pd.UInt32Dtype(),
+    'sint64': pd.Int64Dtype(), 'uint64': pd.UInt64Dtype(), 'uint64z': pd.UInt64Dtype(),
+}
+_FLOAT_DTYPES = {'float32': np.dtype(np.float32), 'float64': np.dtype(np.float64)}
+
+# Champs du profil par type de message et par nom
+_PROFILE_FIELDS = {message.name: {field.name: field for field in message.fields.values()}
+                   for message in MESSAGE_TYPES.values()}
+
+
+def fit_field_dtype(message_name, field_name):
+    """
+    Type compact d'un champ FIT d'après le profil, ou None si le champ garde le type inféré
+    (champ inconnu du profil, énumération, chaîne, date).
+    """
+    field = _PROFILE_FIELDS.get(message_name, {}).get(field_name)
+    if field is None or not isinstance(field.type, BaseType):
+        return None
+
+    base_type = field.type.name
+    if base_type in _FLOAT_DTYPES:
+        return _FLOAT_DTYPES[base_type]
+    if base_type not in _INTEGER_DTYPES:
+        return None
+    if field.scale or field.offset:
+        return np.dtype(np.float32) if field.type.size <= 2 else np.dtype(np.float64)
+    return _INTEGER_DTYPES[base_type]
+
+
+def compact_column(values, dtype):
+    """
+    Colonne (Series) dans le type compact, ou dans le type inféré par pandas si dtype est None
+    ou si les valeurs ne tiennent pas dans ce type.
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    if dtype is None or series.dtype == dtype:
+        return series
+    try:
+        return series.astype(dtype)
+    except (TypeError, ValueError, OverflowError):
+        return series
+
+
+def metric_values(series):
+    """
+    Métrique en float64 (NaN pour les valeurs manquantes), ramenée en float32 (type compact des
+    métriques) : mêmes résultats que la table vienne de la mémoire, d'un fichier Parquet ou d'un
+    CSV relu en float64.
+    """
+    return series.to_numpy(dtype=np.float64, na_value=np.nan).astype(np.float32).astype(np.float64)
+
+
+def json_values(values, decimals):
+    """Valeurs arrondies pour un fichier JSON (entiers sans décimale), None pour les valeurs manquantes."""
+    rounded = np.round(np.asarray(values, dtype=np.float64), decimals)
+    return [None if np.isnan(value) else (int(value) if value.is_integer() else value) for value in rounded.tolist()]
+
+
+def _rows_to_columns(rows):
+    """Liste de dictionnaires -> colonnes (listes), dans l'ordre d'apparition des champs, None si absent."""
+    columns = {}
+    n_rows = len(rows)
+    for position, row in enumerate(rows):
+        for name, value in row.items():
+            column = columns.get(name)
+            if column is None:
+                column = columns[name] = [None] * n_rows
+            column[position] = value
+    return columns
+
+
+def build_compact_frame(records, message_name, dtypes=None):
+    """
+    Construit le DataFrame d'un type de message FIT dans le schéma compact.
+
+    Args:
+        records (list | dict): Messages (liste de dictionnaires, fitparse) ou colonnes (moteur NumPy).
+        message_name (str): Type de message FIT ('record', 'lap'...), pour les types du profil.
+        dtypes (dict | None): Types imposés par colonne (None : type inféré, ex. pour les champs
+            convertis ensuite par le pipeline).
+    """
+    dtypes = dtypes or {}
+    columns = records if isinstance(records, dict) else _rows_to_columns(records)
+    return pd.DataFrame({
+        name: compact_column(values, dtypes[name] if name in dtypes else fit_field_dtype(message_name, name))
+        for name, values in columns.items()
+    })
+
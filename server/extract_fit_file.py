@@ -1,14 +1,41 @@
+import os
 import sys
+import glob
 import json
+import time
+import argparse
+import tempfile
+import cProfile
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 import pandas as pd
-from fitparse import FitFile
-from datetime import timedelta
-import matplotlib.pyplot as plt
+from fit_messages import load_fit_messages, stream_fit_messages, DECODER_ENGINES
+from table_outputs import (write_tables, parse_output_formats, iter_table_chunks, TableStreamWriter,
+                           DEFAULT_OUTPUT_FORMATS, OUTPUT_FORMATS)
+import result_cache
+import activity_store
+from sidecars import parse_sidecars, write_sidecars, SIDECARS
+from stage_timings import StageTimings, timed_stage
+from time_format import format_seconds_column_min_sec
+# Réexporté : la fonction était définie ici (from extract_fit_file import format_seconds_to_min_sec)
+from time_format import format_seconds_to_min_sec  # noqa: F401
+from compact_schema import (build_compact_frame, compact_column, fit_field_dtype,
+                            RECORD_DERIVED_DTYPES, LAP_DERIVED_DTYPES, LAP_NATURE_DTYPE)
 import numpy as np
-import os # Importation nécessaire
 
 # La commande a lancer : python extract_fit_file.py "./uploads/fichier.fit" ./results/
+# Mode worker persistant (utilisé par server/index.js) : python extract_fit_file.py --worker
+# Moteur de décodage vectorisé : python extract_fit_file.py fichier.fit ./results/ --engine numpy
+# Fichier projeté en mémoire (mmap) plutôt que lu : python extract_fit_file.py fichier.fit ./results/ --engine mmap
+# Sorties colonnaires : python extract_fit_file.py fichier.fit ./results/ --format csv,parquet,arrow
+# Sans le cache des résultats (cf. result_cache.py) : python extract_fit_file.py fichier.fit ./results/ --no-cache
+# Mode batch (dossier ou motif glob, sur un pool de processus) : python extract_fit_file.py --batch "./uploads/*.fit" ./results/ --jobs 8
+# Mode streaming, mémoire bornée pour les très longues activités : python extract_fit_file.py fichier.fit ./results/ --stream [--chunk-size 10000]
+
+# Version du pipeline d'extraction : à incrémenter à chaque changement du contenu des fichiers produits
+# (elle fait partie de la clé du cache des résultats, avec les seuils ci-dessous)
+PIPELINE_VERSION = 2
 
 # Facteur de conversion de la vitesse: 1 m/s = 3.6 km/h
 MS_TO_KMH = 3.6
@@ -21,13 +48,39 @@ PAUSE_DISTANCE_THRESHOLD_M = 1.0
 INTENSITY_SPEED_THRESHOLD = 17.05
 RECOVERY_SPEED_THRESHOLD = 8.65
 
-def format_seconds_to_min_sec(seconds):
-    if pd.isna(seconds):
-        return None
-    total_seconds = int(seconds)
-    minutes = total_seconds // 60
-    seconds = total_seconds % 60
-    return f"{minutes:02d}:{seconds:02d}"
+# Messages FIT utilisés par l'extraction
+EXTRACTED_MESSAGES = ('record', 'lap')
+
+# Champs FIT jamais décodés : ils seraient supprimés des CSV de toute façon
+# (speed/cadence, avg_speed/max_speed et start_time restent décodés car ils servent aux calculs)
+RECORD_FIELDS_EXCLUDED = [
+    "activity_type", "enhanced_altitude", "enhanced_speed", "fractional_cadence", 
+    "unknown_87", "unknown_88", "unknown_90", "position_lat", "position_long"
+]
+LAP_FIELDS_EXCLUDED = [
+    "avg_cadence_position", "avg_combined_pedal_smoothness", "avg_fractional_cadence", "avg_left_pco", "avg_left_pedal_smoothness", "enhanced_avg_speed", "enhanced_max_speed", "total_ascent", "avg_left_power_phase", "avg_left_power_phase_peak", "avg_left_torque_effectiveness", "avg_power", "avg_power_position", "avg_right_pco", "avg_right_pedal_smoothness", "avg_right_power_phase", "avg_right_power_phase_peak", "avg_right_torque_effectiveness", "avg_stroke_distance", "end_position_lat", "end_position_long", "event_group", "event", "event_type", "first_length_index", "intensity", "lap_trigger", "left_right_balance", "max_cadence_position", "max_fractional_cadence", "max_power", "max_power_position", "max_running_cadence", "max_temperature", "message_index", "normalized_power", "num_active_lengths", "num_lengths", "sport", "stand_count", "start_position_lat", "start_position_long", "sub_sport", "swim_stroke", "time_standing", "total_calories", "total_descent", "total_fat_calories", "total_fractional_cycles", "total_work", "wkt_step_index", "unknown_124", "unknown_125", "unknown_126", "unknown_27", "unknown_28", "unknown_29", "unknown_30", "unknown_70", "unknown_72", "unknown_73", "unknown_90", "unknown_96", "unknown_97", "timestamp"
+]
+FIT_FIELD_SELECTION = {
+    'record': {'exclude': RECORD_FIELDS_EXCLUDED},
+    'lap': {'exclude': LAP_FIELDS_EXCLUDED},
+}
+
+# Champs convertis par le pipeline : gardés en float64 à la construction du DataFrame (cf. compact_schema),
+# les colonnes calculées prennent leur type compact (RECORD_DERIVED_DTYPES, LAP_DERIVED_DTYPES)
+RECORD_CONVERTED_FIELDS = {'speed': None, 'cadence': None, 'altitude': None, 'stance_time': None, 'step_length': None}
+LAP_CONVERTED_FIELDS = {'avg_speed': None, 'max_speed': None, 'lap_number': LAP_DERIVED_DTYPES['lap_number']}
+
+# Nombre de records traités par bloc en mode streaming
+STREAM_CHUNK_SIZE = 10000
+
+# Colonnes de records placées en tête, dans cet ordre (les autres suivent par ordre alphabétique)
+RECORD_COLUMNS_PRIORITY = [
+    'timestamp', 'elapsed_time_s', 'moving_elapsed_time_s', 'elapsed_time_min_sec',
+    'lap_number', 'lap_nature', 'elapsed_time_in_lap_s', 'distance', 'speed_kmh', 
+    'heart_rate', 'cadence_step_per_min', 'stance_time', 'stance_time_balance', 
+    'stance_time_percent', 'step_length', 'vertical_oscillation', 'vertical_ratio', 
+    'altitude', 'temperature'
+]
 
 def classify_lap_nature_by_speed(df_laps):
     """
@@ -90,146 +143,167 @@ def classify_lap_nature_by_speed(df_laps):
         
     return df_laps
 
-def parse_fit(ff):
-    # 1. Extraction des enregistrements de la session (Record Messages)
-    rows = []
-    columns_to_drop = [
-        "activity_type", "enhanced_altitude", "enhanced_speed", "fractional_cadence", 
-        "unknown_87", "unknown_88", "unknown_90", "speed", "cadence", "position_lat", "position_long"
-    ]
+def parse_fit(fit_messages, timings=None):
+    """
+    Construit le DataFrame des records à partir des messages décodés.
+    timings (StageTimings | None) : chronométrage de chaque étape (option --timings).
+    """
+    # 1. Extraction des enregistrements de la session (Record Messages, déjà décodés en un seul passage)
+    rows = fit_messages['record']
+    columns_to_drop = RECORD_FIELDS_EXCLUDED + ["speed", "cadence"]
     
-    for rec in ff.get_messages('record'):
-        r = {}
-        for field in rec:
-            r[field.name] = field.value
-        rows.append(r) 
-        
     if not rows:
         raise RuntimeError("Aucun record trouvé dans le fichier .fit")
     
-    df = pd.DataFrame(rows)
+    with timed_stage(timings, 'dataframe_build'):
+        df = build_compact_frame(rows, 'record', RECORD_CONVERTED_FIELDS)
     
-    # 2. Nettoyage et normalisation des données
-    if 'timestamp' in df.columns:
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df = df.sort_values('timestamp').reset_index(drop=True)
-        df['elapsed_time_s'] = (df['timestamp'] - df['timestamp'].iloc[0]).dt.total_seconds()
+        # 2. Nettoyage et normalisation des données
+        if 'timestamp' in df.columns:
+            df['timestamp'] = pd.to_datetime(df['timestamp'])
+            df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+            df['elapsed_time_s'] = (df['timestamp'] - df['timestamp'].iloc[0]).dt.total_seconds()
     
-    # 3. Conversion de la vitesse m/s -> km/h
-    if 'speed' in df.columns:
-        df['speed_kmh'] = np.round(df['speed'] * MS_TO_KMH, 2)
-        
-    # 4. Traitements sur les colonnes existantes
-    if 'cadence' in df.columns:
-        df['cadence_step_per_min'] = df['cadence'] * 2
-
-    for col in ['stance_time', 'step_length', 'altitude']:
-        if col in df.columns:
-            df[col] = np.round(df[col]).astype('Int64')
+    # 3. et 4. Conversion de la vitesse (km/h), de la cadence (ppm), arrondis
+    with timed_stage(timings, 'unit_conversion'):
+        df = convert_record_units(df)
 
     # 5. Ajout de l'information des laps
-    df = add_lap_info(ff, df) # Appel à la fonction modifiée
+    with timed_stage(timings, 'add_lap_info'):
+        df = add_lap_info(fit_messages['lap'], df) # Appel à la fonction modifiée
     
     # 6. Ajout du temps écoulé dans le lap en cours (elapsed_time_in_lap_s)
-    if 'lap_number' in df.columns and 'elapsed_time_s' in df.columns:
-        lap_start_time = df.groupby('lap_number')['elapsed_time_s'].transform('min')
-        df['elapsed_time_in_lap_s'] = df['elapsed_time_s'] - lap_start_time
-        df['elapsed_time_in_lap_s'] = np.round(df['elapsed_time_in_lap_s'], 1)
+    with timed_stage(timings, 'elapsed_time_in_lap'):
+        if 'lap_number' in df.columns and 'elapsed_time_s' in df.columns:
+            lap_start_time = df.groupby('lap_number')['elapsed_time_s'].transform('min')
+            df['elapsed_time_in_lap_s'] = df['elapsed_time_s'] - lap_start_time
+            df['elapsed_time_in_lap_s'] = np.round(df['elapsed_time_in_lap_s'], 1)
 
     # 7. Ajout des colonnes demandées (Moving Time)
-    if 'elapsed_time_s' in df.columns and 'distance' in df.columns:
-        df['dt'] = df['elapsed_time_s'].diff()
-        df['dd'] = df['distance'].diff().fillna(0)
-        
-        is_break_real = (df['dt'] >= PAUSE_TIME_THRESHOLD_S) & (df['dd'] <= PAUSE_DISTANCE_THRESHOLD_M)
-        
-        df['pause_correction_s'] = np.where(is_break_real, df['dt'] - 1.0, 0.0)
-        df.loc[0, 'pause_correction_s'] = 0.0
-        
-        df['cumulative_pause_s'] = df['pause_correction_s'].cumsum()
-        
-        df['moving_elapsed_time_s'] = df['elapsed_time_s'] - df['cumulative_pause_s']
-        df['moving_elapsed_time_s'] = np.round(df['moving_elapsed_time_s'], 1)
-        
-        df = df.drop(columns=['dt', 'dd', 'pause_correction_s', 'cumulative_pause_s'], errors='ignore')
+    with timed_stage(timings, 'moving_time'):
+        if 'elapsed_time_s' in df.columns and 'distance' in df.columns:
+            df['moving_elapsed_time_s'] = moving_elapsed_time(df['elapsed_time_s'], df['distance'])
 
     # 7.B Colonne de temps formaté (MM:SS)
-    if 'elapsed_time_s' in df.columns:
-        df['elapsed_time_min_sec'] = df['moving_elapsed_time_s'].apply(format_seconds_to_min_sec)
+    with timed_stage(timings, 'format_min_sec'):
+        if 'elapsed_time_s' in df.columns:
+            df['elapsed_time_min_sec'] = format_seconds_column_min_sec(df['moving_elapsed_time_s'])
 
-    # 8. Suppression des colonnes indésirables
-    df = df.drop(columns=columns_to_drop, errors='ignore')
+    # 8. et 9. Suppression des colonnes indésirables et réorganisation des colonnes principales
+    with timed_stage(timings, 'column_cleanup'):
+        df = df.drop(columns=columns_to_drop, errors='ignore')
+        df = df.reindex(columns=order_record_columns(df.columns))
     
-    # 9. Réorganisation des colonnes principales
-    col_order_priority = [
-        'timestamp', 'elapsed_time_s', 'moving_elapsed_time_s', 'elapsed_time_min_sec',
-        'lap_number', 'lap_nature', 'elapsed_time_in_lap_s', 'distance', 'speed_kmh', 
-        'heart_rate', 'cadence_step_per_min', 'stance_time', 'stance_time_balance', 
-        'stance_time_percent', 'step_length', 'vertical_oscillation', 'vertical_ratio', 
-        'altitude', 'temperature'
-    ]
+    return df
 
-    remaining_cols = [col for col in df.columns if col not in col_order_priority]
-    new_column_order = [col for col in col_order_priority if col in df.columns] + sorted(remaining_cols)
-    
-    df = df.reindex(columns=new_column_order)
-    
+def convert_record_units(df):
+    """
+    Conversion de la vitesse m/s -> km/h, de la cadence (cycles -> pas par minute)
+    et arrondi à l'entier des colonnes stance_time, step_length et altitude.
+    """
+    if 'speed' in df.columns:
+        df['speed_kmh'] = compact_column(np.round(df['speed'] * MS_TO_KMH, 2), RECORD_DERIVED_DTYPES['speed_kmh'])
+        
+    if 'cadence' in df.columns:
+        df['cadence_step_per_min'] = compact_column(df['cadence'] * 2, RECORD_DERIVED_DTYPES['cadence_step_per_min'])
+
+    for col in ['stance_time', 'step_length', 'altitude']:
+        if col in df.columns:
+            df[col] = compact_column(np.round(df[col]), RECORD_DERIVED_DTYPES[col])
     return df
 
-def add_lap_info(fitfile, df):
+def moving_elapsed_time(elapsed_time_s, distance, carry=None):
+    """
+    Temps de déplacement (arrondi à 0.1 s) : temps écoulé moins les arrêts longs et immobiles
+    (au moins PAUSE_TIME_THRESHOLD_S entre deux records pour au plus PAUSE_DISTANCE_THRESHOLD_M
+    parcourus), chaque arrêt comptant pour 1 s.
+    carry : état reporté d'un bloc de records au suivant en mode streaming (dernier temps écoulé,
+    dernière distance, pause cumulée), mis à jour sur place.
+    """
+    carry = {} if carry is None else carry
+    elapsed_time_s = pd.Series(elapsed_time_s).to_numpy(dtype=np.float64, na_value=np.nan)
+    distance = pd.Series(distance).to_numpy(dtype=np.float64, na_value=np.nan)
+
+    # Écarts avec le record précédent (aucun pour le premier record de la séance)
+    dt = np.diff(elapsed_time_s, prepend=carry.get('elapsed_time_s', np.nan))
+    dd = np.diff(distance, prepend=carry.get('distance', np.nan))
+    dd[np.isnan(dd)] = 0.0
+
+    is_break_real = (dt >= PAUSE_TIME_THRESHOLD_S) & (dd <= PAUSE_DISTANCE_THRESHOLD_M)
+    pause_correction_s = np.where(is_break_real, dt - 1.0, 0.0)
+    cumulative_pause_s = np.cumsum(np.concatenate(([carry.get('cumulative_pause_s', 0.0)], pause_correction_s)))[1:]
+
+    carry.update(elapsed_time_s=elapsed_time_s[-1], distance=distance[-1], cumulative_pause_s=cumulative_pause_s[-1])
+    return np.round(elapsed_time_s - cumulative_pause_s, 1)
+
+def order_record_columns(columns):
+    """Ordre des colonnes de records : RECORD_COLUMNS_PRIORITY puis les autres par ordre alphabétique."""
+    remaining_cols = [col for col in columns if col not in RECORD_COLUMNS_PRIORITY]
+    return [col for col in RECORD_COLUMNS_PRIORITY if col in columns] + sorted(remaining_cols)
+
+def add_lap_info(lap_messages, df):
     """
     Ajoute le numéro de lap et la nature du lap (classée par vitesse) 
     à chaque timestamp du dataframe de records.
+    lap_messages : messages 'lap' collectés par collect_fit_messages.
     """
     
     if df.empty or 'timestamp' not in df.columns:
         print("DataFrame ou colonne 'timestamp' manquante pour l'ajout des laps.")
-        df['lap_number'] = 1 
-        df['lap_nature'] = 'Unknown'
-        return df
-    
-    # 1. Extraction et assignation du lap_number
-    laps = []
-    for lap in fitfile.get_messages('lap'):
-        lap_data = {}
-        for field in lap:
-            lap_data[field.name] = field.value
-        laps.append(lap_data)
+        return _assign_single_lap(df)
+
+    lap_index = build_lap_index(lap_messages)
+    if lap_index is None:
+        return _assign_single_lap(df)
+
+    # 1. Assignation du lap_number
+    lap_starts, lap_natures = lap_index
+    lap_numbers = assign_lap_numbers(lap_starts, df['timestamp'])
+    df['lap_number'] = lap_numbers.astype(RECORD_DERIVED_DTYPES['lap_number'])
+    # print(f"{len(lap_starts)} laps détectés et assignés aux enregistrements") # Commenté pour éviter la sortie console
+
+    # 2. Report de la nature du lap (lap_nature) dans le DF des records par lecture directe lap_number -> nature
+    df = df.drop(columns=['lap_nature'], errors='ignore') 
+    df['lap_nature'] = pd.Categorical(lap_natures[lap_numbers], dtype=LAP_NATURE_DTYPE)
+    return df
+
+def _assign_single_lap(df):
+    """Tous les records dans le lap 1, de nature inconnue."""
+    df['lap_number'] = np.ones(len(df), dtype=RECORD_DERIVED_DTYPES['lap_number'])
+    df['lap_nature'] = pd.Categorical(np.full(len(df), 'Unknown', dtype=object), dtype=LAP_NATURE_DTYPE)
+    return df
+
+def build_lap_index(lap_messages):
+    """
+    Prépare l'assignation des records aux laps.
+    lap_messages : messages 'lap' collectés par collect_fit_messages.
+
+    Returns:
+        tuple | None: (débuts des laps triés en datetime64[ns], nature de chaque lap indexée par lap_number),
+        ou None si tous les records doivent être assignés au lap 1 (aucun lap, ou laps sans 'start_time').
+    """
+    # 1. Tri des laps par début (copie : les dictionnaires collectés sont partagés avec build_lap_table)
+    laps = [dict(lap) for lap in lap_messages]
     
     if not laps:
         print("Aucun lap trouvé. Tous les enregistrements sont assignés au lap 1.")
-        df['lap_number'] = 1
-        df['lap_nature'] = 'Unknown'
-        return df
+        return None
 
     laps_sorted = sorted([lap for lap in laps if 'start_time' in lap and lap['start_time']], 
                          key=lambda x: x['start_time'])
     
     if not laps_sorted:
         print("Laps trouvés mais sans 'start_time'. Tous les enregistrements sont assignés au lap 1.")
-        df['lap_number'] = 1
-        df['lap_nature'] = 'Unknown'
-        return df
+        return None
 
-    df['lap_number'] = 0
-    
-    # Assigner lap_number au DF de records ET ajouter le lap_number au dictionnaire lap pour la classification
+    # Ajouter le lap_number au dictionnaire lap pour la classification
     for lap_num, lap in enumerate(laps_sorted, 1):
         lap['lap_number'] = lap_num  # Assigner le numéro au lap pour la création du DF de résumé
-        lap_start = pd.to_datetime(lap['start_time'])
-        
-        if lap_num < len(laps_sorted):
-            next_lap_start = pd.to_datetime(laps_sorted[lap_num]['start_time'])
-        else:
-            next_lap_start = df['timestamp'].max() + timedelta(seconds=1)
-        
-        mask = (df['timestamp'] >= lap_start) & (df['timestamp'] < next_lap_start)
-        df.loc[mask, 'lap_number'] = lap_num
-        
-    df.loc[df['lap_number'] == 0, 'lap_number'] = len(laps_sorted)
-    # print(f"{len(laps_sorted)} laps détectés et assignés aux enregistrements") # Commenté pour éviter la sortie console
+
+    lap_starts = pd.to_datetime([lap['start_time'] for lap in laps_sorted]).to_numpy().astype('datetime64[ns]')
     
     # 2. Classification de la nature du lap basée sur la vitesse (avg_speed_kmh)
+    lap_natures = np.full(len(laps_sorted) + 1, 'Unknown', dtype=object)
     
     # Création du DataFrame de résumé des laps à partir des messages 'lap'
     df_lap_summary = pd.DataFrame(laps_sorted)
@@ -243,42 +317,40 @@ def add_lap_info(fitfile, df):
         # 2.B. Classer les laps
         df_lap_summary = classify_lap_nature_by_speed(df_lap_summary)
         
-        # 2.C. Fusionner la nature du lap (lap_nature) dans le DF des records (df)
-        df_nature = df_lap_summary[['lap_number', 'lap_nature']].copy()
-        
-        df = df.drop(columns=['lap_nature'], errors='ignore') 
-        df = df.merge(df_nature, on='lap_number', how='left')
+        # 2.C. Table lap_number -> nature
+        lap_natures[df_lap_summary['lap_number'].to_numpy()] = df_lap_summary['lap_nature'].fillna('Unknown').to_numpy()
+    # else: 'avg_speed' non trouvé dans les messages 'lap', tous les laps restent 'Unknown'
         
-        df['lap_nature'] = df['lap_nature'].fillna('Unknown')
-    else:
-        # print("Avertissement: 'avg_speed' non trouvé dans les messages 'lap'. Classification de 'lap_nature' impossible.") # Commenté
-        df['lap_nature'] = 'Unknown'
-        
-    return df
+    return lap_starts, lap_natures
 
-def export_lap_csv(fitfile, output_path):
+def assign_lap_numbers(lap_starts, timestamps):
     """
-    Extrait toutes les données des messages 'lap', ajoute les colonnes de lisibilité
-    et les exporte dans le fichier activity_data_by_lap.csv.
+    Numéro de lap de chaque record, en une seule recherche dans les débuts de laps triés :
+    un record appartient au dernier lap commencé avant lui, [début du lap, début du suivant[.
+    Les records antérieurs au premier lap (ou sans timestamp) sont assignés au dernier lap.
+    """
+    timestamps = pd.Series(timestamps).to_numpy().astype('datetime64[ns]')
+    lap_numbers = np.searchsorted(lap_starts, timestamps, side='right')
+    lap_numbers[(lap_numbers == 0) | np.isnat(timestamps)] = len(lap_starts)
+    return lap_numbers.astype(np.int64)
+
+def build_lap_table(lap_messages):
+    """
+    Extrait toutes les données des messages 'lap' et ajoute les colonnes de lisibilité.
+    lap_messages : messages 'lap' collectés par collect_fit_messages.
+    Renvoie None s'il n'y a aucun lap.
     """
-    laps = []
     
-    columns_to_drop = [
-        "avg_cadence_position", "avg_combined_pedal_smoothness", "avg_fractional_cadence", "avg_left_pco", "avg_left_pedal_smoothness", "enhanced_avg_speed", "enhanced_max_speed", "total_ascent", "avg_left_power_phase", "avg_left_power_phase_peak", "avg_left_torque_effectiveness", "avg_power", "avg_power_position", "avg_right_pco", "avg_right_pedal_smoothness", "avg_right_power_phase", "avg_right_power_phase_peak", "avg_right_torque_effectiveness", "avg_stroke_distance", "end_position_lat", "end_position_long", "event_group", "event", "event_type", "first_length_index", "intensity", "lap_trigger", "left_right_balance", "max_cadence_position", "max_fractional_cadence", "max_power", "max_power_position", "max_running_cadence", "max_temperature", "message_index", "normalized_power", "num_active_lengths", "num_lengths", "sport", "stand_count", "start_position_lat", "start_position_long", "sub_sport", "swim_stroke", "time_standing", "total_calories", "total_descent", "total_fat_calories", "total_fractional_cycles", "total_work", "wkt_step_index", "unknown_124", "unknown_125", "unknown_126", "unknown_27", "unknown_28", "unknown_29", "unknown_30", "unknown_70", "unknown_72", "unknown_73", "unknown_90", "unknown_96", "unknown_97", "avg_speed", "max_speed", "start_time", "lap_duration_min_sec", "timestamp", "total_elapsed_time_min_sec"
-        ]
+    columns_to_drop = LAP_FIELDS_EXCLUDED + ["avg_speed", "max_speed", "start_time", "lap_duration_min_sec", "total_elapsed_time_min_sec"]
 
     # Parcourir les messages 'lap'
-    for lap_num, lap in enumerate(fitfile.get_messages('lap'), 1):
-        lap_data = {"lap_number": lap_num}
-        for field in lap:
-            lap_data[field.name] = field.value
-        laps.append(lap_data)
+    laps = [{"lap_number": lap_num, **lap} for lap_num, lap in enumerate(lap_messages, 1)]
 
     if not laps:
         # print("Avertissement: Aucun lap trouvé pour l'exportation par lap.") # Commenté
         return None
 
-    df_laps = pd.DataFrame(laps)
+    df_laps = build_compact_frame(laps, 'lap', LAP_CONVERTED_FIELDS)
     
     if 'total_timer_time' in df_laps.columns:
         df_laps = df_laps.rename(columns={"total_timer_time": "lap_duration"})
@@ -297,8 +369,14 @@ def export_lap_csv(fitfile, output_path):
         
     # Conversion du cycle de la cadence en ppm
     if 'avg_running_cadence' in df_laps.columns:
-        df_laps['avg_running_cadence_step_per_min'] = df_laps['avg_running_cadence'] * 2
+        df_laps['avg_running_cadence_step_per_min'] = compact_column(
+            df_laps['avg_running_cadence'] * 2, LAP_DERIVED_DTYPES['avg_running_cadence_step_per_min'])
         df_laps = df_laps.drop(columns=['avg_running_cadence'], errors='ignore')
+
+    # Types compacts des colonnes calculées (après la classification, faite sur les vitesses en float64)
+    for col in ['avg_speed_kmh', 'max_speed_kmh', 'lap_nature']:
+        if col in df_laps.columns:
+            df_laps[col] = compact_column(df_laps[col], LAP_DERIVED_DTYPES[col])
     
     # Suppression des colonnes indésirables
     df_laps = df_laps.drop(columns=columns_to_drop, errors='ignore')
@@ -306,7 +384,7 @@ def export_lap_csv(fitfile, output_path):
     # Ajout des colonnes de temps formaté (MM:SS)
     for time_col in ['lap_duration', 'total_elapsed_time']:
         if time_col in df_laps.columns:
-            df_laps[f'{time_col}_min_sec'] = df_laps[time_col].apply(format_seconds_to_min_sec)
+            df_laps[f'{time_col}_min_sec'] = format_seconds_column_min_sec(df_laps[time_col])
 
     # Réorganisation des colonnes principales
     col_order_priority = [
@@ -334,63 +412,639 @@ def export_lap_csv(fitfile, output_path):
     new_column_order = existing_priority_cols + sorted(remaining_cols)
     
     df_laps = df_laps.reindex(columns=new_column_order)
+    return df_laps
+
+def export_lap_csv(lap_messages, output_path):
+    """
+    Construit la table des laps (build_lap_table) et l'exporte dans le fichier CSV output_path.
+    """
+    df_laps = build_lap_table(lap_messages)
+    if df_laps is None:
+        return None
 
     # Export CSV
     output_path.parent.mkdir(parents=True, exist_ok=True)
     df_laps.to_csv(output_path, index=False)
     return df_laps
 
-def main():
-    # Deux arguments sont maintenant attendus : le chemin du fichier FIT et le chemin du dossier de sortie
-    if len(sys.argv) < 3:
-        # Renvoie un message JSON pour que Node.js puisse le lire
-        error_msg = {"status": "error", "message": "Usage: python extract_fit.py path/to/file.fit path/to/output_dir/"}
-        print(json.dumps(error_msg))
-        sys.exit(1)
-    
-    fit_file_path = Path(sys.argv[1])
-    output_dir = Path(sys.argv[2])
+class UnorderedRecordsError(Exception):
+    """Records hors de l'ordre chronologique ou sans timestamp : le tri global de parse_fit impose le mode en mémoire."""
+
+def iter_record_chunks(fit_file_path, lap_messages, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Décode le fichier FIT en un seul passage et génère les records par blocs de chunk_size dictionnaires.
+    Les messages 'lap' (quelques-uns par activité) sont ajoutés au fur et à mesure à lap_messages.
+    """
+    rows = []
+    for name, message in stream_fit_messages(fit_file_path, EXTRACTED_MESSAGES, FIT_FIELD_SELECTION):
+        if name == 'lap':
+            lap_messages.append(message)
+            continue
+        rows.append(message)
+        if len(rows) == chunk_size:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+def prepare_record_chunk(rows, carry, timings=None):
+    """
+    Étapes de parse_fit indépendantes des laps, sur un bloc de records : temps écoulé,
+    conversions d'unités, temps de déplacement et temps formaté.
+    carry : état reporté d'un bloc au suivant (premier et dernier timestamp, état du temps de déplacement),
+    mis à jour sur place. UnorderedRecordsError si les records ne sont pas dans l'ordre chronologique.
+    """
+    with timed_stage(timings, 'dataframe_build'):
+        df = build_compact_frame(rows, 'record', RECORD_CONVERTED_FIELDS)
+        if 'timestamp' not in df.columns:
+            raise UnorderedRecordsError("records sans timestamp")
+
+        # Champ sans aucune valeur dans ce bloc : valeurs manquantes numériques, comme dans le DataFrame complet
+        for col in df.columns[df.isna().all().to_numpy()]:
+            if df[col].dtype == object:
+                df[col] = df[col].astype(np.float64)
+
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        timestamps = df['timestamp']
+        if timestamps.isna().any() or not timestamps.is_monotonic_increasing or \
+                ('last_timestamp' in carry and timestamps.iloc[0] < carry['last_timestamp']):
+            raise UnorderedRecordsError("records hors de l'ordre chronologique")
+        carry.setdefault('first_timestamp', timestamps.iloc[0])
+        carry['last_timestamp'] = timestamps.iloc[-1]
+        df['elapsed_time_s'] = (timestamps - carry['first_timestamp']).dt.total_seconds()
+
+    with timed_stage(timings, 'unit_conversion'):
+        df = convert_record_units(df)
+
+    # Un bloc sans distance compte comme une distance manquante (comme dans le DataFrame complet)
+    with timed_stage(timings, 'moving_time'):
+        distance = df['distance'] if 'distance' in df.columns else pd.Series(np.nan, index=df.index)
+        df['moving_elapsed_time_s'] = moving_elapsed_time(df['elapsed_time_s'], distance, carry)
+    with timed_stage(timings, 'format_min_sec'):
+        df['elapsed_time_min_sec'] = format_seconds_column_min_sec(df['moving_elapsed_time_s'])
+    return df
+
+def _update_column_stats(column_stats, df):
+    """Types et valeurs manquantes de chaque colonne, pour retrouver les types du DataFrame complet."""
+    for col in df.columns:
+        stats = column_stats.setdefault(col, {'chunks': 0, 'dtypes': set(), 'has_missing': False, 'example': None})
+        values = df[col]
+        not_missing = values.notna()
+        stats['chunks'] += 1
+        if not_missing.any():
+            stats['dtypes'].add(values.dtype)
+            if stats['example'] is None:
+                stats['example'] = values[not_missing].iloc[:1].reset_index(drop=True)
+        if not not_missing.all():
+            stats['has_missing'] = True
+
+def _record_schema_dtype(col):
+    """Type compact d'une colonne de records (cf. compact_schema), None si son type est inféré."""
+    if col in RECORD_DERIVED_DTYPES:
+        return RECORD_DERIVED_DTYPES[col]
+    if col in RECORD_CONVERTED_FIELDS:
+        return RECORD_CONVERTED_FIELDS[col]
+    return fit_field_dtype('record', col)
+
+def _combined_dtype(stats, n_chunks, schema_dtype=None):
+    """
+    Type qu'aurait la colonne dans le DataFrame complet : type du schéma compact si tous les blocs
+    l'ont pris, sinon type inféré (entiers avec valeurs manquantes -> float64, entiers et flottants
+    -> float64, types incompatibles -> object).
+    """
+    dtypes = stats['dtypes']
+    has_missing = stats['has_missing'] or stats['chunks'] < n_chunks
+    if schema_dtype is not None and all(dtype == schema_dtype for dtype in dtypes):
+        return schema_dtype
+    if not dtypes:
+        return np.dtype(object)
+    if all(dtype.kind in 'iuf' for dtype in dtypes):
+        dtype = next(iter(dtypes))
+        if len(dtypes) == 1 and isinstance(dtype, np.dtype) and not (has_missing and dtype.kind in 'iu'):
+            return dtype
+        # Blocs dans le type compact et blocs dans le type inféré (valeurs hors bornes)
+        if has_missing or any(dtype.kind == 'f' for dtype in dtypes):
+            return np.dtype(np.float64)
+        return np.dtype(np.int64)
+    if len(dtypes) == 1:
+        dtype = next(iter(dtypes))
+        return np.dtype(object) if has_missing and dtype.kind == 'b' else dtype
+    return np.dtype(object)
+
+def _update_timestamp_stats(timestamp_stats, timestamps):
+    """Fractions de seconde et dates sans heure dans un bloc de timestamps (cf. _csv_date_format)."""
+    timestamp_stats['fractional'] |= bool((timestamps != timestamps.dt.floor('s')).any())
+    timestamp_stats['dates_only'] &= bool((timestamps == timestamps.dt.normalize()).all())
+
+def _record_table_schema(column_stats, n_chunks):
+    """
+    Colonnes, types et échantillon de schéma (cf. TableStreamWriter) de la table complète des records,
+    d'après les statistiques des n_chunks blocs (cf. _update_column_stats).
+
+    Returns:
+        tuple: (colonnes dans l'ordre de la table, type de chaque colonne, schema_sample).
+    """
+    columns_to_drop = RECORD_FIELDS_EXCLUDED + ["speed", "cadence"]
+    dtypes = {col: _combined_dtype(stats, n_chunks, _record_schema_dtype(col))
+              for col, stats in column_stats.items() if col not in columns_to_drop}
+    dtypes.update(lap_number=RECORD_DERIVED_DTYPES['lap_number'], lap_nature=LAP_NATURE_DTYPE,
+                  elapsed_time_in_lap_s=np.dtype(np.float64))
+    columns = order_record_columns(list(dtypes))
+    examples = {col: stats['example'] for col, stats in column_stats.items() if stats['example'] is not None}
+    examples.update(lap_number=pd.Series([1]), lap_nature=pd.Series(['Unknown']), elapsed_time_in_lap_s=pd.Series([0.0]))
+    schema_sample = pd.DataFrame({col: examples.get(col, pd.Series([None])).astype(dtypes[col]) for col in columns})
+    return columns, dtypes, schema_sample
+
+def _csv_date_format(timestamp_stats):
+    """Format des dates du CSV, choisi par pandas sur la colonne complète en mode en mémoire."""
+    if timestamp_stats['fractional']:
+        return None
+    return '%Y-%m-%d' if timestamp_stats['dates_only'] else '%Y-%m-%d %H:%M:%S'
+
+def stream_records(fit_file_path, output_base_records, formats=DEFAULT_OUTPUT_FORMATS, chunk_size=STREAM_CHUNK_SIZE,
+                   timings=None):
+    """
+    Extraction des records en mémoire bornée : mêmes fichiers que parse_fit + write_tables, mais le
+    fichier FIT est traité par blocs de chunk_size records, sans jamais matérialiser toute l'activité.
+
+    1er passage (décodage) : chaque bloc reçoit les colonnes indépendantes des laps (l'état nécessaire
+    au temps écoulé et au temps de déplacement est reporté d'un bloc au suivant) et est mis de côté
+    sur disque ; les laps, écrits dans le fichier FIT après leurs records, sont collectés.
+    2e passage : chaque bloc reçoit son lap et le temps écoulé dans le lap, prend les colonnes et les
+    types de la table complète, puis est ajouté aux fichiers de sortie.
+
+    timings (StageTimings | None) : durées cumulées sur tous les blocs ; 'record_decode' inclut
+    l'ouverture du fichier FIT (décodage paresseux), 'chunk_spill' la mise de côté sur disque.
+
+    Returns:
+        tuple: (format -> chemin du fichier de records, messages 'lap').
+        UnorderedRecordsError si les records ne sont pas dans l'ordre chronologique.
+    """
+    columns_to_drop = RECORD_FIELDS_EXCLUDED + ["speed", "cadence"]
+    output_base_records = Path(output_base_records)
+    output_base_records.parent.mkdir(parents=True, exist_ok=True)
+
+    lap_messages = []
+    carry = {}
+    column_stats = {}
+    timestamp_stats = {'fractional': False, 'dates_only': True}
+    with tempfile.TemporaryDirectory(prefix=f".{output_base_records.name}_", dir=output_base_records.parent) as tmp_dir:
+        # 1. Décodage et traitement bloc par bloc
+        chunk_paths = []
+        n_records = 0
+        chunks = iter_record_chunks(fit_file_path, lap_messages, chunk_size)
+        while True:
+            with timed_stage(timings, 'record_decode'):
+                rows = next(chunks, None)
+            if rows is None:
+                break
+            df = prepare_record_chunk(rows, carry, timings)
+            del rows
+            n_records += len(df)
+            with timed_stage(timings, 'chunk_spill'):
+                _update_column_stats(column_stats, df)
+                _update_timestamp_stats(timestamp_stats, df['timestamp'])
+
+                chunk_path = Path(tmp_dir) / f"{len(chunk_paths):06d}.pkl"
+                df.to_pickle(chunk_path)
+                chunk_paths.append(chunk_path)
+        if timings is not None:
+            timings.count('records', n_records)
+
+        if not chunk_paths:
+            raise RuntimeError("Aucun record trouvé dans le fichier .fit")
+        if 'distance' not in column_stats:
+            raise RuntimeError("Aucune distance dans les records : temps de déplacement impossible")
+
+        # 2. Colonnes et types de la table complète
+        columns, dtypes, schema_sample = _record_table_schema(column_stats, len(chunk_paths))
+
+        # 3. Laps, temps écoulé dans le lap et écriture bloc par bloc
+        lap_index = build_lap_index(lap_messages)
+        n_laps = 1 if lap_index is None else len(lap_index[0])
+        # Temps écoulé au début de chaque lap : celui de son premier record (records dans l'ordre chronologique)
+        lap_start_elapsed = np.full(n_laps + 1, np.nan)
+        with TableStreamWriter(output_base_records, formats, schema_sample=schema_sample,
+                               csv_date_format=_csv_date_format(timestamp_stats)) as writer:
+            for chunk_path in chunk_paths:
+                with timed_stage(timings, 'chunk_spill'):
+                    df = pd.read_pickle(chunk_path)
+                with timed_stage(timings, 'add_lap_info'):
+                    if lap_index is None:
+                        lap_numbers = np.ones(len(df), dtype=np.int64)
+                        df['lap_number'] = lap_numbers
+                        df['lap_nature'] = 'Unknown'
+                    else:
+                        lap_numbers = assign_lap_numbers(lap_index[0], df['timestamp'])
+                        df['lap_number'] = lap_numbers
+                        df['lap_nature'] = lap_index[1][lap_numbers]
+
+                with timed_stage(timings, 'elapsed_time_in_lap'):
+                    elapsed_time_s = df['elapsed_time_s'].to_numpy()
+                    chunk_laps, first_positions = np.unique(lap_numbers, return_index=True)
+                    new_laps = np.isnan(lap_start_elapsed[chunk_laps])
+                    lap_start_elapsed[chunk_laps[new_laps]] = elapsed_time_s[first_positions[new_laps]]
+                    df['elapsed_time_in_lap_s'] = np.round(elapsed_time_s - lap_start_elapsed[lap_numbers], 1)
+
+                with timed_stage(timings, 'column_cleanup'):
+                    df = df.drop(columns=columns_to_drop, errors='ignore').reindex(columns=columns)
+                    for col, dtype in dtypes.items():
+                        if df[col].dtype != dtype:
+                            df[col] = df[col].astype(dtype)
+                with timed_stage(timings, 'records_write'):
+                    writer.write(df)
+                chunk_path.unlink()
+            with timed_stage(timings, 'records_write'):
+                records_paths = writer.close()
+
+    return records_paths, lap_messages
+
+def pipeline_parameters():
+    """Paramètres qui déterminent le contenu des fichiers produits (partie de la clé du cache)."""
+    return {
+        "pipeline_version": PIPELINE_VERSION,
+        "ms_to_kmh": MS_TO_KMH,
+        "pause_time_threshold_s": PAUSE_TIME_THRESHOLD_S,
+        "pause_distance_threshold_m": PAUSE_DISTANCE_THRESHOLD_M,
+        "intensity_speed_threshold": INTENSITY_SPEED_THRESHOLD,
+        "recovery_speed_threshold": RECOVERY_SPEED_THRESHOLD,
+    }
+
+def _success_result(formats, records_paths, laps_paths, output_base_laps, cached):
+    result = {
+        "status": "success",
+        "message": f"Fichiers {', '.join(fmt.upper() for fmt in formats)} générés avec succès.",
+        "records_paths": records_paths,
+        "laps_paths": laps_paths,
+        "cached": cached
+    }
+    if 'csv' in formats:
+        result["records_csv_path"] = records_paths['csv']
+        result["laps_csv_path"] = laps_paths.get('csv', str(output_base_laps) + '.csv')
+    return result
+
+def _store_activity(store, output_dir, fit_file_path, fit_sha256, records, df_laps, timings):
+    """
+    Ajoute l'activité à l'historique local (cf. activity_store) ; records : DataFrame ou blocs.
+    Une erreur de la base n'annule pas l'extraction : elle est rapportée dans "store_error".
+    """
+    store_path = activity_store.default_store_path(output_dir) if store is True else Path(store)
+    try:
+        with timed_stage(timings, 'store_insert'):
+            with activity_store.ActivityStore(store_path) as activities:
+                activity_id = activities.add_activity(fit_sha256 or result_cache.file_sha256(fit_file_path),
+                                                      records, df_laps, fit_file=fit_file_path.name,
+                                                      pipeline_version=PIPELINE_VERSION)
+    except Exception as e:
+        return {"store_path": str(store_path), "store_error": f"Activité non enregistrée dans l'historique: {e}"}
+    return {"store_path": str(store_path), "activity_id": activity_id}
+
+def _store_cached_activity(store, output_dir, fit_file_path, fit_sha256, cached, timings):
+    """Historique local à partir des fichiers du cache, si l'activité n'y est pas déjà (même version du pipeline)."""
+    store_path = activity_store.default_store_path(output_dir) if store is True else Path(store)
+    if store_path.exists():
+        try:
+            with activity_store.ActivityStore(store_path) as activities:
+                activity_id = activities.find_activity(fit_sha256, PIPELINE_VERSION)
+        except Exception:
+            activity_id = None
+        if activity_id is not None:
+            return {"store_path": str(store_path), "activity_id": activity_id}
+
+    df_laps = pd.concat(iter_table_chunks(cached['laps_paths'])) if cached['laps_paths'] else None
+    return _store_activity(store_path, output_dir, fit_file_path, fit_sha256,
+                           iter_table_chunks(cached['records_paths']), df_laps, timings)
+
+def process_fit_file(fit_file_path, output_dir, engine='fitparse', formats=DEFAULT_OUTPUT_FORMATS, use_cache=True,
+                     stream=False, chunk_size=STREAM_CHUNK_SIZE, timings=False, profile=False, store=None, sidecars=()):
+    """
+    Traite un fichier FIT et exporte les tables de records et de laps.
+    engine : moteur de décodage ('fitparse', 'numpy' ou 'mmap', cf. fit_messages.load_fit_messages).
+    formats : formats de sortie ('csv', 'parquet', 'arrow', cf. table_outputs).
+    use_cache : si le même contenu FIT a déjà été traité avec les mêmes paramètres,
+    les fichiers existants sont renvoyés sans décoder le fichier (cf. result_cache).
+    stream : extraction en mémoire bornée par blocs de chunk_size records (cf. stream_records, moteur fitparse) ;
+    les fichiers produits sont identiques. Si les records ne sont pas dans l'ordre chronologique,
+    le traitement se fait en mémoire.
+    timings : ajoute au résultat la clé "timings" (durée de chaque étape, nombres de records et de laps).
+    profile : profile le traitement avec cProfile et écrit <nom>_profile.pstats dans output_dir
+    (chemin renvoyé dans "profile_path", lisible avec pstats ou snakeviz).
+    store : ajoute l'activité (résumé, laps, records) à l'historique local SQLite (cf. activity_store) :
+    chemin de la base, ou True pour <output_dir>/activities.sqlite ; l'identifiant de l'activité est
+    renvoyé dans "activity_id" (ou l'erreur dans "store_error", sans faire échouer l'extraction).
+    sidecars : fichiers annexes calculés sur les records (ex: ('chart_series',), cf. sidecars.SIDECARS),
+    chemins renvoyés dans "sidecar_paths".
+    Renvoie le dictionnaire de résultat (succès ou erreur) attendu par Node.js.
+    """
+    stage_timings = StageTimings() if timings else None
+    profiler = cProfile.Profile() if profile else None
+
+    if profiler is not None:
+        profiler.enable()
+    try:
+        result = _process_fit_file(fit_file_path, output_dir, engine, formats, use_cache, stream, chunk_size,
+                                   stage_timings, store, sidecars)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+
+    if stage_timings is not None:
+        result["timings"] = stage_timings.as_dict()
+    if profiler is not None:
+        profile_path = Path(output_dir) / f"{Path(fit_file_path).stem}_profile.pstats"
+        try:
+            profile_path.parent.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(profile_path)
+            result["profile_path"] = str(profile_path)
+        except OSError as e:
+            result["profile_error"] = f"Profil non écrit: {e}"
+    return result
+
+def _process_fit_file(fit_file_path, output_dir, engine, formats, use_cache, stream, chunk_size, timings, store,
+                      sidecars):
+    """Traitement de process_fit_file (timings : StageTimings ou None)."""
+    fit_file_path = Path(fit_file_path)
+    output_dir = Path(output_dir)
     
     # Création de noms de fichiers uniques (basés sur le nom du fichier FIT, sans l'extension)
     file_stem = fit_file_path.stem 
-    output_path_records_csv = output_dir / f"{file_stem}_records.csv"
-    output_path_laps_csv = output_dir / f"{file_stem}_laps.csv"
+    output_base_records = output_dir / f"{file_stem}_records"
+    output_base_laps = output_dir / f"{file_stem}_laps"
 
     try:
-        ff = FitFile(str(fit_file_path))
-        
-        # 1. Traitement et export du fichier de RECORDS 
-        df = parse_fit(ff)
+        formats = parse_output_formats(formats)
+        sidecars = parse_sidecars(sidecars)
+        if stream and engine != 'fitparse':
+            raise ValueError("le mode streaming décode avec le moteur fitparse")
+        if stream and chunk_size < 1:
+            raise ValueError("chunk_size doit être >= 1")
 
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Export CSV des records
-        df.to_csv(output_path_records_csv, index=False)
+        # 0. Cache adressé par le contenu : fichiers déjà produits pour ce contenu FIT et ces paramètres ?
+        cache_key = None
+        fit_sha256 = None
+        if use_cache:
+            with timed_stage(timings, 'cache_lookup'):
+                fit_sha256 = result_cache.file_sha256(fit_file_path)
+                cache_key = result_cache.cache_key(fit_sha256, pipeline_parameters())
+                cached = result_cache.lookup(output_dir, cache_key, formats)
+            if cached is not None:
+                result = _success_result(formats, cached['records_paths'], cached['laps_paths'], output_base_laps,
+                                         cached=True)
+                if sidecars:
+                    result["sidecar_paths"] = write_sidecars(sidecars, cached['records_paths'], timings=timings,
+                                                             reuse=True, schema=_record_schema_dtype)
+                if store:
+                    result.update(_store_cached_activity(store, output_dir, fit_file_path, fit_sha256, cached, timings))
+                return result
+
+        streamed = False
+        if stream:
+            # 1. Traitement et export du fichier de RECORDS par blocs (mémoire bornée)
+            try:
+                records_paths, lap_messages = stream_records(fit_file_path, output_base_records, formats, chunk_size,
+                                                             timings)
+                streamed = True
+            except UnorderedRecordsError:
+                # Les records doivent être triés sur toute l'activité : repli sur le traitement en mémoire
+                pass
+
+        if not streamed:
+            # Décodage unique du fichier : records et laps collectés en un seul passage (champs inutiles non décodés)
+            fit_messages = load_fit_messages(fit_file_path, message_names=EXTRACTED_MESSAGES,
+                                             engine=engine, field_selection=FIT_FIELD_SELECTION, timings=timings)
+            lap_messages = fit_messages['lap']
+            
+            # 1. Traitement et export du fichier de RECORDS 
+            df = parse_fit(fit_messages, timings)
+            if timings is not None:
+                timings.count('records', len(df))
+
+            output_dir.mkdir(parents=True, exist_ok=True)
+            
+            # Export des records (CSV et/ou Parquet / Arrow)
+            with timed_stage(timings, 'records_write'):
+                records_paths = write_tables(df, output_base_records, formats)
         
         # 2. Traitement et export du fichier de LAPS
-        export_lap_csv(ff, output_path_laps_csv)
+        with timed_stage(timings, 'laps_export'):
+            df_laps = build_lap_table(lap_messages)
+            laps_paths = write_tables(df_laps, output_base_laps, formats) if df_laps is not None else {}
+        if timings is not None:
+            timings.count('laps', len(lap_messages))
+
+        if cache_key is not None:
+            with timed_stage(timings, 'cache_store'):
+                result_cache.store(output_dir, cache_key, records_paths, laps_paths,
+                                   fit_sha256=fit_sha256, fit_file=fit_file_path.name, parameters=pipeline_parameters())
 
         # 3. Renvoyer les chemins des fichiers en JSON pour Node.js
-        result = {
-            "status": "success",
-            "message": "Fichiers CSV générés avec succès.",
-            "records_csv_path": str(output_path_records_csv),
-            "laps_csv_path": str(output_path_laps_csv)
-        }
-        print(json.dumps(result))
+        result = _success_result(formats, records_paths, laps_paths, output_base_laps, cached=False)
+        if stream:
+            result["streamed"] = streamed
+
+        # 4. Fichiers annexes calculés sur les records (relus depuis les fichiers écrits en mode streaming)
+        if sidecars:
+            result["sidecar_paths"] = write_sidecars(sidecars, records_paths, None if streamed else df, timings,
+                                                     schema=_record_schema_dtype)
+
+        # 5. Historique local des activités (records relus depuis les fichiers écrits en mode streaming)
+        if store:
+            records = iter_table_chunks(records_paths, chunk_size) if streamed else df
+            result.update(_store_activity(store, output_dir, fit_file_path, fit_sha256, records, df_laps, timings))
+        return result
 
     except FileNotFoundError:
-        error_msg = {"status": "error", "message": f"Erreur: Fichier FIT non trouvé à l'emplacement '{fit_file_path}'"}
-        print(json.dumps(error_msg))
-        sys.exit(1)
+        return {"status": "error", "message": f"Erreur: Fichier FIT non trouvé à l'emplacement '{fit_file_path}'"}
     except RuntimeError as e:
-        error_msg = {"status": "error", "message": f"Erreur de traitement du fichier .fit: {e}"}
-        print(json.dumps(error_msg))
-        sys.exit(1)
+        return {"status": "error", "message": f"Erreur de traitement du fichier .fit: {e}"}
     except Exception as e:
-        error_msg = {"status": "error", "message": f"Une erreur inattendue s'est produite: {e}"}
+        return {"status": "error", "message": f"Une erreur inattendue s'est produite: {e}"}
+
+def run_worker(input_stream=None, output_stream=None):
+    """
+    Mode worker persistant : les imports (pandas, numpy, fitparse) ne sont payés qu'une fois.
+    Chaque ligne reçue est un job JSON {"job_id", "fit_file_path", "output_dir", "options"} ;
+    "options" (facultatif) est passé tel quel à process_fit_file (ex: {"engine": "numpy"}).
+    Chaque réponse est le JSON de résultat de process_fit_file (+ job_id), sur une ligne.
+    """
+    input_stream = input_stream or sys.stdin
+    output_stream = output_stream or sys.stdout
+
+    for line in input_stream:
+        line = line.strip()
+        if not line:
+            continue
+
+        job_id = None
+        try:
+            job = json.loads(line)
+            job_id = job.get("job_id")
+            fit_file_path, output_dir = job["fit_file_path"], job["output_dir"]
+            options = dict(job.get("options") or {})
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            result = {"status": "error", "message": f"Job invalide: {e}"}
+        else:
+            # Les print() du traitement ne doivent pas polluer le protocole sur stdout
+            with contextlib.redirect_stdout(sys.stderr):
+                try:
+                    result = process_fit_file(fit_file_path, output_dir, **options)
+                except TypeError as e:
+                    result = {"status": "error", "message": f"Options de job invalides: {e}"}
+
+        result["job_id"] = job_id
+        output_stream.write(json.dumps(result) + "\n")
+        output_stream.flush()
+
+def expand_fit_inputs(fit_input):
+    """
+    Liste des fichiers FIT d'un dossier (fichiers *.fit, non récursif), d'un motif glob ou d'un fichier unique.
+    """
+    path = Path(fit_input)
+    if path.is_dir():
+        return sorted(p for p in path.iterdir() if p.is_file() and p.suffix.lower() == '.fit')
+    return sorted(Path(p) for p in glob.glob(str(fit_input), recursive=True) if Path(p).is_file())
+
+def _run_batch_job(fit_file_path, output_dir, options):
+    """Traite un fichier dans un processus du pool ; les print() du traitement vont sur stderr."""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stderr):
+        result = process_fit_file(fit_file_path, output_dir, **options)
+    result["duration_s"] = round(time.perf_counter() - start, 3)
+    return result
+
+def run_batch(fit_input, output_dir, jobs=None, manifest_path=None, **options):
+    """
+    Traite tous les fichiers FIT d'un dossier ou d'un motif glob sur un pool de processus.
+    Les erreurs sont isolées par fichier et rapportées comme par main() (JSON de process_fit_file).
+    options : passées à process_fit_file (engine, formats, use_cache, stream, chunk_size, timings, profile, store,
+    sidecars).
+
+    Écrit un manifeste JSON (par défaut <output_dir>/batch_manifest.json) avec, pour chaque
+    fichier, son statut, les chemins produits et la durée de traitement, et renvoie ce manifeste.
+    """
+    output_dir = Path(output_dir)
+    manifest_path = Path(manifest_path) if manifest_path else output_dir / "batch_manifest.json"
+    jobs = jobs or os.cpu_count() or 1
+    fit_files = expand_fit_inputs(fit_input)
+
+    start = time.perf_counter()
+    entries = {}
+    seen_stems = {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {}
+        for fit_file in fit_files:
+            # Deux fichiers de même nom écriraient dans les mêmes fichiers de sortie
+            if fit_file.stem in seen_stems:
+                entries[fit_file] = {"status": "error", "message": f"Nom de sortie déjà utilisé par '{seen_stems[fit_file.stem]}'"}
+                continue
+            seen_stems[fit_file.stem] = fit_file
+            futures[pool.submit(_run_batch_job, str(fit_file), str(output_dir), options)] = fit_file
+
+        for future in as_completed(futures):
+            try:
+                entries[futures[future]] = future.result()
+            except Exception as e:
+                # Processus du pool arrêté brutalement, options invalides...
+                entries[futures[future]] = {"status": "error", "message": f"Une erreur inattendue s'est produite: {e}"}
+    duration_s = time.perf_counter() - start
+
+    files = [{"fit_file_path": str(fit_file), **entries[fit_file]} for fit_file in fit_files]
+    succeeded = sum(1 for entry in files if entry["status"] == "success")
+    manifest = {
+        "status": "success" if files and succeeded == len(files) else "error",
+        "fit_input": str(fit_input),
+        "output_dir": str(output_dir),
+        "jobs": jobs,
+        "options": options,
+        "files_total": len(files),
+        "files_succeeded": succeeded,
+        "files_failed": len(files) - succeeded,
+        "files_cached": sum(1 for entry in files if entry.get("cached")),
+        "duration_s": round(duration_s, 3),
+        "files_per_s": round(len(files) / duration_s, 3) if duration_s > 0 else None,
+        "files": files,
+    }
+
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=4)
+    manifest["manifest_path"] = str(manifest_path)
+    return manifest
+
+class _JsonArgumentParser(argparse.ArgumentParser):
+    """ArgumentParser qui laisse main() renvoyer les erreurs d'usage en JSON (lu par Node.js)."""
+    def error(self, message):
+        raise ValueError(message)
+
+def build_arg_parser():
+    parser = _JsonArgumentParser(prog="extract_fit_file.py", add_help=False)
+    parser.add_argument("fit_file_path", nargs="?")
+    parser.add_argument("output_dir", nargs="?")
+    parser.add_argument("--worker", action="store_true")
+    parser.add_argument("--batch", action="store_true")
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--manifest", default=None)
+    parser.add_argument("--engine", choices=DECODER_ENGINES, default="fitparse")
+    parser.add_argument("--format", dest="formats", default=",".join(DEFAULT_OUTPUT_FORMATS))
+    parser.add_argument("--no-cache", dest="use_cache", action="store_false")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--chunk-size", type=int, default=STREAM_CHUNK_SIZE)
+    parser.add_argument("--timings", action="store_true")
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--store", nargs="?", const=True, default=None)
+    parser.add_argument("--sidecars", default="")
+    return parser
+
+def main():
+    usage = (f"Usage: python extract_fit.py path/to/file.fit path/to/output_dir/ [--engine {'|'.join(DECODER_ENGINES)}] "
+             f"[--format {','.join(OUTPUT_FORMATS)}] [--no-cache] [--stream [--chunk-size N]] [--timings] [--profile] [--store [activities.sqlite]] "
+             f"[--sidecars {','.join(SIDECARS)}] (ou --worker, "
+             f"ou --batch path/to/dir_ou_glob path/to/output_dir/ [--jobs N] [--manifest manifest.json])")
+    try:
+        args = build_arg_parser().parse_args()
+        # Deux arguments sont attendus hors mode worker : le chemin du fichier FIT et le chemin du dossier de sortie
+        if not args.worker and args.output_dir is None:
+            raise ValueError("arguments manquants")
+        formats = parse_output_formats(args.formats)
+        sidecars = parse_sidecars(args.sidecars)
+        if args.jobs is not None and args.jobs < 1:
+            raise ValueError("--jobs doit être >= 1")
+        if args.chunk_size < 1:
+            raise ValueError("--chunk-size doit être >= 1")
+        if args.stream and args.engine != 'fitparse':
+            raise ValueError("--stream décode avec le moteur fitparse")
+    except ValueError as e:
+        # Renvoie un message JSON pour que Node.js puisse le lire
+        error_msg = {"status": "error", "message": f"{usage} ({e})"}
         print(json.dumps(error_msg))
         sys.exit(1)
 
+    if args.worker:
+        run_worker()
+        return
+
+    if args.batch:
+        manifest = run_batch(args.fit_file_path, args.output_dir, jobs=args.jobs, manifest_path=args.manifest,
+                             engine=args.engine, formats=formats, use_cache=args.use_cache,
+                             stream=args.stream, chunk_size=args.chunk_size, timings=args.timings, profile=args.profile,
+                             store=args.store, sidecars=sidecars)
+        print(json.dumps({
+            "status": manifest["status"],
+            "message": (f"{manifest['files_succeeded']}/{manifest['files_total']} fichiers FIT traités avec succès."
+                        if manifest["files_total"] else f"Aucun fichier FIT trouvé pour '{args.fit_file_path}'"),
+            "manifest_path": manifest["manifest_path"]
+        }))
+        if manifest["status"] != "success":
+            sys.exit(1)
+        return
+    
+    result = process_fit_file(args.fit_file_path, args.output_dir, engine=args.engine, formats=formats,
+                              use_cache=args.use_cache, stream=args.stream, chunk_size=args.chunk_size,
+                              timings=args.timings, profile=args.profile, store=args.store,
+                              sidecars=sidecars)
+    print(json.dumps(result))
+    if result["status"] != "success":
+        sys.exit(1)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,8 +1,12 @@
 import sys
 import json
+import argparse
 from pathlib import Path
 import pandas as pd
-from fitparse import FitFile
+from fit_messages import load_fit_messages
+from time_format import format_seconds_to_hms, format_seconds_column_hms
+from compact_schema import build_compact_frame, compact_column, RECORD_DERIVED_DTYPES
+from table_outputs import write_tables, parse_output_formats, DEFAULT_OUTPUT_FORMATS, OUTPUT_FORMATS
 import numpy as np
 from datetime import datetime, timedelta
 
@@ -14,46 +18,40 @@ CADENCE_TO_SPM = 2 # 1 cycle (rpm) = 2 pas (spm)
 PAUSE_TIME_THRESHOLD_S = 10.0
 PAUSE_DISTANCE_THRESHOLD_M = 1.0
 
-# --- Fonctions utilitaires ---
-
-def format_seconds_to_hms(seconds):
-    """Convertit un nombre de secondes en format H:MM:SS ou MM:SS si < 1h."""
-    if pd.isna(seconds):
-        return None
-    total_seconds = int(seconds)
-    hours = total_seconds // 3600
-    minutes = (total_seconds % 3600) // 60
-    secs = total_seconds % 60
-    
-    if hours > 0:
-        return f"{hours}:{minutes:02d}:{secs:02d}"
-    return f"{minutes:02d}:{secs:02d}"
+# Messages et champs FIT décodés (les autres champs ne sont jamais matérialisés)
+RECORD_FIELDS_OF_INTEREST = [
+    "timestamp", "heart_rate", "enhanced_speed", "distance", 
+    "cadence", "power", "enhanced_altitude"
+]
+SESSION_SUMMARY_FIELDS = [
+    'sport', 'sub_sport', 'total_distance', 'total_elapsed_time', 'total_timer_time',
+    'max_heart_rate', 'avg_heart_rate', 'total_ascent', 'total_descent', 'timestamp'
+]
+# Champs convertis par parse_fit_records : gardés en float64 à la construction du DataFrame (cf. compact_schema)
+RECORD_CONVERTED_FIELDS = {'enhanced_speed': None, 'cadence': None}
+EXTRACTED_MESSAGES = ('record', 'session')
+FIT_FIELD_SELECTION = {
+    'record': {'include': RECORD_FIELDS_OF_INTEREST},
+    'session': {'include': SESSION_SUMMARY_FIELDS},
+}
 
 # --- Fonctions principales d'extraction et de traitement ---
 
-def parse_fit_records(fitfile):
+def parse_fit_records(fit_messages):
     """
-    Extrait et traite les messages 'record' du fichier FIT.
+    Extrait et traite les messages 'record' du fichier FIT (collectés par collect_fit_messages).
     Calcule l'elapsed time, le moving time, et convertit les unités.
     """
-    rows = []
     # Champs d'intérêt prioritaires
-    record_fields_of_interest = [
-        "timestamp", "heart_rate", "enhanced_speed", "distance", 
-        "cadence", "power", "enhanced_altitude"
-    ]
-    
-    for rec in fitfile.get_messages('record'):
-        r = {}
-        for field in rec:
-            if field.name in record_fields_of_interest:
-                r[field.name] = field.value
-        rows.append(r) 
+    rows = fit_messages['record']
         
     if not rows:
         raise RuntimeError("Aucun record trouvé dans le fichier .fit")
     
-    df = pd.DataFrame(rows)
+    # Les records peuvent être une liste de dictionnaires (fitparse) ou des colonnes (moteur NumPy),
+    # convertis dans le schéma compact à la construction du DataFrame
+    df = build_compact_frame(rows, 'record', RECORD_CONVERTED_FIELDS)
+    df = df[[col for col in df.columns if col in RECORD_FIELDS_OF_INTEREST]]
     
     # 1. Nettoyage et normalisation des données
     if 'timestamp' in df.columns:
@@ -66,7 +64,7 @@ def parse_fit_records(fitfile):
     # 2. Conversion de la vitesse m/s -> km/h
     if 'enhanced_speed' in df.columns:
         df = df.rename(columns={'enhanced_speed': 'speed_ms'})
-        df['speed_kmh'] = np.round(df['speed_ms'] * MS_TO_KMH, 2)
+        df['speed_kmh'] = compact_column(np.round(df['speed_ms'] * MS_TO_KMH, 2), RECORD_DERIVED_DTYPES['speed_kmh'])
         df = df.drop(columns=['speed_ms'], errors='ignore')
 
     # 3. Conversion de la cadence cycle/min -> pas/min (spm)
@@ -75,8 +73,8 @@ def parse_fit_records(fitfile):
         # La cadence dans les fichiers FIT peut être en rpm (révolution par minute) pour le cyclisme
         # ou en pas/minute pour la course à pied. Pour la course, 1 cycle = 2 pas.
         # On assume l'approche générique pour la course :
-        df['cadence_step_per_min'] = df['cadence_rpm'] * CADENCE_TO_SPM
-        df['cadence_step_per_min'] = df['cadence_step_per_min'].astype('Int64', errors='ignore')
+        df['cadence_step_per_min'] = compact_column(df['cadence_rpm'] * CADENCE_TO_SPM,
+                                                    RECORD_DERIVED_DTYPES['cadence_step_per_min'])
         df = df.drop(columns=['cadence_rpm'], errors='ignore')
         
     # 4. Traitement du Moving Time (Temps en mouvement)
@@ -102,7 +100,7 @@ def parse_fit_records(fitfile):
 
     # 5. Colonne de temps formaté (H:MM:SS ou MM:SS)
     if 'moving_elapsed_time_s' in df.columns:
-        df['elapsed_time_hms'] = df['moving_elapsed_time_s'].apply(format_seconds_to_hms)
+        df['elapsed_time_hms'] = format_seconds_column_hms(df['moving_elapsed_time_s'])
     
     # 6. Renommage et réorganisation
     if 'enhanced_altitude' in df.columns:
@@ -121,12 +119,12 @@ def parse_fit_records(fitfile):
     
     return df
 
-def extract_activity_summary(fitfile):
+def extract_activity_summary(fit_messages):
     """
-    Extrait les messages 'session' pour obtenir un résumé de l'activité.
+    Extrait les messages 'session' (collectés par collect_fit_messages) pour obtenir un résumé de l'activité.
     Détermine le sport (Trail/Road) à partir des champs 'sport' et 'sub_sport'.
     """
-    session_messages = list(fitfile.get_messages('session'))
+    session_messages = fit_messages['session']
     
     if not session_messages:
         raise RuntimeError("Aucun message 'session' trouvé dans le fichier .fit")
@@ -135,10 +133,10 @@ def extract_activity_summary(fitfile):
     session_data = session_messages[-1]
     
     summary = {}
-    for field in session_data:
+    for name, value in session_data.items():
         # Seuls les champs de haut niveau sont intéressants ici
-        if field.name in ['sport', 'sub_sport', 'total_distance', 'total_elapsed_time', 'total_timer_time', 'max_heart_rate', 'avg_heart_rate', 'total_ascent', 'total_descent', 'timestamp']:
-            summary[field.name] = field.value
+        if name in SESSION_SUMMARY_FIELDS:
+            summary[name] = value
 
     # Déterminer le type d'activité (Road/Trail)
     sport = summary.get('sport', 'unknown')
@@ -174,42 +172,58 @@ def extract_activity_summary(fitfile):
 
     return summary
 
+class _JsonArgumentParser(argparse.ArgumentParser):
+    """ArgumentParser qui laisse main() renvoyer les erreurs d'usage en JSON."""
+    def error(self, message):
+        raise ValueError(message)
+
 def main():
     """Fonction principale pour l'exécution du script."""
-    if len(sys.argv) < 3:
-        error_msg = {"status": "error", "message": "Usage: python extract_fit.py path/to/file.fit path/to/output_dir/"}
+    parser = _JsonArgumentParser(prog="extract_fit_file_for_V3.py", add_help=False)
+    parser.add_argument("fit_file_path")
+    parser.add_argument("output_dir")
+    parser.add_argument("--format", dest="formats", default=",".join(DEFAULT_OUTPUT_FORMATS))
+    try:
+        args = parser.parse_args()
+        formats = parse_output_formats(args.formats)
+    except ValueError:
+        error_msg = {"status": "error", "message": f"Usage: python extract_fit.py path/to/file.fit path/to/output_dir/ [--format {','.join(OUTPUT_FORMATS)}]"}
         print(json.dumps(error_msg))
         sys.exit(1)
     
-    fit_file_path = Path(sys.argv[1])
-    output_dir = Path(sys.argv[2])
+    fit_file_path = Path(args.fit_file_path)
+    output_dir = Path(args.output_dir)
     
     file_stem = fit_file_path.stem 
-    output_path_records_csv = output_dir / f"{file_stem}_records.csv"
+    output_base_records = output_dir / f"{file_stem}_records"
     output_path_summary_json = output_dir / f"{file_stem}_activity_summary.json"
 
     try:
-        ff = FitFile(str(fit_file_path))
+        # Décodage unique du fichier : records et session collectés en un seul passage
+        fit_messages = load_fit_messages(fit_file_path, message_names=EXTRACTED_MESSAGES,
+                                         field_selection=FIT_FIELD_SELECTION)
         
         # Création du dossier de sortie si nécessaire
         output_dir.mkdir(parents=True, exist_ok=True)
         
         # 1. Traitement et export des RECORDS (Point par point)
-        df_records = parse_fit_records(ff)
-        df_records.to_csv(output_path_records_csv, index=False)
+        df_records = parse_fit_records(fit_messages)
+        records_paths = write_tables(df_records, output_base_records, formats)
         
         # 2. Traitement et export du RÉSUMÉ de l'activité (Haut niveau)
-        activity_summary = extract_activity_summary(ff)
+        activity_summary = extract_activity_summary(fit_messages)
         with open(output_path_summary_json, 'w') as f:
             json.dump(activity_summary, f, indent=4)
 
         # 3. Renvoyer les chemins des fichiers en JSON
         result = {
             "status": "success",
-            "message": "Fichiers CSV et JSON générés avec succès.",
-            "records_csv_path": str(output_path_records_csv),
+            "message": f"Fichiers {', '.join(fmt.upper() for fmt in formats)} et JSON générés avec succès.",
+            "records_paths": records_paths,
             "summary_json_path": str(output_path_summary_json)
         }
+        if 'csv' in formats:
+            result["records_csv_path"] = records_paths['csv']
         print(json.dumps(result))
 
     except Exception as e:
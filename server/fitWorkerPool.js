@@ -0,0 +1,191 @@
+// server/fitWorkerPool.js
+
+const { spawn } = require('child_process');
+const readline = require('readline');
+
+// --- Worker Python persistant ---
+// Un processus `python extract_fit_file.py --worker` reste chargé (pandas, numpy, fitparse déjà importés).
+// Protocole : une ligne JSON par job sur stdin, une ligne JSON de résultat par job sur stdout.
+class FitWorker {
+  constructor(pythonExecutable, scriptPath) {
+    this.pythonExecutable = pythonExecutable;
+    this.scriptPath = scriptPath;
+    this.pending = new Map(); // job_id -> { resolve, reject }
+    this.nextJobId = 1;
+    this.process = null;
+    this.start();
+  }
+
+  start() {
+    const worker = spawn(this.pythonExecutable, [this.scriptPath, '--worker']);
+    this.process = worker;
+
+    const lines = readline.createInterface({ input: worker.stdout });
+    lines.on('line', (line) => this.handleLine(line));
+
+    worker.stderr.on('data', (data) => {
+      console.error(`Python worker STDERR: ${data.toString().trim()}`);
+    });
+
+    // Erreur de lancement (exécutable introuvable ?) ou d'écriture sur stdin
+    worker.on('error', (err) => this.failAll(err));
+    worker.stdin.on('error', (err) => this.failAll(err));
+
+    // Le worker sera relancé au prochain job
+    worker.on('close', (code) => {
+      if (this.process === worker) this.process = null;
+      this.failAll(new Error(`Worker Python arrêté (code ${code})`));
+    });
+  }
+
+  handleLine(line) {
+    let result;
+    try {
+      result = JSON.parse(line);
+    } catch (e) {
+      console.error(`Sortie du worker Python non conforme: ${line}`);
+      return;
+    }
+
+    const job = this.pending.get(result.job_id);
+    if (!job) return;
+    this.pending.delete(result.job_id);
+    job.resolve(result);
+  }
+
+  failAll(err) {
+    for (const job of this.pending.values()) job.reject(err);
+    this.pending.clear();
+  }
+
+  get load() {
+    return this.pending.size;
+  }
+
+  // options : transmis tel quel à process_fit_file (ex: { engine: 'numpy' })
+  run(fitFilePath, outputDir, options = {}) {
+    if (!this.process) this.start();
+
+    const jobId = this.nextJobId++;
+    return new Promise((resolve, reject) => {
+      this.pending.set(jobId, { resolve, reject });
+      this.process.stdin.write(JSON.stringify({
+        job_id: jobId,
+        fit_file_path: fitFilePath,
+        output_dir: outputDir,
+        options
+      }) + '\n');
+    });
+  }
+
+  stop() {
+    if (this.process) this.process.stdin.end();
+  }
+}
+
+// --- Pool de workers ---
+// Les uploads simultanés sont répartis sur le worker le moins chargé
+class FitWorkerPool {
+  constructor(size, pythonExecutable, scriptPath) {
+    this.workers = Array.from({ length: Math.max(1, size) }, () => new FitWorker(pythonExecutable, scriptPath));
+  }
+
+  run(fitFilePath, outputDir, options = {}) {
+    const worker = this.workers.reduce((best, w) => (w.load < best.load ? w : best));
+    return worker.run(fitFilePath, outputDir, options);
+  }
+
+  stop() {
+    this.workers.forEach((w) => w.stop());
+  }
+}
+
+// --- File d'attente des extractions (cf. job_queue.py) ---
+// Un processus `python job_queue.py serve` garde la file (base SQLite) et son pool de workers ;
+// Node lui envoie des commandes (enqueue, status), une ligne JSON par commande sur stdin,
+// et reçoit une ligne JSON de réponse par commande sur stdout.
+class FitJobQueue {
+  // profileSlowMs : les profils .pstats des jobs plus courts sont supprimés par les workers (cf. job_queue.py)
+  constructor(pythonExecutable, scriptPath, queuePath, { workers = 2, maxQueued = 100, profileSlowMs = 0 } = {}) {
+    this.pythonExecutable = pythonExecutable;
+    this.args = [scriptPath, 'serve', queuePath, '--workers', String(workers), '--max-queued', String(maxQueued),
+                 '--profile-slow-ms', String(profileSlowMs)];
+    this.pending = new Map(); // request_id -> { resolve, reject }
+    this.nextRequestId = 1;
+    this.process = null;
+    this.start();
+  }
+
+  start() {
+    const service = spawn(this.pythonExecutable, this.args);
+    this.process = service;
+
+    const lines = readline.createInterface({ input: service.stdout });
+    lines.on('line', (line) => this.handleLine(line));
+
+    service.stderr.on('data', (data) => {
+      console.error(`Python job queue STDERR: ${data.toString().trim()}`);
+    });
+
+    service.on('error', (err) => this.failAll(err));
+    service.stdin.on('error', (err) => this.failAll(err));
+
+    // Le service sera relancé à la prochaine commande (les jobs en attente restent dans la base)
+    service.on('close', (code) => {
+      if (this.process === service) this.process = null;
+      this.failAll(new Error(`File d'attente Python arrêtée (code ${code})`));
+    });
+  }
+
+  handleLine(line) {
+    let response;
+    try {
+      response = JSON.parse(line);
+    } catch (e) {
+      console.error(`Sortie de la file d'attente Python non conforme: ${line}`);
+      return;
+    }
+
+    const request = this.pending.get(response.request_id);
+    if (!request) return;
+    this.pending.delete(response.request_id);
+    request.resolve(response);
+  }
+
+  failAll(err) {
+    for (const request of this.pending.values()) request.reject(err);
+    this.pending.clear();
+  }
+
+  request(command) {
+    if (!this.process) this.start();
+
+    const requestId = this.nextRequestId++;
+    return new Promise((resolve, reject) => {
+      this.pending.set(requestId, { resolve, reject });
+      this.process.stdin.write(JSON.stringify({ request_id: requestId, ...command }) + '\n');
+    });
+  }
+
+  // Réponse : { status: 'success', job } ou { status: 'error', error: 'QUEUE_FULL' | ..., message }
+  // removeInput : le fichier FIT est supprimé par le worker une fois le job terminé
+  enqueue(fitFilePath, outputDir, options = {}, removeInput = false) {
+    return this.request({
+      command: 'enqueue',
+      fit_file_path: fitFilePath,
+      output_dir: outputDir,
+      options,
+      remove_input: removeInput
+    });
+  }
+
+  status(jobId) {
+    return this.request({ command: 'status', job_id: jobId });
+  }
+
+  stop() {
+    if (this.process) this.process.stdin.end();
+  }
+}
+
+module.exports = { FitWorker, FitWorkerPool, FitJobQueue };
@@ -0,0 +1,137 @@
+"""
+Décodage en un seul passage des messages d'un fichier FIT.
+
+Le fichier est parcouru une seule fois : chaque message décodé est converti en
+dictionnaire {nom du champ: valeur} et envoyé au collecteur correspondant à son
+type (record, lap, session, event...). Les fonctions d'extraction consomment
+ensuite ces résultats collectés au lieu de relire le fichier.
+
+Deux moteurs de décodage sont disponibles : fitparse (par défaut) et le moteur
+vectorisé NumPy de fit_numpy_decoder.py, qui renvoie les messages 'record' en
+colonnes {nom: tableau} plutôt qu'en liste de dictionnaires. Le moteur 'mmap' est
+le moteur NumPy appliqué au fichier projeté en mémoire plutôt que lu.
+
+Une sélection de champs déclarative peut être passée au décodage :
+    {'record': {'exclude': ['position_lat', ...]}, 'session': {'include': ['sport', ...]}}
+Les champs écartés ne sont jamais matérialisés ; le moteur NumPy ne lit même
+pas leurs octets.
+
+stream_fit_messages décode le fichier message par message sans rien conserver,
+pour les traitements en mémoire bornée (mode streaming de l'extraction).
+"""
+from fitparse import FitFile
+
+from stage_timings import timed_stage
+
+# Types de messages utilisés par les scripts d'extraction
+EXTRACTED_MESSAGE_NAMES = ('record', 'lap', 'session', 'event')
+
+# Moteurs de décodage disponibles
+DECODER_ENGINES = ('fitparse', 'numpy', 'mmap')
+
+
+def field_filter(field_selection, message_name):
+    """
+    Renvoie le prédicat nom de champ -> conservé ? pour un type de message,
+    ou None si tous ses champs sont conservés.
+
+    Args:
+        field_selection (dict | None): Nom du message -> {'include': [...]} (liste blanche)
+            ou {'exclude': [...]} (liste noire). Les messages absents sont conservés en entier.
+        message_name (str): Type de message.
+    """
+    selection = (field_selection or {}).get(message_name)
+    if not selection:
+        return None
+    if 'include' in selection and 'exclude' in selection:
+        raise ValueError(f"Sélection de champs '{message_name}': 'include' et 'exclude' sont exclusifs")
+    if 'include' in selection:
+        included = frozenset(selection['include'])
+        return included.__contains__
+    excluded = frozenset(selection.get('exclude', ()))
+    return lambda name: name not in excluded
+
+
+def message_to_dict(message, keep=None):
+    """Convertit un message fitparse en dictionnaire {nom du champ: valeur} (champs filtrés par keep)."""
+    if keep is None:
+        return {field.name: field.value for field in message}
+    return {field.name: field.value for field in message if keep(field.name)}
+
+
+def route_fit_messages(fitfile, collectors, field_selection=None):
+    """
+    Parcourt tous les messages du fichier FIT en un seul passage et envoie chacun,
+    sous forme de dictionnaire, au collecteur associé à son nom.
+
+    Args:
+        fitfile (FitFile): Fichier FIT ouvert avec fitparse.
+        collectors (dict): Nom du message -> fonction appelée avec le dictionnaire du message.
+        field_selection (dict | None): Sélection de champs par message (cf. field_filter).
+    """
+    filters = {name: field_filter(field_selection, name) for name in collectors}
+    for message in fitfile.get_messages():
+        collector = collectors.get(message.name)
+        if collector is not None:
+            collector(message_to_dict(message, filters[message.name]))
+
+
+def collect_fit_messages(fitfile, message_names=EXTRACTED_MESSAGE_NAMES, field_selection=None):
+    """
+    Décode le fichier FIT une seule fois et regroupe les messages demandés par type.
+
+    Returns:
+        dict: Nom du message -> liste des dictionnaires de ce type (dans l'ordre du fichier).
+    """
+    collected = {name: [] for name in message_names}
+    route_fit_messages(fitfile, {name: rows.append for name, rows in collected.items()}, field_selection)
+    return collected
+
+
+def stream_fit_messages(fit_file_path, message_names=EXTRACTED_MESSAGE_NAMES, field_selection=None):
+    """
+    Décode le fichier FIT message par message et génère les couples (nom, dictionnaire)
+    des messages demandés, dans l'ordre du fichier.
+
+    Contrairement à collect_fit_messages, aucun message n'est conservé : la mémoire
+    reste bornée quelle que soit la longueur de l'activité.
+
+    fitparse (1.2.x) garde chaque message décodé dans la liste privée FitFile._messages, que
+    get_messages ne relit qu'à son démarrage : elle est vidée au fil du décodage. Avec une
+    version qui ne l'a pas, les messages restent corrects mais la mémoire n'est plus bornée.
+    """
+    fitfile = FitFile(str(fit_file_path))
+    filters = {name: field_filter(field_selection, name) for name in message_names}
+    try:
+        for message in fitfile.get_messages():
+            decoded = getattr(fitfile, '_messages', None)
+            if isinstance(decoded, list):
+                del decoded[:]
+            if message.name in filters:
+                yield message.name, message_to_dict(message, filters[message.name])
+    finally:
+        fitfile.close()
+
+
+def load_fit_messages(fit_file_path, message_names=EXTRACTED_MESSAGE_NAMES, engine='fitparse', field_selection=None,
+                      timings=None):
+    """
+    Ouvre et décode un fichier FIT avec le moteur demandé.
+
+    Args:
+        fit_file_path (str | Path): Chemin du fichier .fit.
+        message_names (iterable): Types de messages à collecter.
+        engine (str): 'fitparse', 'numpy' ou 'mmap'.
+        field_selection (dict | None): Sélection de champs par message (cf. field_filter).
+        timings (StageTimings | None): Chronométrage des étapes 'fit_open' et 'record_decode'.
+    """
+    if engine not in DECODER_ENGINES:
+        raise ValueError(f"Moteur de décodage inconnu: {engine}")
+    if engine in ('numpy', 'mmap'):
+        from fit_numpy_decoder import decode_fit_messages
+        return decode_fit_messages(fit_file_path, message_names, field_selection=field_selection, timings=timings,
+                                   mapped=engine == 'mmap')
+    with timed_stage(timings, 'fit_open'):
+        fitfile = FitFile(str(fit_file_path))
+    with timed_stage(timings, 'record_decode'):
+        return collect_fit_messages(fitfile, message_names, field_selection)
@@ -0,0 +1,1116 @@
+"""
+Moteur de décodage FIT vectorisé (NumPy), alternative à fitparse.
+
+Le fichier est lu une seule fois : un premier balayage repère les messages de
+définition et la position de chaque message de données. Tous les messages de
+données partageant la même définition sont ensuite décodés en bloc, via un
+dtype structuré NumPy appliqué directement aux octets bruts, puis l'échelle et
+l'offset du profil FIT sont appliqués colonne par colonne.
+
+Le profil (noms, types, échelles, composants, sous-champs) est celui de
+fitparse, et la sémantique reproduit celle de FitFile : valeurs invalides ->
+None, énumérations -> libellés, dates -> datetime, composants, sous-champs et
+horodatages compressés. Les messages 'record' sont renvoyés en colonnes
+{nom: tableau NumPy}, les autres en listes de dictionnaires, comme
+collect_fit_messages.
+
+Avec une sélection de champs (cf. fit_messages.field_filter), seuls les octets
+des champs conservés sont extraits du fichier, ainsi que ceux dont ils
+dépendent (champ de référence d'un sous-champ, horodatage).
+
+Le moteur 'mmap' décode le fichier projeté en mémoire (mmap) au lieu de le lire :
+le balayage travaille sur un memoryview, les messages consécutifs d'une même
+définition sont des vues NumPy (à pas constant) sur la projection, et le CRC est
+calculé sur le tampon projeté. Plusieurs processus qui décodent le même fichier
+partagent ainsi les pages du cache système.
+
+IncrementalFitDecoder reprend le balayage là où il s'est arrêté, pour décoder au fil de l'eau un
+fichier qui grandit (cf. incremental_fit).
+
+Vérification de compatibilité avec fitparse :
+    python fit_numpy_decoder.py path/to/file.fit
+"""
+import os
+import sys
+import json
+import mmap
+import tempfile
+from pathlib import Path
+from datetime import datetime, timedelta, time as dt_time
+
+import numpy as np
+from fitparse.profile import MESSAGE_TYPES, FIELD_TYPE_TIMESTAMP
+from fitparse.processors import UTC_REFERENCE
+from fitparse.records import BASE_TYPES, BASE_TYPE_BYTE, Crc, DevField, parse_string
+from fitparse.utils import FitParseError, FitHeaderError, FitCRCError, FitEOFError
+
+from fit_messages import EXTRACTED_MESSAGE_NAMES, field_filter
+from stage_timings import timed_stage
+
+# Messages renvoyés en colonnes NumPy plutôt qu'en liste de dictionnaires
+COLUMNAR_MESSAGE_NAMES = ('record',)
+
+# Messages de description des champs développeur (décodés pendant le balayage)
+MESG_NUM_FIELD_DESCRIPTION = 206
+MESG_NUM_DEVELOPER_DATA_ID = 207
+
+TIMESTAMP_DEF_NUM = FIELD_TYPE_TIMESTAMP.def_num
+DATE_TIME_MIN = 0x10000000
+FIT_EPOCH = datetime(1970, 1, 1) + timedelta(seconds=UTC_REFERENCE)
+
+# Tampons à partir desquels le CRC est calculé en vectorisé (cf. _crc16)
+VECTOR_CRC_MIN_BYTES = 4096
+
+# Types de base FIT -> (dtype NumPy sans boutisme, valeur invalide)
+NUMERIC_BASE_TYPES = {
+    'enum': ('u1', 0xFF), 'sint8': ('i1', 0x7F), 'uint8': ('u1', 0xFF),
+    'sint16': ('i2', 0x7FFF), 'uint16': ('u2', 0xFFFF),
+    'sint32': ('i4', 0x7FFFFFFF), 'uint32': ('u4', 0xFFFFFFFF),
+    'float32': ('f4', None), 'float64': ('f8', None),
+    'uint8z': ('u1', 0), 'uint16z': ('u2', 0), 'uint32z': ('u4', 0),
+    'sint64': ('i8', 0x7FFFFFFFFFFFFFFF), 'uint64': ('u8', 0xFFFFFFFFFFFFFFFF), 'uint64z': ('u8', 0),
+}
+
+
+# --- CRC ---
+
+def _crc_byte_table():
+    """Table du CRC FIT octet par octet, déduite de la table par quartet de fitparse."""
+    table = np.zeros(256, dtype=np.uint16)
+    for byte in range(256):
+        table[byte] = Crc.calculate(bytes([byte]))
+    return table
+
+
+CRC_BYTE_TABLE = _crc_byte_table()
+
+
+def _crc16(data, crc=0):
+    """
+    CRC FIT (identique à Crc.calculate) d'un tampon, vectorisé, à partir de la valeur crc (CRC des
+    octets qui précèdent le tampon, pour un calcul par morceaux).
+    Le tampon est découpé en voies de même longueur dont les CRC sont calculés ensemble, octet par
+    octet, puis combinés deux à deux : le CRC étant linéaire, CRC(A + B) = décalage de CRC(A) sur
+    len(B) octets nuls, XOR CRC(B), et ce décalage est une table de 65536 valeurs.
+    """
+    if len(data) < VECTOR_CRC_MIN_BYTES:
+        return Crc.calculate(data, crc)
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    # Nombre de voies : puissance de 2 proche de la racine de la taille
+    lanes = 1 << (int(np.sqrt(len(buffer))).bit_length() - 1)
+    lane_size = len(buffer) // lanes
+    head = len(buffer) - lanes * lane_size
+    # Les premiers octets (moins d'une voie par voie) sont comptés dans l'état initial de la première voie
+    initial = crc
+    crc = np.zeros(lanes, dtype=np.uint16)
+    crc[0] = Crc.calculate(data[:head], initial)
+    block = buffer[head:].reshape(lanes, lane_size)
+    for j in range(lane_size):
+        crc = (crc >> 8) ^ CRC_BYTE_TABLE[(crc ^ block[:, j]) & 0xFF]
+
+    # Décalage sur un octet nul, puis sur lane_size octets nuls (composition répétée)
+    states = np.arange(65536, dtype=np.uint16)
+    zero_byte = (states >> 8) ^ CRC_BYTE_TABLE[states & 0xFF]
+    shift = states
+    power, remaining = zero_byte, lane_size
+    while remaining:
+        if remaining & 1:
+            shift = power[shift]
+        power = power[power]
+        remaining >>= 1
+    while len(crc) > 1:
+        crc = shift[crc[0::2]] ^ crc[1::2]
+        shift = shift[shift]
+    return int(crc[0])
+
+
+# --- Colonnes de valeurs ---
+
+class _Column(object):
+    """
+    Valeurs d'un champ pour un bloc de messages.
+    values : tableau int64 / float64 / datetime64[s] ou tableau d'objets Python.
+    missing : masque des valeurs None.
+    """
+    __slots__ = ('values', 'missing')
+
+    def __init__(self, values, missing):
+        self.values = values
+        self.missing = missing
+
+    @property
+    def is_object(self):
+        return self.values.dtype == object
+
+    def take(self, mask):
+        return _Column(self.values[mask], self.missing[mask])
+
+    def to_objects(self):
+        """Tableau d'objets Python (int, float, datetime...) avec None pour les valeurs manquantes."""
+        if self.values.dtype.kind == 'M':
+            out = np.empty(len(self.values), dtype=object)
+            out[:] = self.values.astype('datetime64[us]').tolist()
+        elif self.is_object:
+            out = self.values.copy()
+        else:
+            out = np.empty(len(self.values), dtype=object)
+            out[:] = self.values.tolist()
+        out[self.missing] = None
+        return out
+
+    def to_list(self):
+        return self.to_objects().tolist()
+
+
+def _object_column(values):
+    values = np.asarray(values, dtype=object) if not isinstance(values, np.ndarray) else values
+    return _Column(values, np.array([v is None for v in values], dtype=bool))
+
+
+# --- Définitions ---
+
+class _FieldLayout(object):
+    __slots__ = ('def_num', 'size', 'base_type', 'field', 'offset')
+
+    def __init__(self, def_num, size, base_type, field, offset):
+        self.def_num = def_num
+        self.size = size
+        self.base_type = base_type
+        self.field = field
+        self.offset = offset
+
+
+class _Definition(object):
+    """Définition d'un message local + positions des messages de données qui l'utilisent."""
+
+    def __init__(self, mesg_num, endian, fields, dev_fields):
+        self.mesg_num = mesg_num
+        self.mesg_type = MESSAGE_TYPES.get(mesg_num)
+        self.name = self.mesg_type.name if self.mesg_type else 'unknown_%d' % mesg_num
+        self.endian = endian
+        self.fields = fields
+        self.dev_fields = dev_fields
+        self.size = sum(f.size for f in fields) + sum(f.size for f in dev_fields)
+        self.timestamp_field = next((f for f in fields if f.def_num == TIMESTAMP_DEF_NUM), None)
+        self.accumulated = [
+            component.def_num
+            for f in fields if f.field and f.field.components
+            for component in f.field.components if component.accumulate
+        ]
+        self.offsets = []
+        self.ordinals = []
+        # Indices des champs à décoder (None = tous)
+        self.decoded = None
+
+    @property
+    def layouts(self):
+        return self.fields + self.dev_fields
+
+    def decoded_layouts(self):
+        layouts = self.layouts
+        if self.decoded is None:
+            return list(enumerate(layouts))
+        return [(i, layouts[i]) for i in self.decoded]
+
+    def byte_index(self):
+        """Positions, dans un message, des octets des champs décodés."""
+        ranges = [np.arange(f.offset, f.offset + f.size, dtype=np.int64) for _, f in self.decoded_layouts()]
+        return np.concatenate(ranges) if ranges else np.zeros(0, dtype=np.int64)
+
+    def layout_key(self):
+        return (self.mesg_num, self.endian,
+                tuple((f.def_num, f.size, f.base_type.identifier) for f in self.fields),
+                tuple((f.def_num, f.size, id(f.field)) for f in self.dev_fields))
+
+    def dtype(self, compact=True):
+        """
+        dtype structuré des champs décodés, aux positions compactées de byte_index(), ou à leur
+        position dans le message (compact=False : vue directe sur les octets du fichier).
+        """
+        names, formats, offsets = [], [], []
+        position = 0
+        for i, f in self.decoded_layouts():
+            if not compact:
+                position = f.offset
+            base = f.base_type
+            if base.name == 'string':
+                fmt = 'S%d' % f.size
+            elif base.name == 'byte':
+                fmt = ('u1', f.size)
+            else:
+                code = NUMERIC_BASE_TYPES[base.name][0]
+                count = f.size // np.dtype(code).itemsize
+                fmt = self.endian + code if count == 1 else (self.endian + code, count)
+            names.append('f%d' % i)
+            formats.append(fmt)
+            offsets.append(position)
+            position += f.size
+        itemsize = max(position, 1) if compact else max(self.size, 1)
+        return np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': itemsize})
+
+
+# --- Décodage brut (types de base) ---
+
+def _raw_column(array, base_type, size):
+    """Convertit un champ brut en colonne, avec la sémantique de BaseType.parse de fitparse."""
+    name = base_type.name
+    if name == 'string':
+        return _object_column([parse_string(v) for v in array.tolist()])
+    if name == 'byte':
+        rows = [tuple(r) for r in array.tolist()]
+        return _object_column([None if all(b == 0xFF for b in r) else r for r in rows])
+
+    code, invalid = NUMERIC_BASE_TYPES[name]
+    if array.ndim > 1:
+        # Champ tableau : tuple de valeurs (chacune nettoyée)
+        def scrub(v):
+            if invalid is None:
+                return None if v != v else v
+            return None if v == invalid else v
+        return _object_column([tuple(scrub(v) for v in row) for row in array.tolist()])
+
+    if code[0] == 'f':
+        values = array.astype(np.float64)
+        return _Column(values, np.isnan(values))
+    if code == 'u8':
+        values = np.empty(len(array), dtype=object)
+        values[:] = array.tolist()
+        return _Column(values, array == invalid)
+    values = array.astype(np.int64)
+    return _Column(values, values == invalid)
+
+
+# --- Transformations du profil (render, échelle/offset, processeurs) ---
+
+def _render(field, column):
+    """Remplace les valeurs d'énumération par leur libellé (FieldAndSubFieldBase.render)."""
+    values_map = getattr(field.type, 'values', None)
+    if not values_map or column.values.dtype.kind not in 'iu':
+        return column
+    keys = np.fromiter(values_map.keys(), dtype=np.int64, count=len(values_map))
+    hit = np.isin(column.values, keys) & ~column.missing
+    if not hit.any():
+        return column
+    out = column.to_objects()
+    out[hit] = [values_map[v] for v in column.values[hit].tolist()]
+    return _Column(out, column.missing)
+
+
+def _apply_scale_offset(spec, column):
+    scale, offset = spec.scale, spec.offset
+    if not scale and not offset:
+        return column
+    if column.is_object:
+        def transform(v):
+            if isinstance(v, tuple):
+                return tuple(transform(x) for x in v)
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                if scale:
+                    v = float(v) / scale
+                if offset:
+                    v = v - offset
+            return v
+        return _Column(np.array([transform(v) for v in column.values] or [], dtype=object), column.missing)
+    values = column.values
+    if scale:
+        values = values.astype(np.float64) / scale
+    if offset:
+        values = values - offset
+    return _Column(values, column.missing)
+
+
+def _datetime_column(column, always=False):
+    """Processeur date_time : secondes depuis l'époque FIT -> datetime (naïf, UTC)."""
+    if column.is_object:
+        def convert(v):
+            if isinstance(v, (int, float)) and not isinstance(v, bool) and (always or v >= DATE_TIME_MIN):
+                return FIT_EPOCH + timedelta(seconds=v)
+            return v
+        return _Column(np.array([convert(v) for v in column.values] or [], dtype=object), column.missing)
+    convertible = ~column.missing & (True if always else column.values >= DATE_TIME_MIN)
+    if np.all(convertible | column.missing) and column.values.dtype.kind in 'iu':
+        values = (column.values + UTC_REFERENCE).astype('datetime64[s]')
+        values[column.missing] = np.datetime64('NaT')
+        return _Column(values, column.missing)
+    out = column.to_objects()
+    out[convertible] = [FIT_EPOCH + timedelta(seconds=v) for v in column.values[convertible].tolist()]
+    return _Column(out, column.missing)
+
+
+def _process_type(field, column):
+    """Équivalent des processeurs de type de FitFileDataProcessor."""
+    type_name = field.type.name
+    if type_name == 'bool':
+        out = column.to_objects()
+        out[~column.missing] = [bool(v) for v in out[~column.missing]]
+        return _Column(out, column.missing)
+    if type_name == 'date_time':
+        return _datetime_column(column)
+    if type_name == 'local_date_time':
+        return _datetime_column(column, always=True)
+    if type_name == 'localtime_into_day':
+        out = column.to_objects()
+        def to_time(v):
+            m, s = divmod(v, 60)
+            h, m = divmod(m, 60)
+            return dt_time(h, m, s)
+        out[~column.missing] = [to_time(v) for v in out[~column.missing]]
+        return _Column(out, column.missing)
+    return column
+
+
+def _field_value(field, raw):
+    """Valeur finale d'un champ du profil : render, puis échelle/offset, puis processeur de type."""
+    return _process_type(field, _apply_scale_offset(field, _render(field, raw)))
+
+
+def _component_raw(component, raw):
+    """ComponentField.render vectorisé : extraction des bits du composant (ou None)."""
+    if raw.is_object:
+        out = []
+        for v in raw.values:
+            if v is None:
+                out.append(None)
+                continue
+            if isinstance(v, tuple):
+                if component.bit_offset and component.bit_offset >= len(v) << 3:
+                    return None
+                unpacked = 0
+                for b in reversed(v):
+                    unpacked = (unpacked << 8) + b
+                v = unpacked
+            if isinstance(v, int):
+                v = (v >> component.bit_offset) & ((1 << component.bits) - 1)
+            out.append(v)
+        return _object_column(out)
+    if raw.values.dtype.kind == 'f':
+        return raw
+    values = (raw.values >> component.bit_offset) & ((1 << component.bits) - 1)
+    return _Column(values, raw.missing)
+
+
+def _output_names(definition, layout):
+    """Noms que peut produire un champ : champ, sous-champs et composants (et leurs sous-champs)."""
+    field = layout.field
+    if field is None:
+        return ['unknown_%d' % layout.def_num]
+    if isinstance(field, DevField):
+        return [field.name]
+    names = []
+    for spec in [field] + list(field.subfields or []):
+        names.append(spec.name)
+        for component in spec.components or []:
+            cmp_field = definition.mesg_type.fields[component.def_num]
+            names.extend([cmp_field.name] + [sub.name for sub in cmp_field.subfields or []])
+    return names
+
+
+def _reference_def_nums(definition, layout):
+    """Numéros des champs de référence nécessaires pour résoudre les sous-champs d'un champ."""
+    field = layout.field
+    if field is None or isinstance(field, DevField):
+        return set()
+    specs = [field] + list(field.subfields or [])
+    specs += [definition.mesg_type.fields[c.def_num] for spec in specs for c in spec.components or []]
+    return {ref.def_num for spec in specs for sub in getattr(spec, 'subfields', None) or [] for ref in sub.ref_fields}
+
+
+# --- Décodeur ---
+
+class FitNumpyDecoder(object):
+    """
+    Décode un fichier FIT complet en mémoire.
+
+    Args:
+        data (bytes): Contenu du fichier .fit.
+        message_names (iterable): Types de messages à extraire.
+        check_crc (bool): Vérifie les CRC d'en-tête et de fin de fichier (comme fitparse).
+        field_selection (dict | None): Sélection de champs par message (cf. fit_messages.field_filter).
+    """
+
+    # Décodages successifs d'un même fichier (cf. IncrementalFitDecoder)
+    _resumable = False
+
+    def __init__(self, data, message_names=EXTRACTED_MESSAGE_NAMES, check_crc=True, field_selection=None):
+        self.data = data
+        self.message_names = tuple(message_names)
+        self.check_crc = check_crc
+        self._filters = {name: field_filter(field_selection, name) for name in self.message_names}
+        self._buffer = np.frombuffer(data, dtype=np.uint8)
+        self._dev_types = {}
+        self._groups = {}
+        self._definition_events = []
+        self._compressed = []
+        self._ordinal = 0
+        # États séquentiels en fin de décodage (repris par IncrementalFitDecoder)
+        self._timestamp_accumulator = 0
+        self._component_accumulators = {}
+
+    # Balayage -----------------------------------------------------------
+
+    def _scan(self):
+        data = self.data
+        position = 0
+        while position < len(data):
+            position = self._scan_file(position)
+
+    def _scan_file(self, start):
+        data = self.data
+        position, end = self._read_file_header(start)
+        if end + 2 > len(data):
+            raise FitEOFError("Tried to read %d bytes from .FIT file but got %d" % (end + 2 - start, len(data) - start))
+
+        local_defs = [None] * 16
+        ordinal = self._ordinal
+        while position < end:
+            position, ordinal = self._scan_message(position, local_defs, ordinal)
+
+        if position != end:
+            raise FitEOFError("Truncated message at the end of the .FIT file")
+        if self.check_crc and int.from_bytes(data[end:end + 2], 'little') != _crc16(data[start:end]):
+            raise FitCRCError('CRC Mismatch')
+        self._ordinal = ordinal
+        return end + 2
+
+    def _read_file_header(self, start):
+        """En-tête du fichier (ou de la section d'un fichier chaîné) : (début des messages, fin des messages)."""
+        data = self.data
+        if len(data) - start < 12 or data[start + 8:start + 12] != b'.FIT':
+            raise FitHeaderError("Invalid .FIT File Header")
+        header_size = data[start]
+        data_size = int.from_bytes(data[start + 4:start + 8], 'little')
+        if header_size > 12:
+            if header_size < 14:
+                raise FitHeaderError('Irregular File Header Size')
+            header_crc = int.from_bytes(data[start + 12:start + 14], 'little')
+            if self.check_crc and header_crc != 0 and header_crc != Crc.calculate(data[start:start + 12]):
+                raise FitCRCError('Header CRC Mismatch')
+        position = start + header_size
+        return position, position + data_size
+
+    def _scan_message(self, position, local_defs, ordinal):
+        """Repère le message qui commence à position : (position du message suivant, ordinal suivant)."""
+        data = self.data
+        header = data[position]
+        if header & 0x80:
+            # En-tête à horodatage compressé
+            definition = local_defs[(header >> 5) & 0x3]
+            time_offset = header & 0x1F
+        elif header & 0x40:
+            return self._parse_definition(position, bool(header & 0x20), local_defs, ordinal), ordinal + 1
+        else:
+            definition = local_defs[header & 0xF]
+            time_offset = None
+
+        if definition is None:
+            raise FitParseError('Got data message with invalid local message type %d' % (header & 0xF))
+        if definition.offsets is not None:
+            definition.offsets.append(position + 1)
+            definition.ordinals.append(ordinal)
+            if time_offset is not None:
+                self._compressed.append((ordinal, time_offset))
+        elif time_offset is not None:
+            self._compressed.append((ordinal, time_offset))
+        if definition.mesg_num in (MESG_NUM_FIELD_DESCRIPTION, MESG_NUM_DEVELOPER_DATA_ID):
+            self._register_dev_message(definition, position + 1)
+        return position + 1 + definition.size, ordinal + 1
+
+    def _parse_definition(self, position, has_dev_fields, local_defs, ordinal):
+        data = self.data
+        local_num = data[position] & 0xF
+        endian = '>' if data[position + 2] else '<'
+        mesg_num = int.from_bytes(data[position + 3:position + 5], 'big' if endian == '>' else 'little')
+        num_fields = data[position + 5]
+        mesg_type = MESSAGE_TYPES.get(mesg_num)
+        cursor = position + 6
+
+        fields, offset = [], 0
+        for _ in range(num_fields):
+            def_num, size, base_type_num = data[cursor], data[cursor + 1], data[cursor + 2]
+            cursor += 3
+            base_type = BASE_TYPES.get(base_type_num, BASE_TYPE_BYTE)
+            base_size = 1 if base_type.name in ('string', 'byte') else np.dtype(NUMERIC_BASE_TYPES[base_type.name][0]).itemsize
+            if size % base_size != 0:
+                raise FitParseError("Invalid field size %d for type '%s' (expected a multiple of %d)" % (
+                    size, base_type.name, base_size))
+            field = mesg_type.fields.get(def_num) if mesg_type else None
+            fields.append(_FieldLayout(def_num, size, base_type, field, offset))
+            offset += size
+
+        dev_fields = []
+        if has_dev_fields:
+            num_dev_fields = data[cursor]
+            cursor += 1
+            for _ in range(num_dev_fields):
+                def_num, size, dev_data_index = data[cursor], data[cursor + 1], data[cursor + 2]
+                cursor += 3
+                dev_field = self._get_dev_type(dev_data_index, def_num)
+                dev_fields.append(_FieldLayout(def_num, size, dev_field.type, dev_field, offset))
+                offset += size
+
+        definition = _Definition(mesg_num, endian, fields, dev_fields)
+        key = definition.layout_key()
+        if key in self._groups:
+            # Même structure qu'une définition précédente : les messages sont décodés dans le même bloc
+            group = self._groups[key]
+        else:
+            group = definition
+            wanted = definition.name in self.message_names or definition.timestamp_field is not None
+            if not wanted:
+                group.offsets = group.ordinals = None
+            else:
+                group.decoded = self._select_layouts(group)
+            self._groups[key] = group
+        if definition.accumulated:
+            self._definition_events.append((ordinal, mesg_num, definition.accumulated))
+        local_defs[local_num] = group
+        return cursor
+
+    def _select_layouts(self, definition):
+        """
+        Indices des champs à extraire pour une définition (None = tous) : champs conservés
+        par la sélection, leurs champs de référence, et l'horodatage (en-têtes compressés).
+        """
+        if definition.mesg_num in (MESG_NUM_FIELD_DESCRIPTION, MESG_NUM_DEVELOPER_DATA_ID):
+            return None
+        if definition.name in self.message_names:
+            keep = self._filters[definition.name]
+            if keep is None:
+                return None
+        else:
+            # Message seulement utile pour les horodatages compressés
+            keep = lambda name: False
+
+        layouts = definition.layouts
+        selected = set()
+        reference_def_nums = set()
+        for i, layout in enumerate(layouts):
+            if layout is definition.timestamp_field or any(keep(n) for n in _output_names(definition, layout)):
+                selected.add(i)
+                reference_def_nums |= _reference_def_nums(definition, layout)
+        selected.update(i for i, f in enumerate(definition.fields) if f.def_num in reference_def_nums)
+        return sorted(selected)
+
+    # Champs développeur ---------------------------------------------------
+
+    def _get_dev_type(self, dev_data_index, def_num):
+        if dev_data_index not in self._dev_types:
+            raise FitParseError("No such dev_data_index=%s found when looking up field %s" % (dev_data_index, def_num))
+        fields = self._dev_types[dev_data_index]['fields']
+        if def_num not in fields:
+            raise FitParseError("No such field %s for dev_data_index %s" % (def_num, dev_data_index))
+        return fields[def_num]
+
+    def _register_dev_message(self, definition, offset):
+        raw = self._raw_columns(definition, np.array([offset]))
+        values = {f.def_num: raw[i].to_list()[0] for i, f in enumerate(definition.fields)}
+        if definition.mesg_num == MESG_NUM_DEVELOPER_DATA_ID:
+            self._dev_types[values.get(3)] = {'dev_data_index': values.get(3), 'application_id': values.get(1), 'fields': {}}
+            return
+        dev_data_index, field_def_num = values.get(0), values.get(1)
+        if dev_data_index not in self._dev_types:
+            raise FitParseError("No such dev_data_index=%s found" % (dev_data_index))
+        self._dev_types[int(dev_data_index)]['fields'][field_def_num] = DevField(
+            dev_data_index=dev_data_index,
+            def_num=field_def_num,
+            type=BASE_TYPES[values.get(2)],
+            name=values.get(3) or "unnamed_dev_field_%s" % field_def_num,
+            units=values.get(8),
+            native_field_num=values.get(15),
+        )
+
+    # Décodage en bloc ------------------------------------------------------
+
+    def _rows(self, definition, offsets):
+        """
+        Messages vus avec le dtype structuré de la définition, sans index par octet : une suite de
+        messages consécutifs est une vue à pas constant sur le tampon (sans copie) ; sinon les
+        messages sont pris dans une vue du tampon qui commence à chaque octet (une copie par message).
+        """
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if len(definition.byte_index()) == 0 or len(offsets) == 0:
+            return np.zeros(len(offsets), dtype=definition.dtype())
+        dtype = definition.dtype(compact=False)
+        stride = definition.size + 1
+        if np.all(np.diff(offsets) == stride):
+            return np.ndarray((len(offsets),), dtype=dtype, buffer=self._buffer, offset=int(offsets[0]), strides=(stride,))
+        every_byte = np.ndarray((len(self._buffer) - dtype.itemsize + 1,), dtype=dtype, buffer=self._buffer, strides=(1,))
+        return every_byte[offsets]
+
+    def _raw_columns(self, definition, offsets):
+        """Colonnes brutes de chaque champ (None pour les champs non extraits)."""
+        rows = self._rows(definition, offsets)
+        raw = [None] * len(definition.layouts)
+        for i, f in definition.decoded_layouts():
+            raw[i] = _raw_column(rows['f%d' % i], f.base_type, f.size)
+        return raw
+
+    def _subfield_choice(self, field, definition, raw, n):
+        """Sous-champ actif par message (_resolve_subfield vectorisé) : -1 = champ principal."""
+        choice = np.full(n, -1, dtype=np.int64)
+        if not field.subfields:
+            return choice
+        for sub_index, sub_field in enumerate(field.subfields):
+            match = np.zeros(len(choice), dtype=bool)
+            for ref_field in sub_field.ref_fields:
+                for i, layout in enumerate(definition.fields):
+                    if layout.def_num == ref_field.def_num:
+                        ref = raw[i]
+                        if ref.is_object:
+                            match |= np.array([v == ref_field.raw_value for v in ref.values], dtype=bool)
+                        else:
+                            match |= ~ref.missing & (ref.values == ref_field.raw_value)
+            choice[(choice == -1) & match] = sub_index
+        return choice
+
+    def _decode_outputs(self, definition, raw, ordinals, compressed_timestamps):
+        """
+        Reproduit _parse_data_message de fitparse sur un bloc de messages.
+        Renvoie la liste ordonnée des sorties (nom, champ inconnu ?, masque des messages, colonne).
+        """
+        keep = self._filters[definition.name] or (lambda name: True)
+        outputs = []
+        n = len(ordinals)
+        for i, layout in enumerate(definition.layouts):
+            column = raw[i]
+            field = layout.field
+            if column is None:
+                continue
+            if field is None:
+                if keep('unknown_%d' % layout.def_num):
+                    outputs.append(('unknown_%d' % layout.def_num, True, np.ones(n, dtype=bool), column))
+                continue
+            if isinstance(field, DevField):
+                if keep(field.name):
+                    outputs.append((field.name, False, np.ones(n, dtype=bool), column))
+                continue
+
+            choice = self._subfield_choice(field, definition, raw, n)
+            variants = [(-1, field)] + list(enumerate(field.subfields or []))
+            for sub_index, spec in variants:
+                mask = choice == sub_index
+                if not mask.any():
+                    continue
+                part = column.take(mask)
+                for component in spec.components or []:
+                    cmp_raw = _component_raw(component, part)
+                    if cmp_raw is None:
+                        continue
+                    if component.accumulate:
+                        cmp_raw = _object_column(self._accumulated[(id(definition), i, id(component))])
+                    cmp_value = _apply_scale_offset(component, cmp_raw)
+                    cmp_field = definition.mesg_type.fields[component.def_num]
+                    cmp_choice = self._subfield_choice(
+                        cmp_field, definition, [c.take(mask) if c is not None else None for c in raw], int(mask.sum()))
+                    cmp_variants = [(-1, cmp_field)] + list(enumerate(cmp_field.subfields or []))
+                    for cmp_sub_index, cmp_spec in cmp_variants:
+                        cmp_mask = cmp_choice == cmp_sub_index
+                        if not cmp_mask.any() or not keep(cmp_spec.name):
+                            continue
+                        full_mask = np.zeros(n, dtype=bool)
+                        full_mask[np.flatnonzero(mask)[cmp_mask]] = True
+                        value = _process_type(cmp_spec, _render(cmp_spec, cmp_value.take(cmp_mask)))
+                        outputs.append((cmp_spec.name, False, full_mask, value))
+                if keep(spec.name):
+                    outputs.append((spec.name, False, mask, _field_value(spec, part)))
+
+        if compressed_timestamps is not None and keep('timestamp'):
+            has_ts, ts_values = compressed_timestamps
+            value = _process_type(FIELD_TYPE_TIMESTAMP, _Column(ts_values[has_ts], np.zeros(int(has_ts.sum()), dtype=bool)))
+            outputs.append(('timestamp', False, has_ts, value))
+        return outputs
+
+    # État séquentiel (accumulateurs, horodatages compressés) ------------------
+
+    def _prepare_accumulators(self, blocks):
+        """
+        Accumulation des composants compressés (_apply_compressed_accumulation).
+        L'accumulateur est partagé par message global et remis à zéro à chaque définition :
+        tous les blocs du même message sont donc rejoués ensemble, dans l'ordre du fichier, à partir
+        de la valeur atteinte au décodage précédent.
+        """
+        events = {}
+        for definition, offsets, ordinals, raw in blocks:
+            if not definition.accumulated or definition.name not in self.message_names:
+                continue
+            for i, layout in enumerate(definition.fields):
+                field = layout.field
+                if field is None or raw[i] is None:
+                    continue
+                choice = self._subfield_choice(field, definition, raw, len(ordinals))
+                for sub_index, spec in [(-1, field)] + list(enumerate(field.subfields or [])):
+                    mask = choice == sub_index
+                    for component in spec.components or []:
+                        if not component.accumulate or not mask.any():
+                            continue
+                        cmp_raw = _component_raw(component, raw[i].take(mask))
+                        if cmp_raw is None:
+                            continue
+                        key = (id(definition), i, id(component))
+                        self._accumulated[key] = cmp_raw.to_list()
+                        stream = events.setdefault((definition.mesg_num, component.def_num, component.bits), [])
+                        stream.extend((o, key, j) for j, o in enumerate(ordinals[mask].tolist()))
+
+        for stream_key in set(events) | set(self._component_accumulators):
+            mesg_num, def_num, bits = stream_key
+            resets = sorted(o for o, num, accumulated in self._definition_events
+                            if num == mesg_num and def_num in accumulated)
+            max_value = 1 << bits
+            max_mask = max_value - 1
+            accumulator, reset_index = self._component_accumulators.get(stream_key, 0), 0
+            for ordinal, key, j in sorted(events.get(stream_key, ())):
+                while reset_index < len(resets) and resets[reset_index] < ordinal:
+                    accumulator = 0
+                    reset_index += 1
+                values = self._accumulated[key]
+                raw_value = values[j]
+                if raw_value is None:
+                    continue
+                base_value = raw_value + (accumulator & ~max_mask)
+                if raw_value < (accumulator & max_mask):
+                    base_value += max_value
+                accumulator = values[j] = base_value
+            # Définition postérieure au dernier message : remise à zéro pour la suite du fichier
+            if reset_index < len(resets):
+                accumulator = 0
+            self._component_accumulators[stream_key] = accumulator
+
+    def _compressed_timestamps(self, blocks):
+        """
+        Horodatages des messages à en-tête compressé : l'accumulateur suit le dernier
+        champ timestamp lu (tous messages confondus), comme fitparse.
+        """
+        if not self._compressed and not self._resumable:
+            return {}
+        events = []
+        for definition, offsets, ordinals, raw in blocks:
+            if definition.timestamp_field is None:
+                continue
+            index = definition.fields.index(definition.timestamp_field)
+            column = raw[index]
+            present = ~column.missing
+            events.extend(zip(ordinals[present].tolist(), column.values[present].tolist()))
+        known = dict(events)
+        compressed = dict(self._compressed)
+        accumulator = self._timestamp_accumulator
+        result = {}
+        for ordinal in sorted(set(known) | set(compressed)):
+            if ordinal in known:
+                accumulator = known[ordinal]
+            if ordinal in compressed:
+                time_offset = compressed[ordinal]
+                base_value = time_offset + (accumulator & ~0x1F)
+                if time_offset < (accumulator & 0x1F):
+                    base_value += 0x20
+                accumulator = result[ordinal] = base_value
+        self._timestamp_accumulator = accumulator
+        return result
+
+    # API --------------------------------------------------------------------
+
+    def decode(self):
+        """
+        Returns:
+            dict: Nom du message -> colonnes {nom: tableau} pour 'record',
+            liste de dictionnaires pour les autres types demandés.
+        """
+        self._scan()
+        return self._decode_scanned()
+
+    def _decode_scanned(self):
+        """Décodage en bloc des messages repérés par le balayage."""
+        self._accumulated = {}
+
+        blocks = []
+        for definition in self._groups.values():
+            # Les autres messages horodatés ne servent qu'aux en-têtes compressés (et à l'horodatage
+            # repris par le décodage suivant)
+            needed = definition.name in self.message_names or self._compressed or self._resumable
+            if definition.offsets and needed:
+                offsets = np.asarray(definition.offsets, dtype=np.int64)
+                ordinals = np.asarray(definition.ordinals, dtype=np.int64)
+                blocks.append((definition, offsets, ordinals, self._raw_columns(definition, offsets)))
+        compressed = self._compressed_timestamps(blocks)
+        self._prepare_accumulators(blocks)
+
+        decoded = {}
+        for definition, offsets, ordinals, raw in blocks:
+            if definition.name not in self.message_names:
+                continue
+            ts = None
+            if compressed:
+                ts_values = np.array([compressed.get(o, 0) for o in ordinals.tolist()], dtype=np.int64)
+                has_ts = np.array([o in compressed for o in ordinals.tolist()], dtype=bool)
+                if has_ts.any():
+                    ts = (has_ts, ts_values)
+            outputs = self._decode_outputs(definition, raw, ordinals, ts)
+            decoded.setdefault(definition.name, []).append((ordinals, outputs))
+
+        result = {}
+        for name in self.message_names:
+            blocks_for_name = decoded.get(name, [])
+            if name in COLUMNAR_MESSAGE_NAMES:
+                result[name] = _merge_columns(blocks_for_name)
+            else:
+                result[name] = _merge_dicts(blocks_for_name)
+        return result
+
+
+
+class IncrementalFitDecoder(FitNumpyDecoder):
+    """
+    Décodeur reprenable d'un fichier FIT qui grandit (activité en cours de synchronisation).
+
+    Chaque appel à feed décode les seuls messages complets ajoutés depuis l'appel précédent : le
+    balayage reprend à la position atteinte (définitions locales, ordinal, CRC partiel de la section)
+    et s'arrête avant un message coupé par la fin des données, relu en entier à l'appel suivant.
+    L'horodatage des en-têtes compressés et les accumulateurs des composants sont repris d'un appel
+    au suivant. Le fichier partiel doit être un début du fichier final (en-tête déjà écrit, avec sa
+    taille finale).
+    """
+
+    _resumable = True
+
+    def __init__(self, message_names=EXTRACTED_MESSAGE_NAMES, check_crc=True, field_selection=None):
+        super().__init__(b'', message_names, check_crc=check_crc, field_selection=field_selection)
+        self.position = 0
+        self.complete = False
+        # Fin des messages de la section en cours (None entre deux sections), définitions locales et CRC partiel
+        self._section_end = None
+        self._local_defs = None
+        self._crc = 0
+
+    def feed(self, data):
+        """
+        Décode les messages complets de data (contenu actuel du fichier, cf. map_fit_file) situés
+        après la position atteinte.
+
+        Returns:
+            dict: Comme decode, pour les seuls nouveaux messages.
+        """
+        self.data = data
+        self._buffer = np.frombuffer(data, dtype=np.uint8)
+        try:
+            self._scan_available()
+            return self._decode_scanned()
+        finally:
+            # Messages décodés : seules les définitions et les états séquentiels sont gardés
+            for group in self._groups.values():
+                if group.offsets is not None:
+                    group.offsets, group.ordinals = [], []
+            self._compressed, self._definition_events = [], []
+            self.data = self._buffer = None
+
+    def _scan_available(self):
+        data = self.data
+        while not self.complete:
+            if self._section_end is None:
+                available = len(data) - self.position
+                if available < 12 or available < data[self.position]:
+                    # En-tête pas encore écrit en entier
+                    return
+                start = self.position
+                self.position, self._section_end = self._read_file_header(start)
+                self._local_defs = [None] * 16
+                self._crc = _crc16(data[start:self.position])
+
+            end = self._section_end
+            position, ordinal = self.position, self._ordinal
+            while position < end:
+                size = self._message_size(position)
+                if size is None or position + size > len(data):
+                    break
+                if position + size > end:
+                    raise FitEOFError("Truncated message at the end of the .FIT file")
+                position, ordinal = self._scan_message(position, self._local_defs, ordinal)
+            if self.check_crc:
+                self._crc = _crc16(data[self.position:position], self._crc)
+            self.position, self._ordinal = position, ordinal
+            if position < end or len(data) < end + 2:
+                return
+
+            if self.check_crc and int.from_bytes(data[end:end + 2], 'little') != self._crc:
+                raise FitCRCError('CRC Mismatch')
+            self.position, self._section_end = end + 2, None
+            self.complete = self.position >= len(data)
+
+    def _message_size(self, position):
+        """Taille du message qui commence à position, None si les octets qui la donnent manquent encore."""
+        data = self.data
+        if position >= len(data):
+            return None
+        header = data[position]
+        if header & 0x80:
+            definition = self._local_defs[(header >> 5) & 0x3]
+        elif header & 0x40:
+            if position + 6 > len(data):
+                return None
+            size = 6 + 3 * data[position + 5]
+            if header & 0x20:
+                if position + size >= len(data):
+                    return None
+                size += 1 + 3 * data[position + size]
+            return size
+        else:
+            definition = self._local_defs[header & 0xF]
+        # Type local inconnu : l'erreur est levée par _scan_message
+        return 1 if definition is None else 1 + definition.size
+
+def _sorted_outputs(outputs):
+    """Ordre d'itération d'un DataMessage fitparse : champs connus puis inconnus, par nom (tri stable)."""
+    return sorted(outputs, key=lambda output: (int(output[1]), output[0]))
+
+
+def _merge_dicts(blocks):
+    """Blocs décodés -> liste de dictionnaires dans l'ordre du fichier (comme message_to_dict)."""
+    rows = []
+    for ordinals, outputs in blocks:
+        ordered = _sorted_outputs(outputs)
+        lists = []
+        for name, _, mask, column in ordered:
+            values = [None] * len(mask)
+            for position, value in zip(np.flatnonzero(mask).tolist(), column.to_list()):
+                values[position] = value
+            lists.append((name, mask.tolist(), values))
+        for i, ordinal in enumerate(ordinals.tolist()):
+            row = {}
+            for name, mask, values in lists:
+                if mask[i]:
+                    row[name] = values[i]
+            rows.append((ordinal, row))
+    rows.sort(key=lambda item: item[0])
+    return [row for _, row in rows]
+
+
+def _merge_columns(blocks):
+    """
+    Blocs décodés -> colonnes {nom: tableau} dans l'ordre du fichier, avec les dtypes
+    que pandas infèrerait d'une liste de dictionnaires (int64 complet, float64 + NaN, objets).
+    """
+    if not blocks:
+        return {}
+    all_ordinals = np.concatenate([ordinals for ordinals, _ in blocks])
+    order = np.argsort(all_ordinals, kind='stable')
+    positions = np.empty(len(order), dtype=np.int64)
+    positions[order] = np.arange(len(order))
+    total = len(order)
+
+    parts = {}
+    names_in_order = []
+    start = 0
+    for ordinals, outputs in blocks:
+        block_positions = positions[start:start + len(ordinals)]
+        start += len(ordinals)
+        # Un nom répété dans un message (composant + champ explicite) : la dernière valeur l'emporte
+        for name, _, mask, column in _sorted_outputs(outputs):
+            if name not in parts:
+                parts[name] = []
+                names_in_order.append(name)
+            parts[name].append((block_positions[mask], column))
+
+    columns = {}
+    for name in names_in_order:
+        columns[name] = _assemble_column(parts[name], total)
+    return columns
+
+
+def _assemble_column(parts, total):
+    present = np.zeros(total, dtype=bool)
+    missing = np.zeros(total, dtype=bool)
+    for positions, column in parts:
+        present[positions] = True
+        missing[positions] = column.missing
+    complete = present.all() and not missing.any()
+    kinds = {column.values.dtype.kind for _, column in parts}
+
+    if kinds <= {'i', 'u'} and complete:
+        out = np.empty(total, dtype=np.int64)
+        for positions, column in parts:
+            out[positions] = column.values
+        return out
+    if kinds <= {'i', 'u', 'f'}:
+        out = np.full(total, np.nan, dtype=np.float64)
+        for positions, column in parts:
+            values = column.values.astype(np.float64)
+            values[column.missing] = np.nan
+            out[positions] = values
+        if present.any() and not (present & ~missing).any():
+            # Colonne entièrement vide (None) : pandas la garde en objets
+            return np.full(total, None, dtype=object)
+        return out
+    if kinds == {'M'}:
+        out = np.full(total, np.datetime64('NaT'), dtype='datetime64[s]')
+        for positions, column in parts:
+            out[positions] = column.values
+        return out
+    out = np.full(total, None, dtype=object)
+    for positions, column in parts:
+        out[positions] = column.to_objects()
+    return out
+
+
+def map_fit_file(fit_file_path):
+    """
+    Projette un fichier FIT en mémoire, en lecture seule : memoryview sur la projection (b'' pour un
+    fichier vide, qui ne peut pas être projeté). La projection est libérée avec le dernier objet qui
+    la référence ; le fichier ne doit pas être tronqué entre-temps.
+    """
+    with open(fit_file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b'')
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def decode_fit_messages(fit_file_path, message_names=EXTRACTED_MESSAGE_NAMES, check_crc=True, field_selection=None,
+                        timings=None, mapped=False):
+    """
+    Décode un fichier FIT avec le moteur NumPy.
+    Même structure de retour que collect_fit_messages, sauf 'record' renvoyé en colonnes.
+    timings (StageTimings | None) : chronométrage des étapes 'fit_open' (lecture) et 'record_decode'.
+    mapped (bool) : décode le fichier projeté en mémoire (cf. map_fit_file) au lieu de le lire.
+    """
+    with timed_stage(timings, 'fit_open'):
+        data = map_fit_file(fit_file_path) if mapped else Path(fit_file_path).read_bytes()
+    with timed_stage(timings, 'record_decode'):
+        return FitNumpyDecoder(data, message_names, check_crc=check_crc, field_selection=field_selection).decode()
+
+
+# --- Vérification de compatibilité avec fitparse ---
+
+def check_fitparse_compatibility(fit_file_path):
+    """
+    Exécute les pipelines d'extraction avec fitparse puis avec le moteur NumPy (fichier lu et
+    fichier projeté en mémoire) et compare octet par octet les CSV produits (records, laps, records V3).
+
+    Returns:
+        dict: Nom du fichier -> True si les sorties sont identiques.
+    """
+    import extract_fit_file
+    import extract_fit_file_for_V3
+    from fit_messages import load_fit_messages
+
+    outputs = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for engine in ('fitparse', 'numpy', 'mmap'):
+            engine_dir = Path(tmp) / engine
+            engine_dir.mkdir()
+            fit_messages = load_fit_messages(fit_file_path, message_names=extract_fit_file.EXTRACTED_MESSAGES,
+                                             engine=engine, field_selection=extract_fit_file.FIT_FIELD_SELECTION)
+            extract_fit_file.parse_fit(fit_messages).to_csv(engine_dir / 'records.csv', index=False)
+            extract_fit_file.export_lap_csv(fit_messages['lap'], engine_dir / 'laps.csv')
+            fit_messages = load_fit_messages(fit_file_path, message_names=extract_fit_file_for_V3.EXTRACTED_MESSAGES,
+                                             engine=engine, field_selection=extract_fit_file_for_V3.FIT_FIELD_SELECTION)
+            extract_fit_file_for_V3.parse_fit_records(fit_messages).to_csv(engine_dir / 'records_v3.csv', index=False)
+            outputs[engine] = {p.name: p.read_bytes() for p in engine_dir.iterdir()}
+
+    return {name: all(outputs[engine].get(name) == content for engine in ('numpy', 'mmap'))
+            for name, content in outputs['fitparse'].items()}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(json.dumps({"status": "error", "message": "Usage: python fit_numpy_decoder.py path/to/file.fit [...]"}))
+        sys.exit(1)
+    report = {path: check_fitparse_compatibility(path) for path in sys.argv[1:]}
+    print(json.dumps(report, indent=4))
+    sys.exit(0 if all(all(r.values()) for r in report.values()) else 1)
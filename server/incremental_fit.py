@@ -0,0 +1,534 @@
+"""
+Ingestion incrémentale d'une activité en cours de synchronisation (fichier FIT partiel qui grandit).
+
+Les octets ajoutés au fichier sont décodés par le moteur NumPy (IncrementalFitDecoder, cf.
+fit_numpy_decoder) : chaque mise à jour projette le fichier en mémoire et ne décode que les messages
+complets ajoutés depuis la précédente ; un message coupé par la fin du fichier est relu en entier à la
+mise à jour suivante. Le fichier partiel doit être un début du fichier final (en-tête déjà écrit, avec
+sa taille finale).
+
+IncrementalActivity garde l'état dérivé des records déjà traités, bloc par bloc :
+    - premier / dernier timestamp et pause cumulée du temps de déplacement (cf. prepare_record_chunk),
+    - débuts et natures des laps (messages 'lap', écrits à la fin de chaque lap),
+    - numéro de lap, début du lap et temps écoulé dans le lap de chaque record,
+    - agrégats de chaque lap par bloc (records, vitesse, FC, distance), pour le lap en cours.
+Une mise à jour ne traite que les nouveaux messages ; un nouveau lap ne réassigne que les records
+postérieurs à son début (les records du lap en cours). Les natures des laps, qui dépendent de toute
+la séquence, sont reclassées sur la table des laps (quelques dizaines de lignes).
+
+Les records dont le lap et sa nature ne peuvent plus changer deviennent définitifs : convertis une
+seule fois dans la table courante, ils sont ajoutés aux fichiers de records (TableStreamWriter) sans
+réécrire les précédents. Le coût d'une mise à jour dépend des nouveaux messages, pas de la taille de
+l'activité.
+
+records() et laps() renvoient les mêmes tables que parse_fit et build_lap_table sur le fichier
+complet ; une fois tout le fichier reçu, les fichiers écrits sont identiques à ceux de l'extraction.
+
+La commande a lancer (suivi d'un fichier en cours de synchronisation, une ligne JSON par mise à jour) :
+    python incremental_fit.py path/to/file.fit path/to/output_dir/ [--interval 5] [--idle-timeout 600] [--format csv]
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from fit_numpy_decoder import IncrementalFitDecoder, map_fit_file
+from table_outputs import (write_tables, parse_output_formats, TableStreamWriter, DEFAULT_OUTPUT_FORMATS,
+                           OUTPUT_FORMATS)
+from compact_schema import LAP_NATURE_DTYPE
+from extract_fit_file import (EXTRACTED_MESSAGES, FIT_FIELD_SELECTION, UnorderedRecordsError, parse_fit,
+                              prepare_record_chunk, build_lap_index, assign_lap_numbers, build_lap_table,
+                              _update_column_stats, _update_timestamp_stats, _record_table_schema, _csv_date_format)
+
+# Agrégats d'un lap par bloc de records : effectif, somme et effectif des vitesses, somme, effectif
+# et max de la FC, distance min et max
+_AGGREGATES = ('n_records', 'speed_sum', 'speed_n', 'hr_sum', 'hr_n', 'hr_max', 'distance_min', 'distance_max')
+
+
+def _new_decoder():
+    return IncrementalFitDecoder(EXTRACTED_MESSAGES, field_selection=FIT_FIELD_SELECTION)
+
+
+def _lap_aggregates(df, lap_numbers):
+    """Agrégats de chaque lap présent dans un bloc de records (cf. _AGGREGATES) : lap -> tableau."""
+    def column(col):
+        if col not in df.columns:
+            return np.full(len(df), np.nan)
+        return df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    speed, heart_rate, distance = column('speed_kmh'), column('heart_rate'), column('distance')
+    laps, inverse = np.unique(lap_numbers, return_inverse=True)
+    aggregates = {}
+    for position, lap in enumerate(laps.tolist()):
+        mask = inverse == position
+        lap_speed, lap_hr, lap_distance = speed[mask], heart_rate[mask], distance[mask]
+        has_hr, has_distance = (~np.isnan(lap_hr)).any(), (~np.isnan(lap_distance)).any()
+        aggregates[lap] = np.array([
+            mask.sum(), np.nansum(lap_speed), (~np.isnan(lap_speed)).sum(),
+            np.nansum(lap_hr), (~np.isnan(lap_hr)).sum(), np.nanmax(lap_hr) if has_hr else np.nan,
+            np.nanmin(lap_distance) if has_distance else np.nan,
+            np.nanmax(lap_distance) if has_distance else np.nan,
+        ])
+    return aggregates
+
+
+def _merge_aggregates(first, second):
+    """Agrégats d'un lap sur deux ensembles de records : sommes, max de la FC, distance min et max."""
+    return np.concatenate((first[:5] + second[:5], [np.fmax(first[5], second[5]), np.fmin(first[6], second[6]),
+                                                    np.fmax(first[7], second[7])]))
+
+
+def _cast_columns(df, dtypes):
+    """Types de la table complète (cf. _record_table_schema)."""
+    for col, dtype in dtypes.items():
+        if df[col].dtype != dtype:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+class _RecordChunk(object):
+    """
+    Records en attente d'une mise à jour : colonnes indépendantes des laps (prepare_record_chunk)
+    et colonnes de lap. start : rang du premier record du bloc dans l'activité.
+    """
+
+    def __init__(self, df, start):
+        self.df = df
+        self.start = start
+        self.timestamps = df['timestamp'].to_numpy().astype('datetime64[ns]')
+        self.elapsed = df['elapsed_time_s'].to_numpy(dtype=np.float64)
+        self.lap_numbers = None
+        self.elapsed_in_lap = None
+        self.aggregates = {}
+
+    def update_aggregates(self):
+        self.aggregates = _lap_aggregates(self.df, self.lap_numbers)
+
+    def split(self, count):
+        """Bloc des count premiers records et bloc des suivants."""
+        parts = []
+        for rows, start in ((slice(None, count), self.start), (slice(count, None), self.start + count)):
+            part = _RecordChunk(self.df.iloc[rows].reset_index(drop=True), start)
+            part.lap_numbers = self.lap_numbers[rows]
+            part.elapsed_in_lap = self.elapsed_in_lap[rows]
+            part.update_aggregates()
+            parts.append(part)
+        return parts
+
+
+class IncrementalActivity(object):
+    """
+    Activité reconstruite au fil des mises à jour d'un fichier FIT partiel (cf. docstring du module).
+
+    Les records dont le lap et sa nature ne peuvent plus changer (cf. _final_boundary) sont convertis
+    une seule fois et ajoutés à la table courante (final_frames) ; seuls les records du lap en cours
+    restent en attente (chunks).
+
+    Si les records ne sont pas dans l'ordre chronologique (tri global de parse_fit), ou si un lap
+    commence avant des records déjà définitifs, la table des records est recalculée par parse_fit sur
+    la partie décodée du fichier à chaque demande.
+    """
+
+    def __init__(self, fit_file_path):
+        self.fit_file_path = Path(fit_file_path)
+        self.decoder = _new_decoder()
+        self.n_records = 0
+        self.n_chunks = 0
+        self.lap_messages = []
+        self.carry = {}
+        self.column_stats = {}
+        self.timestamp_stats = {'fractional': False, 'dates_only': True}
+        self.lap_index = None
+        # Lap -> (temps écoulé au début du lap, rang de son premier record)
+        self.lap_starts = {}
+        self.ordered = True
+        # Records en attente, puis table courante des records définitifs et agrégats de leurs laps
+        self.chunks = []
+        self.final_frames = []
+        self.final_aggregates = {}
+        # Conversion des records définitifs : colonnes et types, format des dates du CSV, débuts et
+        # natures de leurs laps
+        self.final_schema = None
+        self.final_date_format = None
+        self.final_starts = None
+        self.final_natures = []
+        # Fichiers de records en cours d'écriture (cf. write)
+        self.writer = None
+        self.writer_target = None
+        self.records_paths = {}
+        self.n_written = 0
+        self.rewrite = False
+        self.laps_target = None
+        self.laps_paths = {}
+
+    @property
+    def complete(self):
+        return self.decoder.complete
+
+    def update(self):
+        """
+        Décode les messages ajoutés au fichier et met à jour l'état de l'activité.
+
+        Returns:
+            dict: new_records, new_laps, records, laps, offset (octets décodés), complete.
+        """
+        if self.complete:
+            messages = {'record': {}, 'lap': []}
+        else:
+            messages = self.decoder.feed(map_fit_file(self.fit_file_path))
+        columns = messages['record']
+        new_records = len(next(iter(columns.values()))) if columns else 0
+        new_laps = messages['lap']
+        self.n_records += new_records
+        self.lap_messages.extend(new_laps)
+
+        if self.ordered:
+            previous_starts = None if self.lap_index is None else self.lap_index[0]
+            if new_laps:
+                self.lap_index = build_lap_index(self.lap_messages)
+                if self.final_starts is not None and \
+                        not np.array_equal(self.lap_index[0][:len(self.final_starts)], self.final_starts):
+                    self._switch_to_full_parse()
+        if self.ordered:
+            chunk = None
+            if new_records:
+                try:
+                    chunk = _RecordChunk(prepare_record_chunk(columns, self.carry), self.n_records - new_records)
+                except UnorderedRecordsError:
+                    self._switch_to_full_parse()
+        if self.ordered:
+            if chunk is not None:
+                self.n_chunks += 1
+                _update_column_stats(self.column_stats, chunk.df)
+                _update_timestamp_stats(self.timestamp_stats, chunk.df['timestamp'])
+                self.chunks.append(chunk)
+            self._assign_laps(self._reassigned_from(previous_starts, new_laps), chunk)
+            self._refresh_final_frames()
+            self._finalize(everything=self.complete)
+
+        return {
+            "new_records": new_records,
+            "new_laps": len(new_laps),
+            "records": self.n_records,
+            "laps": len(self.lap_messages),
+            "offset": self.decoder.position,
+            "complete": self.complete,
+        }
+
+    def _switch_to_full_parse(self):
+        """Passage au recalcul par parse_fit (cf. docstring de la classe) : l'état par bloc est abandonné."""
+        self.ordered = False
+        self.chunks, self.final_frames = [], []
+        self.rewrite = True
+
+    def _reassigned_from(self, previous_starts, new_laps):
+        """
+        Premier bloc en attente dont les laps doivent être réassignés après l'arrivée de nouveaux laps :
+        celui qui contient le début du premier nouveau lap, ou 0 (tous les blocs) si des records
+        précèdent le premier lap (assignés au dernier lap) ou si un lap commence avant un lap déjà connu.
+        """
+        if not new_laps or not self.chunks:
+            return len(self.chunks)
+        starts = None if self.lap_index is None else self.lap_index[0]
+        if previous_starts is None or starts is None or self.chunks[0].timestamps[0] < starts[0]:
+            return 0
+        if len(starts) <= len(previous_starts) or not np.array_equal(starts[:len(previous_starts)], previous_starts):
+            return 0
+        first_new = starts[len(previous_starts)]
+        index = len(self.chunks)
+        while index > 0 and self.chunks[index - 1].timestamps[-1] >= first_new:
+            index -= 1
+        return index
+
+    def _assign_laps(self, first_chunk, new_chunk):
+        """Numéros de lap, débuts de lap et temps écoulé dans le lap des blocs réassignés et du nouveau bloc."""
+        reassigned = self.chunks[first_chunk:]
+        if new_chunk is not None and new_chunk not in reassigned:
+            reassigned.append(new_chunk)
+        if not reassigned:
+            return
+
+        # Débuts de lap venant des blocs réassignés : recalculés
+        first_row = reassigned[0].start
+        self.lap_starts = {lap: start for lap, start in self.lap_starts.items() if start[1] < first_row}
+        for chunk in reassigned:
+            if self.lap_index is None:
+                chunk.lap_numbers = np.ones(len(chunk.df), dtype=np.int64)
+            else:
+                chunk.lap_numbers = assign_lap_numbers(self.lap_index[0], chunk.timestamps)
+            laps, first_positions = np.unique(chunk.lap_numbers, return_index=True)
+            for lap, position in zip(laps.tolist(), first_positions.tolist()):
+                if lap not in self.lap_starts:
+                    self.lap_starts[lap] = (chunk.elapsed[position], chunk.start + position)
+
+        for chunk in reassigned:
+            lap_start_elapsed = np.array([self.lap_starts[lap][0] for lap in chunk.lap_numbers.tolist()])
+            chunk.elapsed_in_lap = np.round(chunk.elapsed - lap_start_elapsed, 1)
+            chunk.update_aggregates()
+
+    def _lap_natures(self):
+        if self.lap_index is None:
+            return np.full(2, 'Unknown', dtype=object)
+        return self.lap_index[1]
+
+    def _schema(self):
+        """Colonnes et types de la table complète des records reçus (cf. _record_table_schema)."""
+        columns, dtypes, _ = _record_table_schema(self.column_stats, self.n_chunks)
+        return columns, dtypes
+
+    def _final_boundary(self):
+        """
+        Timestamp avant lequel les records en attente sont définitifs, None si aucun ne l'est.
+
+        Le numéro de lap d'un record est fixé quand le lap suivant a commencé ; sa nature l'est quand
+        un lap d'intensité a été reçu après lui (cf. classify_lap_nature_by_speed : les laps qui suivent
+        le dernier lap d'intensité sont reclassés à l'arrivée d'un nouveau). Sans lap d'intensité, les
+        laps terminés sont pris comme définitifs : un premier lap d'intensité les reclasse (cf.
+        _refresh_final_frames).
+        """
+        if self.lap_index is None or not self.chunks:
+            return None
+        starts, natures = self.lap_index
+        if self.chunks[0].timestamps[0] < starts[0]:
+            # Records antérieurs au premier lap : assignés au dernier lap
+            return None
+        intensity_laps = np.flatnonzero(natures[1:len(starts) + 1] == 'Intensity') + 1
+        last_final_lap = len(starts) - 1
+        if len(intensity_laps):
+            last_final_lap = min(last_final_lap, int(intensity_laps[-1]))
+        return starts[last_final_lap] if last_final_lap > 0 else None
+
+    def _convert(self, chunk, columns, dtypes):
+        """Records d'un bloc avec leurs colonnes de lap, dans les colonnes et types de la table complète."""
+        df = chunk.df.assign(
+            lap_number=chunk.lap_numbers,
+            lap_nature=pd.Categorical(self._lap_natures()[chunk.lap_numbers], dtype=LAP_NATURE_DTYPE),
+            elapsed_time_in_lap_s=chunk.elapsed_in_lap,
+        )
+        return _cast_columns(df.reindex(columns=columns), dtypes)
+
+    def _finalize(self, everything=False):
+        """Records en attente devenus définitifs (tous si everything) : convertis et ajoutés à la table courante."""
+        boundary = None if everything else self._final_boundary()
+        if not everything and boundary is None:
+            return
+        final = []
+        while self.chunks:
+            chunk = self.chunks[0]
+            count = len(chunk.df) if everything else int(np.searchsorted(chunk.timestamps, boundary, side='left'))
+            if count == 0:
+                break
+            if count < len(chunk.df):
+                part, self.chunks[0] = chunk.split(count)
+                final.append(part)
+                break
+            final.append(self.chunks.pop(0))
+        if not final:
+            return
+
+        columns, dtypes = self.final_schema = self._schema()
+        self.final_date_format = _csv_date_format(self.timestamp_stats)
+        for chunk in final:
+            self.final_frames.append(self._convert(chunk, columns, dtypes))
+            for lap, aggregates in chunk.aggregates.items():
+                previous = self.final_aggregates.get(lap)
+                self.final_aggregates[lap] = aggregates if previous is None else _merge_aggregates(previous, aggregates)
+        last_lap = int(final[-1].lap_numbers[-1])
+        if self.lap_index is not None:
+            self.final_starts = self.lap_index[0][:last_lap + 1]
+        self.final_natures = self._lap_natures()[1:last_lap + 1].tolist()
+
+    def _refresh_final_frames(self):
+        """
+        Table courante remise à jour quand un nouveau bloc change les colonnes ou types de la table
+        complète, ou qu'un lap d'intensité reclasse des laps déjà définitifs : les fichiers de records
+        sont alors réécrits (cf. write). Il en va de même si le format des dates du CSV change.
+        """
+        if not self.final_frames:
+            return
+        schema = self._schema()
+        if schema != self.final_schema:
+            columns, dtypes = self.final_schema = schema
+            self.final_frames = [_cast_columns(frame.reindex(columns=columns), dtypes) for frame in self.final_frames]
+            self.rewrite = True
+        natures = self._lap_natures()
+        if natures[1:len(self.final_natures) + 1].tolist() != self.final_natures:
+            for frame in self.final_frames:
+                frame['lap_nature'] = pd.Categorical(natures[frame['lap_number'].to_numpy()], dtype=LAP_NATURE_DTYPE)
+            self.final_natures = natures[1:len(self.final_natures) + 1].tolist()
+            self.rewrite = True
+        date_format = _csv_date_format(self.timestamp_stats)
+        if date_format != self.final_date_format:
+            self.final_date_format = date_format
+            self.rewrite = True
+
+    def records(self):
+        """
+        Table des records reçus, identique à parse_fit sur les mêmes messages (None s'il n'y en a aucun) :
+        table courante des records définitifs et records en attente.
+        """
+        if not self.n_records:
+            return None
+        if not self.ordered:
+            # Partie du fichier déjà décodée, relue en un seul passage
+            data = map_fit_file(self.fit_file_path)[:self.decoder.position]
+            return parse_fit(_new_decoder().feed(data))
+        columns, dtypes = self._schema()
+        pending = [self._convert(chunk, columns, dtypes) for chunk in self.chunks]
+        return pd.concat(self.final_frames + pending, ignore_index=True)
+
+    def laps(self):
+        """Table des laps reçus (build_lap_table), None s'il n'y en a aucun."""
+        return build_lap_table(self.lap_messages)
+
+    def current_lap(self):
+        """
+        Lap du dernier record reçu : numéro, nature provisoire, début, et agrégats de ses records
+        (effectif, vitesse moyenne, FC moyenne et max, distance parcourue).
+        """
+        if not self.ordered or not self.n_records:
+            return None
+        if self.chunks:
+            lap, last_elapsed = int(self.chunks[-1].lap_numbers[-1]), self.chunks[-1].elapsed[-1]
+        else:
+            last = self.final_frames[-1]
+            lap, last_elapsed = int(last['lap_number'].iloc[-1]), last['elapsed_time_s'].iloc[-1]
+        start_elapsed = self.lap_starts[lap][0]
+        parts = [chunk.aggregates[lap] for chunk in self.chunks if lap in chunk.aggregates]
+        if lap in self.final_aggregates:
+            parts.insert(0, self.final_aggregates[lap])
+        aggregates = parts[0]
+        for part in parts[1:]:
+            aggregates = _merge_aggregates(aggregates, part)
+        stats = dict(zip(_AGGREGATES, aggregates.tolist()))
+
+        def ratio(total, count):
+            return round(total / count, 2) if count else None
+
+        return {
+            "lap_number": lap,
+            "lap_nature": str(self._lap_natures()[lap]),
+            "start_elapsed_s": float(start_elapsed),
+            "elapsed_s": round(float(last_elapsed - start_elapsed), 1),
+            "n_records": int(stats['n_records']),
+            "avg_speed_kmh": ratio(stats['speed_sum'], stats['speed_n']),
+            "avg_heart_rate": ratio(stats['hr_sum'], stats['hr_n']),
+            "max_heart_rate": None if np.isnan(stats['hr_max']) else float(stats['hr_max']),
+            "distance_m": None if np.isnan(stats['distance_max'])
+            else round(float(stats['distance_max'] - stats['distance_min']), 2),
+        }
+
+    def write(self, output_dir, formats=DEFAULT_OUTPUT_FORMATS):
+        """
+        Écrit les records définitifs et les laps reçus (<nom>_records.*, <nom>_laps.*), comme l'extraction.
+
+        Seuls les records devenus définitifs depuis l'appel précédent sont ajoutés aux fichiers de
+        records (TableStreamWriter), réécrits en entier seulement si la table courante a changé (cf.
+        _refresh_final_frames). Le CSV est lisible à tout moment ; les fichiers Parquet et Arrow ne
+        sont terminés qu'une fois tout le fichier FIT reçu (ou à close()). La table des laps, petite,
+        est réécrite à l'arrivée de chaque lap.
+
+        Returns:
+            dict: records_paths, laps_paths (format -> chemin).
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        formats = tuple(formats)
+        self._write_records(output_dir / f"{self.fit_file_path.stem}_records", formats)
+
+        laps_target = (output_dir, formats, len(self.lap_messages))
+        if laps_target != self.laps_target:
+            df_laps = self.laps()
+            if df_laps is not None:
+                self.laps_paths = write_tables(df_laps, output_dir / f"{self.fit_file_path.stem}_laps", formats)
+            self.laps_target = laps_target
+        return {"records_paths": self.records_paths, "laps_paths": self.laps_paths}
+
+    def _write_records(self, output_base, formats):
+        if not self.ordered:
+            self._close_writer()
+            df = self.records()
+            if df is not None:
+                self.records_paths = write_tables(df, output_base, formats)
+            return
+        if (output_base, formats) != self.writer_target or self.rewrite:
+            self._close_writer()
+            self.writer_target, self.n_written, self.rewrite = (output_base, formats), 0, False
+        if self.n_written < len(self.final_frames):
+            if self.writer is None:
+                _, _, schema_sample = _record_table_schema(self.column_stats, self.n_chunks)
+                self.writer = TableStreamWriter(output_base, formats, schema_sample=schema_sample,
+                                                csv_date_format=self.final_date_format)
+                self.records_paths = {fmt: str(path) for fmt, path in self.writer.paths.items()}
+            for frame in self.final_frames[self.n_written:]:
+                self.writer.write(frame)
+            self.n_written = len(self.final_frames)
+        if self.complete:
+            self._close_writer()
+
+    def _close_writer(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def close(self):
+        """Fin du suivi : les records en attente sont pris comme définitifs et les fichiers de records terminés."""
+        if self.ordered:
+            self._finalize(everything=True)
+        if self.writer_target is not None:
+            self._write_records(*self.writer_target)
+        self._close_writer()
+
+
+def follow(fit_file_path, output_dir, formats=DEFAULT_OUTPUT_FORMATS, interval_s=5.0, idle_timeout_s=600.0):
+    """
+    Suit un fichier FIT en cours de synchronisation : à chaque nouveau message, met à jour les tables
+    écrites dans output_dir et génère l'état de la mise à jour, jusqu'à la fin du fichier (CRC final lu)
+    ou idle_timeout_s secondes sans nouvelle donnée. Chaque mise à jour n'écrit que les nouveaux records
+    définitifs (cf. IncrementalActivity.write).
+    """
+    activity = IncrementalActivity(fit_file_path)
+    last_change = time.monotonic()
+    try:
+        while True:
+            state = activity.update()
+            if state["new_records"] or state["new_laps"] or state["complete"]:
+                last_change = time.monotonic()
+                state.update(activity.write(output_dir, formats))
+                state["current_lap"] = activity.current_lap()
+                yield state
+            if state["complete"] or time.monotonic() - last_change >= idle_timeout_s:
+                return
+            time.sleep(interval_s)
+    finally:
+        activity.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suivi incrémental d'un fichier FIT en cours de synchronisation")
+    parser.add_argument("fit_file_path")
+    parser.add_argument("output_dir")
+    parser.add_argument("--interval", type=float, default=5.0)
+    parser.add_argument("--idle-timeout", type=float, default=600.0)
+    parser.add_argument("--format", dest="formats", default=",".join(DEFAULT_OUTPUT_FORMATS),
+                        help=f"Formats de sortie ({','.join(OUTPUT_FORMATS)})")
+    args = parser.parse_args()
+
+    try:
+        formats = parse_output_formats(args.formats)
+        for state in follow(args.fit_file_path, args.output_dir, formats, args.interval, args.idle_timeout):
+            print(json.dumps({"status": "success", **state}), flush=True)
+    except FileNotFoundError:
+        print(json.dumps({"status": "error", "message": f"Erreur: Fichier FIT non trouvé à l'emplacement '{args.fit_file_path}'"}))
+        sys.exit(1)
+    except Exception as e:
+        print(json.dumps({"status": "error", "message": f"Une erreur inattendue s'est produite: {e}"}))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
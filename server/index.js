@@ -5,7 +5,7 @@ const multer = require('multer');
 const cors = require('cors');
 const path = require('path');
 const fs = require('fs');
-const { spawn } = require('child_process'); 
+const { FitWorkerPool, FitJobQueue } = require('./fitWorkerPool');
 
 const app = express();
 const port = 5000; 
@@ -19,6 +19,44 @@ app.use(cors({
 const uploadDir = path.join(__dirname, 'uploads');
 const resultsDir = path.join(__dirname, 'results');
 const PYTHON_SCRIPT_PATH = path.join(__dirname, 'extract_fit_file.py'); 
+const JOB_QUEUE_SCRIPT_PATH = path.join(__dirname, 'job_queue.py');
+
+// --- Pool de workers Python persistants (évite de ré-importer pandas/fitparse à chaque upload) ---
+const pythonExecutable = 'python'; 
+const FIT_WORKER_POOL_SIZE = parseInt(process.env.FIT_WORKER_POOL_SIZE, 10) || 2;
+// File d'attente des extractions (cf. job_queue.py, base results/jobs.sqlite) : avec FIT_JOB_QUEUE=1,
+// /upload ne fait que mettre le fichier en file (202 + jobId) et le client suit le job sur GET /jobs/:id ;
+// FIT_JOB_WORKERS workers (défaut : FIT_WORKER_POOL_SIZE), 503 au-delà de FIT_JOB_MAX_QUEUED jobs en attente
+const FIT_JOB_QUEUE = process.env.FIT_JOB_QUEUE === '1';
+const FIT_JOB_WORKERS = parseInt(process.env.FIT_JOB_WORKERS, 10) || FIT_WORKER_POOL_SIZE;
+const FIT_JOB_MAX_QUEUED = parseInt(process.env.FIT_JOB_MAX_QUEUED, 10) || 100;
+// Moteur de décodage FIT : 'fitparse' (par défaut), 'numpy' (décodeur vectorisé) ou 'mmap' (décodeur
+// vectorisé sur le fichier projeté en mémoire)
+const FIT_DECODER_ENGINE = process.env.FIT_DECODER_ENGINE || 'fitparse';
+// Formats de sortie : 'csv' (par défaut), et/ou 'parquet', 'arrow' (ex: FIT_OUTPUT_FORMATS=csv,parquet)
+const FIT_OUTPUT_FORMATS = process.env.FIT_OUTPUT_FORMATS || 'csv';
+// Extraction en mémoire bornée (mode streaming, décodage fitparse) pour les fichiers FIT d'au moins
+// FIT_STREAM_MIN_BYTES octets (ex: FIT_STREAM_MIN_BYTES=20000000) ; désactivée par défaut
+const FIT_STREAM_MIN_BYTES = parseInt(process.env.FIT_STREAM_MIN_BYTES, 10) || 0;
+// Chronométrage de chaque étape de l'extraction, affiché dans la console (FIT_TIMINGS=1)
+const FIT_TIMINGS = process.env.FIT_TIMINGS === '1';
+// Profilage cProfile des extractions : le fichier .pstats n'est conservé (dans results/) que pour les jobs
+// d'au moins FIT_PROFILE_SLOW_MS millisecondes (ex: FIT_PROFILE_SLOW_MS=5000) ; désactivé par défaut
+const FIT_PROFILE_SLOW_MS = parseInt(process.env.FIT_PROFILE_SLOW_MS, 10) || 0;
+// En mode file d'attente, les workers Python suppriment eux-mêmes les profils des jobs rapides et écrivent
+// les durées des étapes et les erreurs d'historique sur leur stderr (cf. job_queue.report_job_result)
+const fitJobQueue = FIT_JOB_QUEUE
+  ? new FitJobQueue(pythonExecutable, JOB_QUEUE_SCRIPT_PATH, path.join(resultsDir, 'jobs.sqlite'),
+                    { workers: FIT_JOB_WORKERS, maxQueued: FIT_JOB_MAX_QUEUED, profileSlowMs: FIT_PROFILE_SLOW_MS })
+  : null;
+const fitWorkerPool = FIT_JOB_QUEUE ? null : new FitWorkerPool(FIT_WORKER_POOL_SIZE, pythonExecutable, PYTHON_SCRIPT_PATH);
+// Historique local des activités (base SQLite, cf. activity_store.py) : FIT_ACTIVITY_STORE=1 pour
+// results/activities.sqlite, ou le chemin d'une autre base ; désactivé par défaut
+const FIT_ACTIVITY_STORE = process.env.FIT_ACTIVITY_STORE === '1'
+  ? path.join(resultsDir, 'activities.sqlite')
+  : (process.env.FIT_ACTIVITY_STORE || null);
+// Fichiers annexes calculés sur les records (cf. sidecars.py), ex: FIT_SIDECARS=chart_series,records_bin,analysis ; aucun par défaut
+const FIT_SIDECARS = process.env.FIT_SIDECARS || '';
 
 // --- Configuration du stockage pour Multer ---
 const storage = multer.diskStorage({
@@ -35,6 +73,23 @@ const storage = multer.diskStorage({
 
 const upload = multer({ storage: storage });
 
+// Chemins des fichiers produits par une extraction réussie (réponse de /upload et de /jobs/:id)
+const extractionPaths = (result) => ({
+  recordsCsvPath: result.records_csv_path,
+  lapsCsvPath: result.laps_csv_path,
+  recordsPaths: result.records_paths,
+  lapsPaths: result.laps_paths,
+  activityId: result.activity_id,
+  sidecarPaths: result.sidecar_paths
+});
+
+const removeUpload = (fitFilePath) => {
+  fs.unlink(fitFilePath, (err) => {
+       if (err) console.error("Erreur lors de la suppression du fichier FIT temporaire:", err);
+       else console.log(`Fichier FIT temporaire supprimé: ${fitFilePath}`);
+  });
+};
+
 // --- Route d'Upload ---
 app.post('/upload', upload.single('fitFile'), (req, res) => {
   if (!req.file) {
@@ -45,87 +100,141 @@ app.post('/upload', upload.single('fitFile'), (req, res) => {
 
   console.log(`Fichier reçu et stocké : ${fitFilePath}`);
   
-  // --- Exécution du Script Python ---
+  // --- Exécution du Script Python (via un worker du pool) ---
+  const stream = FIT_STREAM_MIN_BYTES > 0 && req.file.size >= FIT_STREAM_MIN_BYTES;
+  const extractionOptions = stream
+    ? { engine: 'fitparse', formats: FIT_OUTPUT_FORMATS, stream: true }
+    : { engine: FIT_DECODER_ENGINE, formats: FIT_OUTPUT_FORMATS };
+  // Pool : la durée totale (timings) décide de la conservation du profil ; la file d'attente mesure elle-même la durée
+  if (FIT_TIMINGS || (FIT_PROFILE_SLOW_MS > 0 && !fitJobQueue)) extractionOptions.timings = true;
+  if (FIT_PROFILE_SLOW_MS > 0) extractionOptions.profile = true;
+  if (FIT_ACTIVITY_STORE) extractionOptions.store = FIT_ACTIVITY_STORE;
+  if (FIT_SIDECARS) extractionOptions.sidecars = FIT_SIDECARS;
 
-  const pythonExecutable = 'python'; 
-  
-  // Arguments: 1. Chemin du script, 2. Chemin du fichier FIT, 3. Chemin du dossier de sortie
-  const pythonProcess = spawn(pythonExecutable, [PYTHON_SCRIPT_PATH, fitFilePath, resultsDir]);
-  
-  let pythonOutput = '';
-  let pythonError = '';
+  if (fitJobQueue) {
+    // Mise en file : le worker supprimera le fichier FIT une fois le job terminé
+    fitJobQueue.enqueue(fitFilePath, resultsDir, extractionOptions, true)
+      .then((reply) => {
+        if (reply.status === 'success') {
+             const { job_id: jobId, state, position } = reply.job;
+             console.log(`Job ${jobId} en file d'attente (position ${position}).`);
+             res.status(202).json({
+                 message: 'Fichier en file d\'attente pour analyse.',
+                 jobId,
+                 state,
+                 position,
+                 statusUrl: `/jobs/${jobId}`
+             });
+             return;
+        }
+        removeUpload(fitFilePath);
+        if (reply.error === 'QUEUE_FULL') {
+             console.warn(reply.message);
+             res.set('Retry-After', '10').status(503).json({ message: reply.message, error: reply.error });
+        } else {
+             res.status(500).json({ message: reply.message, error: reply.error });
+        }
+      })
+      .catch((err) => {
+        console.error('Erreur de la file d\'attente Python:', err.message);
+        removeUpload(fitFilePath);
+        res.status(500).json({
+            message: `Erreur du processus Python: ${err.message}`,
+            error: err.code === 'ENOENT' ? 'PYTHON_EXEC_NOT_FOUND' : 'PYTHON_WORKER_ERROR'
+        });
+      });
+    return;
+  }
 
-  // AJOUT DE L'ÉCOUTEUR 'ERROR' pour capturer les erreurs de lancement
-  pythonProcess.on('error', (err) => {
-      console.error('Erreur fatale lors du lancement du processus Python (exécutable introuvable ?):', err.message);
-      // Envoyer une réponse au client pour débloquer la requête
+  fitWorkerPool.run(fitFilePath, resultsDir, extractionOptions)
+    .then((result) => {
+      if (result.timings) {
+           const { total_s, stages_s, records, laps } = result.timings;
+           if (FIT_TIMINGS) {
+               console.log(`Extraction en ${total_s} s (${records ?? '?'} records, ${laps ?? '?'} laps) :`, stages_s);
+           }
+           if (result.profile_path) {
+               if (total_s * 1000 >= FIT_PROFILE_SLOW_MS) {
+                   console.warn(`Extraction lente (${total_s} s), profil conservé : ${result.profile_path}`);
+               } else {
+                   fs.unlink(result.profile_path, (err) => {
+                       if (err) console.error("Erreur lors de la suppression du profil:", err);
+                   });
+               }
+           }
+      }
+      if (result.store_error) {
+           console.error(result.store_error);
+      }
+      if (result.status === 'success') {
+           // Succès: Renvoyer le chemin des CSV
+           console.log(`Analyse Python terminée avec succès.`);
+           res.json({ 
+               message: 'Fichier analysé, CSV stockés dans le backend.',
+               ...extractionPaths(result)
+           });
+      } else {
+           // Échec : Le script Python a renvoyé un statut d'erreur (géré dans le try/catch Python)
+           console.error(`Erreur d'analyse Python: ${result.message}`);
+           res.status(500).json({
+               message: 'Erreur lors du traitement du fichier par les scripts d\'analyse.',
+               errorDetails: result.message
+           });
+      }
+    })
+    .catch((err) => {
+      // Échec: le worker Python n'a pas pu être lancé ou s'est arrêté pendant le traitement
+      console.error('Erreur du worker Python (exécutable introuvable ?):', err.message);
       if (!res.headersSent) {
           res.status(500).json({
-              message: `Erreur de lancement du script Python: ${err.message}`,
-              error: 'PYTHON_EXEC_NOT_FOUND'
+              message: `Erreur du processus Python: ${err.message}`,
+              error: err.code === 'ENOENT' ? 'PYTHON_EXEC_NOT_FOUND' : 'PYTHON_WORKER_ERROR'
           });
       }
-  });
-
-  // 1. Récupérer la sortie (stdout) - Le JSON résultat y est envoyé
-  pythonProcess.stdout.on('data', (data) => {
-    pythonOutput += data.toString();
-  });
-
-  // 2. Récupérer les erreurs (stderr)
-  pythonProcess.stderr.on('data', (data) => {
-    pythonError += data.toString();
-    console.error(`Python STDERR: ${data.toString().trim()}`);
-  });
-
-  // 3. Gérer la fin du processus
-  pythonProcess.on('close', (code) => {
-    // Supprimer le fichier .fit téléchargé pour le nettoyage
-    fs.unlink(fitFilePath, (err) => {
-         if (err) console.error("Erreur lors de la suppression du fichier FIT temporaire:", err);
-         else console.log(`Fichier FIT temporaire supprimé: ${fitFilePath}`);
+    })
+    .finally(() => {
+      // Supprimer le fichier .fit téléchargé pour le nettoyage
+      removeUpload(fitFilePath);
     });
+});
 
-    if (code === 0) {
-      try {
-        // Le script Python envoie le résultat en JSON à STDOUT
-        const result = JSON.parse(pythonOutput.trim());
-        
-        if (result.status === 'success') {
-             // Succès: Renvoyer le chemin des CSV
-             console.log(`Analyse Python terminée avec succès.`);
-             res.json({ 
-                 message: 'Fichier analysé, CSV stockés dans le backend.',
-                 recordsCsvPath: result.records_csv_path,
-                 lapsCsvPath: result.laps_csv_path
-             });
-        } else {
-             // Échec : Le script Python a renvoyé un statut d'erreur (géré dans le try/catch Python)
-             console.error(`Erreur d'analyse Python: ${result.message}`);
-             res.status(500).json({
-                 message: 'Erreur lors du traitement du fichier par les scripts d\'analyse.',
-                 errorDetails: result.message
-             });
-        }
-      } catch (e) {
-          // Erreur de parsing JSON (si le script Python n'a pas renvoyé de JSON valide)
-          console.error(`Erreur de parsing JSON ou de sortie Python inattendue: ${e}`);
-          console.log(`Sortie brute Python: ${pythonOutput}`);
-          res.status(500).json({
-              message: 'Erreur interne du serveur lors de l\'analyse des données.',
-              error: pythonError || 'Sortie Python non conforme.'
-          });
+// --- Suivi d'un job de la file d'attente (FIT_JOB_QUEUE=1) ---
+// state : queued | running | done | failed ; les chemins des fichiers produits sont renvoyés une fois le job terminé
+app.get('/jobs/:id', (req, res) => {
+  if (!fitJobQueue) {
+    return res.status(404).json({ message: 'File d\'attente désactivée (FIT_JOB_QUEUE=1 pour l\'activer).' });
+  }
+
+  fitJobQueue.status(req.params.id)
+    .then((reply) => {
+      if (reply.status !== 'success') {
+           return res.status(reply.error === 'NOT_FOUND' ? 404 : 500).json({ message: reply.message, error: reply.error });
+      }
+      const job = reply.job;
+      const body = {
+          jobId: job.job_id,
+          state: job.state,
+          position: job.position,
+          createdAt: job.created_at,
+          startedAt: job.started_at,
+          finishedAt: job.finished_at,
+          queueWaitS: job.queue_wait_s,
+          runS: job.run_s
+      };
+      if (job.state === 'done') {
+           Object.assign(body, extractionPaths(job.result));
+           if (job.result.store_error) body.storeError = job.result.store_error;
+      } else if (job.state === 'failed') {
+           body.errorDetails = job.message;
       }
-    } else {
-      // Échec: Le processus Python a échoué (code != 0)
-      console.error(`Processus Python échoué (Code ${code}).`);
+      res.json(body);
+    })
+    .catch((err) => {
       res.status(500).json({
-        message: 'Erreur du processus Python. Vérifiez l\'exécutable Python ou les dépendances.',
-        error: pythonError,
-        output: pythonOutput
+          message: `Erreur du processus Python: ${err.message}`,
+          error: err.code === 'ENOENT' ? 'PYTHON_EXEC_NOT_FOUND' : 'PYTHON_WORKER_ERROR'
       });
-    }
-  });
+    });
 });
 
 app.listen(port, () => {
@@ -0,0 +1,478 @@
+"""
+File d'attente locale des extractions (base SQLite), traitée par un pool fixe de processus workers.
+
+Un job passe par les états queued -> running -> done | failed ; la base garde, pour chacun, les dates
+de création, de début et de fin (attente et durée de traitement) et le JSON de résultat de
+process_fit_file. Aucun broker externe : la base est un fichier (par défaut results/jobs.sqlite),
+les workers y réservent le plus ancien job en attente dans une transaction (BEGIN IMMEDIATE).
+
+Un job réservé porte le pid de son worker et un heartbeat, rafraîchi toutes les HEARTBEAT_INTERVAL_S
+secondes pendant son traitement. Un job "running" dont le worker a disparu (pid inexistant, ou pas de
+heartbeat depuis STALE_AFTER_S secondes) est remis en attente par requeue_stale.
+
+Contre-pression : enqueue refuse un job (QueueFullError) quand max_queued jobs attendent déjà.
+
+Service (lancé par server/index.js avec FIT_JOB_QUEUE=1) :
+    python job_queue.py serve results/jobs.sqlite [--workers N] [--max-queued M] [--profile-slow-ms MS]
+démarre N workers, puis lit des commandes JSON sur stdin, une par ligne, et répond sur stdout :
+    {"request_id", "command": "enqueue", "fit_file_path", "output_dir", "options", "remove_input"}
+    {"request_id", "command": "status", "job_id"}
+Réponse : {"request_id", "status": "success", "job": {...}} ou {"request_id", "status": "error",
+"error": "QUEUE_FULL" | "NOT_FOUND" | "BAD_REQUEST", "message"}. Le service s'arrête à la fin de stdin
+(les jobs en cours sont terminés) ; au démarrage puis toutes les STALE_CHECK_INTERVAL_S secondes, les
+jobs "running" dont le worker a disparu sont remis en attente.
+
+Diagnostics d'un job terminé (comme index.js pour le pool de workers) : durées des étapes (option
+timings) et erreur d'historique (store_error) sur stderr ; le profil .pstats (option profile) n'est
+conservé que si le job a duré au moins --profile-slow-ms millisecondes.
+
+Commandes ponctuelles :
+    python job_queue.py enqueue results/jobs.sqlite path/to/file.fit path/to/output_dir/ [--options JSON]
+    python job_queue.py status results/jobs.sqlite JOB_ID
+    python job_queue.py work results/jobs.sqlite [--workers N]   (workers seuls, sans commandes)
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import argparse
+import threading
+import contextlib
+import multiprocessing
+from pathlib import Path
+from datetime import datetime
+
+DEFAULT_QUEUE_NAME = 'jobs.sqlite'
+DEFAULT_MAX_QUEUED = 100
+JOB_STATES = ('queued', 'running', 'done', 'failed')
+# Attente entre deux recherches de job quand la file est vide
+POLL_INTERVAL_S = 0.2
+# Attente maximale (s) du verrou d'écriture de la base
+BUSY_TIMEOUT_S = 30
+# Heartbeat d'un job en cours ; sans heartbeat depuis STALE_AFTER_S, son worker est considéré disparu
+HEARTBEAT_INTERVAL_S = 5
+STALE_AFTER_S = 60
+STALE_CHECK_INTERVAL_S = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    fit_file_path TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    options TEXT,
+    remove_input INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    worker_pid INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL,
+    result TEXT,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state_created ON jobs (state, created_at);
+"""
+# Colonnes ajoutées au schéma depuis sa première version (bases existantes)
+_ADDED_COLUMNS = {'worker_pid': 'INTEGER', 'heartbeat_at': 'REAL'}
+
+
+class QueueFullError(Exception):
+    """La file contient déjà max_queued jobs en attente."""
+
+
+def _iso(timestamp):
+    return None if timestamp is None else datetime.fromtimestamp(timestamp).isoformat(timespec='milliseconds')
+
+
+def _pid_alive(pid):
+    """
+    Le processus existe-t-il encore ? Sans pid, ou hors POSIX (os.kill(pid, 0) y termine le
+    processus), la réponse est oui : seul le heartbeat compte.
+    """
+    if pid is None or os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobQueue(object):
+    """File d'attente des extractions dans une base SQLite (créée au besoin)."""
+
+    def __init__(self, path, max_queued=DEFAULT_MAX_QUEUED):
+        self.path = Path(path)
+        self.max_queued = max_queued
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), timeout=BUSY_TIMEOUT_S, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        with self._transaction():
+            columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+            for name, sql_type in _ADDED_COLUMNS.items():
+                if name not in columns:
+                    self.conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {sql_type}")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def enqueue(self, fit_file_path, output_dir, options=None, remove_input=False):
+        """
+        Ajoute un job en attente.
+
+        Args:
+            options (dict | None): Passées à process_fit_file (engine, formats, sidecars...).
+            remove_input (bool): Supprimer le fichier FIT une fois le job terminé (upload temporaire).
+
+        Returns:
+            dict: Le job (cf. get). QueueFullError si la file est pleine.
+        """
+        job_id = uuid.uuid4().hex
+        with self._transaction():
+            queued = self.conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued'").fetchone()[0]
+            if queued >= self.max_queued:
+                raise QueueFullError(f"File d'attente pleine ({queued} jobs en attente)")
+            self.conn.execute(
+                "INSERT INTO jobs (job_id, state, fit_file_path, output_dir, options, remove_input, created_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, str(fit_file_path), str(output_dir), json.dumps(options or {}), int(remove_input), time.time()))
+        return self.get(job_id)
+
+    def claim(self, worker):
+        """Réserve le plus ancien job en attente pour ce worker (processus courant) ; None si la file est vide."""
+        with self._transaction():
+            row = self.conn.execute(
+                "SELECT job_id FROM jobs WHERE state = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self.conn.execute(
+                "UPDATE jobs SET state = 'running', worker = ?, worker_pid = ?, started_at = ?, heartbeat_at = ? "
+                "WHERE job_id = ?", (worker, os.getpid(), now, now, row['job_id']))
+        return self._job(row['job_id'])
+
+    def heartbeat(self, job_id, worker):
+        """Signale que le worker traite toujours le job ; False si le job ne lui appartient plus."""
+        with self._transaction():
+            return self.conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE job_id = ? AND state = 'running' AND worker = ?",
+                (time.time(), job_id, worker)).rowcount > 0
+
+    def finish(self, job_id, result, worker=None):
+        """
+        Termine un job avec le résultat de process_fit_file : done si succès, failed sinon. Avec worker,
+        le job n'est terminé que s'il est toujours réservé par ce worker (pas remis en attente entre-temps).
+        """
+        state = 'done' if result.get('status') == 'success' else 'failed'
+        query = "UPDATE jobs SET state = ?, finished_at = ?, result = ?, message = ? WHERE job_id = ?"
+        params = (state, time.time(), json.dumps(result), result.get('message'), job_id)
+        if worker is not None:
+            query += " AND state = 'running' AND worker = ?"
+            params += (worker,)
+        with self._transaction():
+            self.conn.execute(query, params)
+
+    def fail_running(self, worker, message):
+        """Marque en échec le job en cours d'un worker arrêté brutalement ; renvoie les jobs concernés."""
+        with self._transaction():
+            jobs = self.conn.execute("SELECT * FROM jobs WHERE state = 'running' AND worker = ?", (worker,)).fetchall()
+            self.conn.execute(
+                "UPDATE jobs SET state = 'failed', finished_at = ?, message = ? WHERE state = 'running' AND worker = ?",
+                (time.time(), message, worker))
+        return jobs
+
+    def requeue_stale(self, stale_after_s=STALE_AFTER_S):
+        """
+        Remet en attente les jobs "running" dont le worker a disparu (service arrêté ou tué pendant leur
+        traitement) : processus inexistant, ou pas de heartbeat depuis stale_after_s secondes.
+
+        Returns:
+            int: Nombre de jobs remis en attente.
+        """
+        cutoff = time.time() - stale_after_s
+        with self._transaction():
+            rows = self.conn.execute(
+                "SELECT job_id, worker_pid, COALESCE(heartbeat_at, started_at) AS seen_at FROM jobs "
+                "WHERE state = 'running'").fetchall()
+            stale = [(row['job_id'],) for row in rows
+                     if row['seen_at'] is None or row['seen_at'] < cutoff or not _pid_alive(row['worker_pid'])]
+            self.conn.executemany(
+                "UPDATE jobs SET state = 'queued', worker = NULL, worker_pid = NULL, started_at = NULL, "
+                "heartbeat_at = NULL WHERE job_id = ?", stale)
+        return len(stale)
+
+    def counts(self):
+        """Nombre de jobs par état."""
+        counts = dict.fromkeys(JOB_STATES, 0)
+        counts.update(self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+        return counts
+
+    def _job(self, job_id):
+        return self.conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+
+    def get(self, job_id):
+        """
+        État d'un job, ou None s'il n'existe pas.
+
+        Returns:
+            dict: job_id, state, fit_file_path, created_at / started_at / finished_at (ISO),
+            queue_wait_s, run_s, position (rang dans la file, jobs en attente), result (JSON de
+            process_fit_file, jobs terminés), message.
+        """
+        row = self._job(job_id)
+        if row is None:
+            return None
+        created_at, started_at, finished_at = row['created_at'], row['started_at'], row['finished_at']
+        job = {
+            "job_id": row['job_id'],
+            "state": row['state'],
+            "fit_file_path": row['fit_file_path'],
+            "created_at": _iso(created_at),
+            "started_at": _iso(started_at),
+            "finished_at": _iso(finished_at),
+            "queue_wait_s": round((started_at or time.time()) - created_at, 3),
+            "run_s": round(finished_at - started_at, 3) if finished_at and started_at else None,
+            "result": json.loads(row['result']) if row['result'] else None,
+            "message": row['message'],
+        }
+        if row['state'] == 'queued':
+            job["position"] = self.conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND created_at <= ?", (created_at,)).fetchone()[0]
+        return job
+
+
+# --- Workers ---
+
+def report_job_result(job_id, result, run_s, profile_slow_ms=0):
+    """
+    Diagnostics d'un job terminé, sur stderr : durées des étapes (result["timings"]) et erreur
+    d'historique (result["store_error"]). Le profil (result["profile_path"]) est supprimé, et retiré du
+    résultat, si le job a duré moins de profile_slow_ms millisecondes (0 : profil toujours supprimé).
+    """
+    timings = result.get('timings')
+    if timings:
+        print(f"Job {job_id} : extraction en {timings['total_s']} s ({timings.get('records', '?')} records, "
+              f"{timings.get('laps', '?')} laps) : {json.dumps(timings['stages_s'])}", file=sys.stderr)
+    profile_path = result.get('profile_path')
+    if profile_path:
+        if profile_slow_ms > 0 and run_s * 1000 >= profile_slow_ms:
+            print(f"Job {job_id} : extraction lente ({run_s:.3f} s), profil conservé : {profile_path}", file=sys.stderr)
+        else:
+            Path(profile_path).unlink(missing_ok=True)
+            del result['profile_path']
+    if result.get('store_error'):
+        print(f"Job {job_id} : {result['store_error']}", file=sys.stderr)
+
+
+def _run_job(job, profile_slow_ms=0):
+    """Traite un job ; les print() du traitement vont sur stderr (stdout porte les réponses du service)."""
+    from extract_fit_file import process_fit_file
+
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            result = process_fit_file(job['fit_file_path'], job['output_dir'], **json.loads(job['options'] or '{}'))
+    except Exception as e:
+        return {"status": "error", "message": f"Une erreur inattendue s'est produite: {e}"}
+    finally:
+        if job['remove_input']:
+            Path(job['fit_file_path']).unlink(missing_ok=True)
+    report_job_result(job['job_id'], result, time.perf_counter() - start, profile_slow_ms)
+    return result
+
+
+def _heartbeat(queue_path, job_id, worker, done):
+    """Heartbeat d'un job pendant son traitement (thread du worker, connexion à la base séparée)."""
+    with JobQueue(queue_path) as queue:
+        while not done.wait(HEARTBEAT_INTERVAL_S):
+            queue.heartbeat(job_id, worker)
+
+
+def worker_loop(queue_path, worker, stop_event, profile_slow_ms=0):
+    """Boucle d'un worker : réserve et traite les jobs jusqu'à stop_event (job en cours terminé)."""
+    import extract_fit_file  # noqa: F401 (imports de pandas / fitparse payés une fois par worker)
+
+    with JobQueue(queue_path) as queue:
+        while not stop_event.is_set():
+            job = queue.claim(worker)
+            if job is None:
+                stop_event.wait(POLL_INTERVAL_S)
+                continue
+            done = threading.Event()
+            beat = threading.Thread(target=_heartbeat, args=(queue_path, job['job_id'], worker, done), daemon=True)
+            beat.start()
+            try:
+                result = _run_job(job, profile_slow_ms)
+            finally:
+                done.set()
+                beat.join()
+            queue.finish(job['job_id'], result, worker)
+
+
+class WorkerPool(object):
+    """
+    Pool fixe de processus workers ; un worker arrêté brutalement est remplacé (son job passe en échec).
+    Les jobs dont le worker a disparu hors du pool (autre service arrêté) sont remis en attente
+    toutes les STALE_CHECK_INTERVAL_S secondes.
+    """
+
+    def __init__(self, queue_path, size, profile_slow_ms=0):
+        self.queue_path = str(queue_path)
+        self.profile_slow_ms = profile_slow_ms
+        self.context = multiprocessing.get_context('spawn')
+        self.stop_event = self.context.Event()
+        self.processes = {}
+        for index in range(max(1, size)):
+            self._start(f"worker-{os.getpid()}-{index}")
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+
+    def _start(self, name):
+        process = self.context.Process(target=worker_loop, args=(self.queue_path, name, self.stop_event, self.profile_slow_ms),
+                                       name=name, daemon=True)
+        process.start()
+        self.processes[name] = process
+
+    def _watch(self):
+        last_stale_check = time.monotonic()
+        while not self.stop_event.wait(1.0):
+            if time.monotonic() - last_stale_check >= STALE_CHECK_INTERVAL_S:
+                last_stale_check = time.monotonic()
+                with JobQueue(self.queue_path) as queue:
+                    queue.requeue_stale()
+            for name, process in list(self.processes.items()):
+                if not process.is_alive() and not self.stop_event.is_set():
+                    with JobQueue(self.queue_path) as queue:
+                        jobs = queue.fail_running(name, f"Worker arrêté pendant le traitement (code {process.exitcode})")
+                    for job in jobs:
+                        if job['remove_input']:
+                            Path(job['fit_file_path']).unlink(missing_ok=True)
+                    self._start(name)
+
+    def stop(self):
+        """Arrête les workers après leur job en cours."""
+        self.stop_event.set()
+        for process in self.processes.values():
+            process.join()
+
+
+# --- Service (commandes JSON sur stdin) ---
+
+def handle_command(queue, command):
+    """Exécute une commande du service et renvoie la réponse (dictionnaire JSON)."""
+    action = command.get('command')
+    if action == 'enqueue':
+        if not command.get('fit_file_path') or not command.get('output_dir'):
+            return {"status": "error", "error": "BAD_REQUEST", "message": "fit_file_path et output_dir sont requis"}
+        try:
+            job = queue.enqueue(command['fit_file_path'], command['output_dir'], command.get('options'),
+                                command.get('remove_input', False))
+        except QueueFullError as e:
+            return {"status": "error", "error": "QUEUE_FULL", "message": str(e)}
+        return {"status": "success", "job": job}
+    if action == 'status':
+        job = queue.get(str(command.get('job_id')))
+        if job is None:
+            return {"status": "error", "error": "NOT_FOUND", "message": f"Job inconnu: {command.get('job_id')}"}
+        return {"status": "success", "job": job}
+    return {"status": "error", "error": "BAD_REQUEST", "message": f"Commande inconnue: {action}"}
+
+
+def serve(queue_path, workers, max_queued, input_stream=None, output_stream=None, profile_slow_ms=0):
+    input_stream = input_stream or sys.stdin
+    output_stream = output_stream or sys.stdout
+
+    with JobQueue(queue_path, max_queued) as queue:
+        queue.requeue_stale()
+        pool = WorkerPool(queue_path, workers, profile_slow_ms)
+        try:
+            for line in input_stream:
+                line = line.strip()
+                if not line:
+                    continue
+                request_id = None
+                try:
+                    command = json.loads(line)
+                    request_id = command.get('request_id')
+                    response = handle_command(queue, command)
+                except Exception as e:
+                    response = {"status": "error", "error": "BAD_REQUEST", "message": f"Commande invalide: {e}"}
+                response["request_id"] = request_id
+                output_stream.write(json.dumps(response) + '\n')
+                output_stream.flush()
+        finally:
+            pool.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="File d'attente locale des extractions FIT")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    for action in ("serve", "work"):
+        sub = subparsers.add_parser(action)
+        sub.add_argument("queue_path")
+        sub.add_argument("--workers", type=int, default=2)
+        sub.add_argument("--max-queued", type=int, default=DEFAULT_MAX_QUEUED)
+        sub.add_argument("--profile-slow-ms", type=int, default=0,
+                         help="Profils .pstats conservés pour les jobs d'au moins MS millisecondes (0 : jamais)")
+    sub = subparsers.add_parser("enqueue")
+    sub.add_argument("queue_path")
+    sub.add_argument("fit_file_path")
+    sub.add_argument("output_dir")
+    sub.add_argument("--options", default="{}")
+    sub.add_argument("--max-queued", type=int, default=DEFAULT_MAX_QUEUED)
+    sub = subparsers.add_parser("status")
+    sub.add_argument("queue_path")
+    sub.add_argument("job_id")
+    args = parser.parse_args()
+
+    if args.action == "serve":
+        serve(args.queue_path, args.workers, args.max_queued, profile_slow_ms=args.profile_slow_ms)
+        return
+    if args.action == "work":
+        with JobQueue(args.queue_path) as queue:
+            queue.requeue_stale()
+        pool = WorkerPool(args.queue_path, args.workers, args.profile_slow_ms)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pool.stop()
+        return
+
+    with JobQueue(args.queue_path, getattr(args, 'max_queued', DEFAULT_MAX_QUEUED)) as queue:
+        if args.action == "enqueue":
+            command = {"command": "enqueue", "fit_file_path": args.fit_file_path, "output_dir": args.output_dir,
+                       "options": json.loads(args.options)}
+        else:
+            command = {"command": "status", "job_id": args.job_id}
+        response = handle_command(queue, command)
+    print(json.dumps(response))
+    if response["status"] != "success":
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Statistiques par lap calculées à partir des records (et non des messages 'lap' de la montre, exportés
+par build_lap_table / export_lap_csv) : ce que le dashboard (calculateStats, detectLaps) et les scripts
+d'analyse recalculent aujourd'hui en parcourant tous les points de chaque lap.
+
+Un seul passage : les records sont triés une fois par lap (tri stable, inutile s'ils le sont déjà),
+puis chaque statistique est une réduction sur les segments de laps (np.add / np.fmin / np.fmax .reduceat).
+
+Colonnes : lap_number, lap_nature, n_records, start_elapsed_s, end_elapsed_s, duration_s, moving_time_s,
+distance_m, elevation_gain_m, elevation_loss_m, puis avg_ / min_ / max_ de chaque métrique présente
+(LAP_STATS_METRICS). Durée et distance d'un lap sont comptées depuis le dernier record du lap précédent,
+si bien que leurs sommes donnent celles de l'activité.
+"""
+import numpy as np
+import pandas as pd
+
+from compact_schema import metric_values
+
+LAP_STATS_METRICS = (
+    'speed_kmh', 'heart_rate', 'cadence_step_per_min', 'stance_time', 'vertical_ratio',
+    'step_length', 'vertical_oscillation', 'power',
+)
+LAP_STATS_COLUMNS = ('lap_number', 'lap_nature', 'elapsed_time_s', 'moving_elapsed_time_s', 'distance',
+                     'altitude') + LAP_STATS_METRICS
+LAP_STATS_DECIMALS = 2
+
+
+def _column(df, col, metric=False):
+    """
+    Colonne en float64 (NaN pour les valeurs manquantes), ou None si elle est absente ; une métrique
+    est lue avec compact_schema.metric_values.
+    """
+    if col not in df.columns:
+        return None
+    return metric_values(df[col]) if metric else df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _span(values, starts, ends):
+    """Écart entre le dernier record de chaque lap et celui du lap précédent (premier record pour le premier lap)."""
+    previous = np.concatenate(([values[0]], values[ends[:-1]]))
+    return values[ends] - previous
+
+
+def build_lap_stats(df):
+    """
+    Table des statistiques par lap de la table des records (cf. docstring du module).
+
+    Returns:
+        pd.DataFrame: Une ligne par lap_number, dans l'ordre des laps (vide s'il n'y a pas de records).
+    """
+    if len(df) == 0 or 'lap_number' not in df.columns:
+        return pd.DataFrame(columns=['lap_number', 'lap_nature', 'n_records'])
+
+    # Tri unique par lap (stable : les records restent dans l'ordre chronologique dans chaque lap)
+    lap_numbers = df['lap_number'].to_numpy()
+    order = None
+    if np.any(lap_numbers[1:] < lap_numbers[:-1]):
+        order = np.argsort(lap_numbers, kind='stable')
+        lap_numbers = lap_numbers[order]
+
+    def sorted_column(col, metric=False):
+        values = _column(df, col, metric)
+        return values if values is None or order is None else values[order]
+
+    starts = np.concatenate(([0], np.flatnonzero(lap_numbers[1:] != lap_numbers[:-1]) + 1))
+    ends = np.append(starts[1:], len(lap_numbers)) - 1
+    counts = ends - starts + 1
+
+    stats = {"lap_number": lap_numbers[starts]}
+    if 'lap_nature' in df.columns:
+        natures = df['lap_nature'].to_numpy()
+        stats["lap_nature"] = (natures if order is None else natures[order])[starts]
+    stats["n_records"] = counts
+
+    elapsed = sorted_column('elapsed_time_s')
+    if elapsed is not None:
+        stats["start_elapsed_s"] = elapsed[starts]
+        stats["end_elapsed_s"] = elapsed[ends]
+        stats["duration_s"] = _span(elapsed, starts, ends)
+    moving = sorted_column('moving_elapsed_time_s')
+    if moving is not None:
+        stats["moving_time_s"] = _span(moving, starts, ends)
+    distance = sorted_column('distance')
+    if distance is not None:
+        # Distance cumulée : valeurs manquantes remplacées par la dernière connue
+        distance = pd.Series(distance).ffill().bfill().to_numpy()
+        stats["distance_m"] = _span(distance, starts, ends)
+
+    altitude = sorted_column('altitude')
+    if altitude is not None:
+        # Dénivelé entre records successifs d'un même lap (écarts avec une altitude manquante ignorés)
+        steps = np.diff(altitude, prepend=np.nan)
+        steps[starts] = np.nan
+        steps = np.nan_to_num(steps, nan=0.0)
+        stats["elevation_gain_m"] = np.add.reduceat(np.maximum(steps, 0.0), starts)
+        stats["elevation_loss_m"] = np.add.reduceat(np.maximum(-steps, 0.0), starts)
+
+    for col in LAP_STATS_METRICS:
+        values = sorted_column(col, metric=True)
+        if values is None:
+            continue
+        finite = ~np.isnan(values)
+        n = np.add.reduceat(finite, starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stats[f"avg_{col}"] = np.add.reduceat(np.where(finite, values, 0.0), starts) / n
+        stats[f"min_{col}"] = np.fmin.reduceat(values, starts)
+        stats[f"max_{col}"] = np.fmax.reduceat(values, starts)
+
+    df_stats = pd.DataFrame(stats)
+    float_cols = [col for col in df_stats.columns if df_stats[col].dtype.kind == 'f']
+    df_stats[float_cols] = df_stats[float_cols].round(LAP_STATS_DECIMALS)
+    return df_stats
+
+
+def write_lap_stats(df, path):
+    """Écrit la table des statistiques par lap (CSV, comme les tables lues par le dashboard)."""
+    build_lap_stats(df).to_csv(path, index=False)
+    return path
@@ -0,0 +1,199 @@
+"""
+Pyramide multi-résolution min / moyenne / max des métriques des records, pour le zoom des graphiques.
+
+Niveau k : tranches de BASE_BUCKET_S * 2**k secondes de elapsed_time_s (1 s, 2 s, 4 s... jusqu'à une
+tranche couvrant toute l'activité). Chaque niveau ne garde que les tranches contenant des records
+(les pauses ne coûtent rien) : numéro de tranche (début = numéro * largeur), nombre de records, et
+pour chaque métrique numérique min, moyenne et max (float32, NaN si la métrique manque dans la tranche).
+
+Tous les niveaux sont calculés à partir du niveau 0 par réductions sur segments (reduceat) ; la
+pyramide est enregistrée à côté des records (<base>_pyramid.npz, cf. sidecars).
+
+MetricPyramid.query(start_s, end_s, max_points) choisit le niveau le plus fin qui tient dans le budget
+de points et renvoie les tranches de la fenêtre par recherche dichotomique : O(log n + sortie), quelle
+que soit la durée de l'activité ou de la fenêtre.
+
+La commande a lancer : python metric_pyramid.py results/xxx_pyramid.npz START_S END_S MAX_POINTS [metrique ...]
+"""
+import sys
+import json
+import math
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from compact_schema import metric_values
+
+BASE_BUCKET_S = 1.0
+PYRAMID_X = 'elapsed_time_s'
+# Colonnes numériques qui ne sont pas des métriques (axes de temps, numéro de lap)
+PYRAMID_EXCLUDED = ('elapsed_time_s', 'moving_elapsed_time_s', 'elapsed_time_in_lap_s', 'lap_number')
+PYRAMID_STATS = ('min', 'mean', 'max')
+
+
+def pyramid_metrics(df):
+    """Colonnes numériques de la table des records résumées par la pyramide."""
+    return [col for col in df.columns
+            if col not in PYRAMID_EXCLUDED
+            and pd.api.types.is_numeric_dtype(df[col].dtype) and not pd.api.types.is_bool_dtype(df[col].dtype)]
+
+
+def _segment_starts(keys):
+    """Début de chaque suite de clés égales (clés triées)."""
+    return np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+
+
+class MetricPyramid(object):
+    """
+    Pyramide d'une activité : levels[k] = {"bucket": numéros de tranche (int64), "count": records (uint32),
+    "<métrique>_min" / "_mean" / "_max": float32}.
+    """
+
+    def __init__(self, metrics, levels, base_bucket_s=BASE_BUCKET_S):
+        self.metrics = list(metrics)
+        self.levels = levels
+        self.base_bucket_s = base_bucket_s
+
+    def bucket_s(self, level):
+        return self.base_bucket_s * 2 ** level
+
+    @classmethod
+    def build(cls, df, base_bucket_s=BASE_BUCKET_S):
+        """Construit la pyramide de la table des records (triée par elapsed_time_s)."""
+        metrics = pyramid_metrics(df)
+        x = df[PYRAMID_X].to_numpy(dtype=np.float64)
+        values = np.vstack([metric_values(df[col]) for col in metrics]) \
+            if metrics else np.zeros((0, len(df)))
+        if len(df) == 0:
+            return cls(metrics, [], base_bucket_s)
+
+        # Niveau 0 : sommes, effectifs, min et max par tranche (NaN ignorés)
+        finite = ~np.isnan(values)
+        base_keys = np.floor(x / base_bucket_s).astype(np.int64)
+        starts = _segment_starts(base_keys)
+        base = {
+            "bucket": base_keys[starts],
+            "count": np.diff(np.append(starts, len(x))),
+            "sum": np.add.reduceat(np.where(finite, values, 0.0), starts, axis=1),
+            "n": np.add.reduceat(finite, starts, axis=1),
+            "min": np.fmin.reduceat(values, starts, axis=1),
+            "max": np.fmax.reduceat(values, starts, axis=1),
+        }
+
+        span = base["bucket"][-1] - base["bucket"][0] + 1
+        n_levels = max(1, math.ceil(math.log2(span)) + 1) if span > 1 else 1
+        levels = []
+        for level in range(n_levels):
+            keys = base["bucket"] >> level
+            starts = _segment_starts(keys)
+            n = np.add.reduceat(base["n"], starts, axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.add.reduceat(base["sum"], starts, axis=1) / n
+            arrays = {
+                "bucket": keys[starts],
+                "count": np.add.reduceat(base["count"], starts).astype(np.uint32),
+            }
+            minimum = np.fmin.reduceat(base["min"], starts, axis=1)
+            maximum = np.fmax.reduceat(base["max"], starts, axis=1)
+            for row, col in enumerate(metrics):
+                arrays[f"{col}_min"] = minimum[row].astype(np.float32)
+                arrays[f"{col}_mean"] = mean[row].astype(np.float32)
+                arrays[f"{col}_max"] = maximum[row].astype(np.float32)
+            levels.append(arrays)
+        return cls(metrics, levels, base_bucket_s)
+
+    def save(self, path):
+        """Enregistre la pyramide (.npz compressé : un tableau par niveau et par colonne)."""
+        arrays = {"metrics": np.array(self.metrics, dtype=str), "base_bucket_s": np.float64(self.base_bucket_s)}
+        for level, columns in enumerate(self.levels):
+            for name, array in columns.items():
+                arrays[f"L{level}/{name}"] = array
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            metrics = [str(col) for col in data["metrics"]]
+            levels = {}
+            for key in data.files:
+                if key.startswith('L'):
+                    level, name = key[1:].split('/', 1)
+                    levels.setdefault(int(level), {})[name] = data[key]
+            base_bucket_s = float(data["base_bucket_s"])
+        return cls(metrics, [levels[level] for level in sorted(levels)], base_bucket_s)
+
+    def level_for(self, start_s, end_s, max_points):
+        """Niveau le plus fin dont les tranches de [start_s, end_s] tiennent dans max_points."""
+        duration = max(end_s - start_s, self.base_bucket_s)
+        level = math.ceil(math.log2(duration / (self.base_bucket_s * max(max_points, 1)))) if max_points else 0
+        return min(max(level, 0), len(self.levels) - 1)
+
+    def query(self, start_s, end_s, max_points, metrics=None):
+        """
+        Tranches du niveau adapté au budget de points qui recoupent [start_s, end_s].
+
+        Returns:
+            dict: {"level", "bucket_s", "start_s": début de chaque tranche, "count",
+                   "<métrique>": {"min", "mean", "max"}} (tableaux NumPy, vues sur la pyramide).
+        """
+        metrics = self.metrics if metrics is None else [col for col in metrics if col in self.metrics]
+        if not self.levels:
+            return {"level": 0, "bucket_s": self.base_bucket_s, "start_s": np.zeros(0), "count": np.zeros(0, np.uint32),
+                    **{col: {stat: np.zeros(0, np.float32) for stat in PYRAMID_STATS} for col in metrics}}
+
+        level = self.level_for(start_s, end_s, max_points)
+        columns = self.levels[level]
+        bucket_s = self.bucket_s(level)
+        lo = np.searchsorted(columns["bucket"], math.floor(start_s / bucket_s), side='left')
+        hi = np.searchsorted(columns["bucket"], math.floor(end_s / bucket_s), side='right')
+        result = {
+            "level": level,
+            "bucket_s": bucket_s,
+            "start_s": columns["bucket"][lo:hi] * bucket_s,
+            "count": columns["count"][lo:hi],
+        }
+        for col in metrics:
+            result[col] = {stat: columns[f"{col}_{stat}"][lo:hi] for stat in PYRAMID_STATS}
+        return result
+
+
+def write_pyramid(df, path):
+    """Construit et enregistre la pyramide de la table des records (cf. sidecars)."""
+    return MetricPyramid.build(df).save(path)
+
+
+def _json_array(array):
+    return [None if value != value else value for value in np.asarray(array, dtype=np.float64).round(3).tolist()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tranches d'une pyramide de métriques pour une fenêtre de temps")
+    parser.add_argument("pyramid_path")
+    parser.add_argument("start_s", type=float)
+    parser.add_argument("end_s", type=float)
+    parser.add_argument("max_points", type=int)
+    parser.add_argument("metrics", nargs="*")
+    args = parser.parse_args()
+
+    try:
+        pyramid = MetricPyramid.load(args.pyramid_path)
+    except (OSError, ValueError) as e:
+        print(json.dumps({"status": "error", "message": f"Pyramide illisible: {e}"}))
+        sys.exit(1)
+    window = pyramid.query(args.start_s, args.end_s, args.max_points, args.metrics or None)
+    print(json.dumps({
+        "status": "success",
+        "level": window["level"],
+        "bucket_s": window["bucket_s"],
+        "start_s": _json_array(window["start_s"]),
+        "count": window["count"].tolist(),
+        "metrics": {col: {stat: _json_array(values) for stat, values in stats.items()}
+                    for col, stats in window.items() if isinstance(stats, dict)},
+    }))
+
+
+if __name__ == "__main__":
+    main()
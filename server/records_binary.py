@@ -0,0 +1,154 @@
+"""
+Fichier binaire colonnaire de la table des records (<base>_records.bin), lisible sans aucun parsing
+de texte : le dashboard peut poser des tableaux typés (Float32Array, Uint16Array...) directement sur
+le fichier, les scripts d'analyse le lisent avec records_io.py (read_records_binary). L'en-tête est
+écrit et relu par encode_header / read_header, seul endroit où le format est décrit.
+
+Format (tout en little-endian) :
+    8 octets    : MAGIC (b'FITCOLS1')
+    4 octets    : longueur L de l'en-tête JSON (uint32)
+    L octets    : en-tête JSON (UTF-8)
+    bourrage    : zéros jusqu'au multiple de 8 suivant (début des données)
+    données     : une colonne après l'autre, chacune alignée sur 8 octets
+
+En-tête :
+    {"format": "fit-records-columnar", "version": 1, "rows": n,
+     "columns": [{"name", "dtype", "offset", ["null"], ["encoding"], ["dictionary"]}, ...]}
+    dtype    : type NumPy des valeurs ('float32', 'uint16', 'uint8', 'int64'...)
+    offset   : position de la colonne depuis le début des données (octets)
+    null     : valeur sentinelle des valeurs manquantes des colonnes entières (NaN pour les flottants)
+    encoding : 'datetime64[ns]' (entiers epoch en nanosecondes, null = NaT)
+               ou 'dictionary' (codes dans "dictionary" : lap_nature, colonnes texte)
+
+Les types sont ceux du schéma compact (cf. compact_schema) : float32 pour les vitesses, uint8 pour
+la fréquence cardiaque, uint16 pour lap_number... Les entiers nullables utilisent comme sentinelle
+la valeur maximale de leur type (minimale s'il est signé), comme les valeurs invalides du format FIT ;
+une colonne dont une vraie valeur vaut la sentinelle est écrite en float64.
+"""
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'FITCOLS1'
+# Longueur de l'en-tête JSON : uint32 little-endian
+HEADER_LENGTH = struct.Struct('<I')
+FORMAT_NAME = 'fit-records-columnar'
+FORMAT_VERSION = 1
+ALIGNMENT = 8
+
+
+def _align(position):
+    return -(-position // ALIGNMENT) * ALIGNMENT
+
+
+def encode_header(header):
+    """Octets qui précèdent les données : MAGIC, longueur et en-tête JSON, bourrage jusqu'à l'alignement."""
+    encoded = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    prefix = MAGIC + HEADER_LENGTH.pack(len(encoded)) + encoded
+    return prefix + b'\0' * (_align(len(prefix)) - len(prefix))
+
+
+def read_header(buffer, path=None):
+    """
+    Relit l'en-tête d'un fichier binaire de records.
+
+    Args:
+        buffer: Octets du fichier (bytes, np.memmap...).
+        path (str | Path | None): Fichier, pour le message d'erreur.
+
+    Returns:
+        tuple: (en-tête JSON décodé, position du début des données).
+        ValueError si le fichier n'est pas au format.
+    """
+    header_start = len(MAGIC) + HEADER_LENGTH.size
+    if len(buffer) < header_start or bytes(buffer[:len(MAGIC)]) != MAGIC:
+        raise ValueError(f"Fichier binaire de records invalide: {path}")
+    (length,) = HEADER_LENGTH.unpack(bytes(buffer[len(MAGIC):header_start]))
+    header = json.loads(bytes(buffer[header_start:header_start + length]))
+    return header, _align(header_start + length)
+
+
+def _sentinel(dtype):
+    info = np.iinfo(dtype)
+    return info.min if dtype.kind == 'i' else info.max
+
+
+def _codes_dtype(n_categories):
+    """Plus petit entier non signé qui contient les codes et la sentinelle."""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if n_categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def _encode_column(series):
+    """
+    Valeurs d'une colonne (tableau NumPy contigu) et description de la colonne pour l'en-tête.
+    """
+    dtype = series.dtype
+    meta = {}
+
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        values = series.astype('datetime64[ns]').to_numpy().view(np.int64)
+        meta.update(encoding='datetime64[ns]', null=int(np.iinfo(np.int64).min))
+    elif isinstance(dtype, pd.CategoricalDtype) or dtype == object or pd.api.types.is_string_dtype(dtype):
+        categorical = series if isinstance(dtype, pd.CategoricalDtype) else series.astype('category')
+        categories = categorical.cat.categories
+        codes_dtype = _codes_dtype(len(categories))
+        codes = categorical.cat.codes.to_numpy()
+        sentinel = np.iinfo(codes_dtype).max
+        values = np.where(codes < 0, sentinel, codes).astype(codes_dtype)
+        meta.update(encoding='dictionary', dictionary=[str(value) for value in categories], null=int(sentinel))
+    elif pd.api.types.is_bool_dtype(dtype):
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        missing = np.isnan(values)
+        values = np.where(missing, 255, values).astype(np.uint8)
+        if missing.any():
+            meta['null'] = 255
+    elif isinstance(dtype, pd.api.extensions.ExtensionDtype) and dtype.kind in 'iu':
+        numpy_dtype = dtype.numpy_dtype
+        missing = series.isna().to_numpy()
+        sentinel = _sentinel(numpy_dtype)
+        if not missing.any():
+            values = series.to_numpy(dtype=numpy_dtype)
+        elif (series == sentinel).any():
+            values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            values = series.to_numpy(dtype=numpy_dtype, na_value=sentinel)
+            meta['null'] = int(sentinel)
+    elif isinstance(dtype, np.dtype) and dtype.kind in 'iuf':
+        values = series.to_numpy()
+    else:
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+    values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder('<'))
+    meta['dtype'] = values.dtype.newbyteorder('=').name
+    return values, meta
+
+
+def write_records_binary(df, path):
+    """Écrit la table des records au format binaire colonnaire (cf. docstring du module)."""
+    columns = []
+    arrays = []
+    offset = 0
+    for name in df.columns:
+        values, meta = _encode_column(df[name])
+        columns.append({"name": str(name), "offset": offset, **meta})
+        arrays.append(values)
+        offset = _align(offset + values.nbytes)
+
+    header = encode_header({
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "rows": len(df),
+        "columns": columns,
+    })
+
+    with open(path, 'wb') as f:
+        f.write(header)
+        for column, values in zip(columns, arrays):
+            f.write(values.tobytes())
+            f.write(b'\0' * (_align(values.nbytes) - values.nbytes))
+    return path
@@ -0,0 +1,158 @@
+"""
+Lecture des fichiers de records produits par extract_fit_file.py (scripts d'analyse de src/utils,
+moteur d'analyse analysis_engine).
+
+Si un fichier binaire colonnaire (<base>_records.bin, cf. records_binary.py),
+Parquet ou Arrow (cf. l'option --format de l'extraction) à jour existe à côté du
+CSV demandé, il est lu à la place : seules les colonnes demandées sont chargées
+et le CSV n'est pas parsé.
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from records_binary import read_header
+
+# Formats colonnaires, par ordre de préférence
+COLUMNAR_SUFFIXES = ('.bin', '.parquet', '.arrow', '.feather')
+
+
+def resolve_records_path(filepath):
+    """
+    Renvoie le fichier colonnaire voisin d'un CSV s'il existe et n'est pas plus ancien que le CSV
+    (un voisin resté d'une extraction précédente, le CSV ayant été réécrit depuis, est ignoré),
+    sinon le chemin demandé.
+    """
+    path = Path(filepath)
+    if path.suffix.lower() == '.csv':
+        csv_mtime = path.stat().st_mtime_ns if path.exists() else None
+        for suffix in COLUMNAR_SUFFIXES:
+            candidate = path.with_suffix(suffix)
+            if candidate.exists() and (csv_mtime is None or candidate.stat().st_mtime_ns >= csv_mtime):
+                return candidate
+    return path
+
+
+def read_records_binary(path, columns=None):
+    """
+    Lit un fichier binaire colonnaire de records sans parsing : les colonnes sont des vues sur le
+    fichier projeté en mémoire (np.memmap), décodées seulement pour les dates, les dictionnaires
+    (catégories) et les entiers avec valeurs manquantes (entiers nullables).
+
+    Args:
+        path (str | Path): Fichier <base>_records.bin.
+        columns (list | None): Colonnes à charger (les colonnes absentes du fichier sont ignorées).
+
+    Returns:
+        pd.DataFrame: Records, dans les types du schéma compact de l'extraction.
+    """
+    buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    header, data_start = read_header(buffer, path)
+    n_rows = header['rows']
+
+    wanted = None if columns is None else set(columns)
+    data = {}
+    for column in header['columns']:
+        if wanted is not None and column['name'] not in wanted:
+            continue
+        dtype = np.dtype(column['dtype'])
+        values = np.frombuffer(buffer, dtype=dtype.newbyteorder('<'), count=n_rows, offset=data_start + column['offset'])
+        # Vue sans copie sur une machine little-endian
+        values = values.astype(dtype, copy=False)
+        encoding = column.get('encoding')
+        null = column.get('null')
+        if encoding == 'datetime64[ns]':
+            values = values.view('datetime64[ns]')
+        elif encoding == 'dictionary':
+            codes = values.astype(np.int64)
+            codes[values == null] = -1
+            values = pd.Categorical.from_codes(codes, categories=column['dictionary'])
+        elif null is not None:
+            values = pd.arrays.IntegerArray(values, values == null)
+        data[column['name']] = values
+    return pd.DataFrame(data)
+
+
+def _read_columnar(path, columns):
+    if path.suffix.lower() == '.bin':
+        return read_records_binary(path, columns)
+
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+    import pyarrow.ipc as ipc
+
+    if path.suffix.lower() == '.parquet':
+        names = pq.read_schema(path).names
+        selected = None if columns is None else [col for col in columns if col in names]
+        return pq.read_table(path, columns=selected).to_pandas()
+
+    with ipc.open_file(path) as reader:
+        names = reader.schema.names
+    selected = None if columns is None else [col for col in columns if col in names]
+    return feather.read_table(path, columns=selected).to_pandas()
+
+
+def _float32_as_csv_float64(values):
+    """
+    float32 -> float64 de la valeur décimale la plus courte qui redonne le float32, celle qu'écrit le CSV
+    (20.45 en float32 vaut 20.450000762939453 en float64). Vectorisé : arrondi au plus petit nombre de
+    décimales qui redonne le float32 ; passage par le texte pour les valeurs hors de ce cas.
+    """
+    values = np.asarray(values, dtype=np.float32)
+    wide = values.astype(np.float64)
+    result = np.full_like(wide, np.nan)
+    pending = np.abs(wide) < 1e7
+    for decimals in range(10):
+        index = np.flatnonzero(pending)
+        if len(index) == 0:
+            break
+        rounded = np.round(wide[index], decimals)
+        exact = rounded.astype(np.float32) == values[index]
+        result[index[exact]] = rounded[exact]
+        pending[index[exact]] = False
+    rest = ~np.isnan(wide) & np.isnan(result)
+    result[rest] = values[rest].astype(str).astype(np.float64)
+    return result
+
+
+def as_csv_dtypes(df):
+    """
+    Types du schéma compact de l'extraction ramenés à ceux d'un pd.read_csv, pour que les analyses
+    se comportent à l'identique : entiers nullables (UInt8, Int16...) -> int64 s'ils sont complets,
+    float64 sinon ; autres entiers -> int64 ; float32 -> float64 de la valeur écrite dans le CSV ;
+    catégories (lap_nature) -> chaînes.
+    """
+    for col in df.columns:
+        dtype = df[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(dtype.categories.dtype)
+        elif isinstance(dtype, pd.api.extensions.ExtensionDtype) and dtype.kind in 'iu':
+            df[col] = df[col].astype('float64') if df[col].hasnans else df[col].astype('int64')
+        elif dtype.kind in 'iu' and dtype != 'int64':
+            df[col] = df[col].astype('int64')
+        elif dtype == 'float32':
+            df[col] = _float32_as_csv_float64(df[col].to_numpy())
+    return df
+
+
+def read_records(filepath, columns=None):
+    """
+    Charge un fichier de records (CSV, binaire colonnaire, Parquet ou Arrow IPC).
+
+    Args:
+        filepath (str | Path): Chemin du fichier (un CSV est remplacé par son voisin colonnaire s'il existe).
+        columns (list | None): Colonnes à charger (les colonnes absentes du fichier sont ignorées).
+
+    Returns:
+        pd.DataFrame: Records. FileNotFoundError si le fichier n'existe pas.
+    """
+    path = resolve_records_path(filepath)
+    if not path.exists():
+        raise FileNotFoundError(f"Fichier introuvable: {path}")
+
+    if path.suffix.lower() in COLUMNAR_SUFFIXES:
+        return as_csv_dtypes(_read_columnar(path, columns))
+
+    wanted = None if columns is None else set(columns)
+    return pd.read_csv(path, usecols=None if wanted is None else (lambda col: col in wanted))
@@ -0,0 +1,130 @@
+"""
+Cache des résultats d'extraction, adressé par le contenu du fichier FIT.
+
+La clé combine l'empreinte SHA-256 des octets du fichier FIT et les paramètres
+du pipeline (version, seuils...) : un même fichier uploadé plusieurs fois
+réutilise les fichiers déjà produits, tandis qu'un changement de seuil ou de
+version du pipeline invalide le cache.
+
+Chaque entrée est un petit fichier JSON <clé>.json dans le dossier cache/ du
+dossier de résultats ; il référence les fichiers de records et de laps
+(chemins relatifs au dossier de résultats), avec la taille et la date de modification
+de chacun au moment de l'enregistrement : les fichiers sont nommés d'après le nom du
+fichier FIT, et un autre fichier FIT de même nom les remplace ; l'entrée n'est alors
+plus valable (comme une entrée d'avant ces empreintes).
+"""
+import os
+import json
+import hashlib
+import tempfile
+from pathlib import Path
+
+CACHE_DIR_NAME = 'cache'
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Empreinte SHA-256 (hexadécimale) du contenu d'un fichier."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(content_sha256, parameters):
+    """Clé de cache : empreinte du contenu + paramètres du pipeline (dictionnaire JSON)."""
+    digest = hashlib.sha256(content_sha256.encode('ascii'))
+    digest.update(json.dumps(parameters, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _entry_path(output_dir, key):
+    return Path(output_dir) / CACHE_DIR_NAME / f"{key}.json"
+
+
+def _relative_paths(output_dir, paths):
+    return {fmt: os.path.relpath(path, output_dir) for fmt, path in paths.items()}
+
+
+def _absolute_paths(output_dir, paths):
+    return {fmt: str(Path(output_dir) / path) for fmt, path in paths.items()}
+
+
+def _fingerprint(path):
+    """[taille, date de modification (ns)] d'un fichier, None s'il n'existe pas."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def lookup(output_dir, key, formats):
+    """
+    Cherche une entrée du cache couvrant les formats demandés.
+
+    Returns:
+        dict | None: {"records_paths": {...}, "laps_paths": {...}} limités aux formats demandés,
+        ou None si l'entrée n'existe pas, ne couvre pas tous les formats ou si un fichier a disparu ou
+        a changé depuis l'enregistrement de l'entrée (fichier d'une autre activité de même nom).
+    """
+    try:
+        with open(_entry_path(output_dir, key)) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    result = {}
+    fingerprints = entry.get('fingerprints', {})
+    for table in ('records_paths', 'laps_paths'):
+        relative = entry.get(table, {})
+        paths = _absolute_paths(output_dir, relative)
+        # Une table vide (activité sans lap) reste valide pour tous les formats
+        if paths and any(fmt not in paths for fmt in formats):
+            return None
+        paths = {fmt: path for fmt, path in paths.items() if fmt in formats}
+        if any(fingerprints.get(relative[fmt]) is None or _fingerprint(path) != fingerprints[relative[fmt]]
+               for fmt, path in paths.items()):
+            return None
+        result[table] = paths
+    if not result['records_paths']:
+        return None
+    return result
+
+
+def store(output_dir, key, records_paths, laps_paths, **metadata):
+    """
+    Enregistre l'entrée du cache associée à la clé. Les fichiers d'autres formats déjà
+    référencés par l'entrée (même contenu, mêmes paramètres) sont conservés.
+    L'écriture est atomique (fichier temporaire + renommage) : plusieurs workers peuvent écrire en parallèle.
+    """
+    entry_path = _entry_path(output_dir, key)
+    entry_path.parent.mkdir(parents=True, exist_ok=True)
+
+    try:
+        with open(entry_path) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = {}
+
+    entry = {**metadata}
+    previous_fingerprints = previous.get('fingerprints', {})
+    fingerprints = {}
+    for table, paths in (('records_paths', records_paths), ('laps_paths', laps_paths)):
+        # Fichiers d'autres formats gardés seulement s'ils n'ont pas changé depuis leur enregistrement
+        kept = {fmt: path for fmt, path in previous.get(table, {}).items()
+                if previous_fingerprints.get(path) is not None
+                and _fingerprint(Path(output_dir) / path) == previous_fingerprints[path]}
+        entry[table] = {**kept, **_relative_paths(output_dir, paths)}
+        for path in entry[table].values():
+            fingerprints[path] = _fingerprint(Path(output_dir) / path)
+    entry['fingerprints'] = fingerprints
+    fd, tmp_path = tempfile.mkstemp(dir=entry_path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f, indent=4)
+        os.replace(tmp_path, entry_path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    return entry_path
@@ -0,0 +1,136 @@
+"""
+Métriques physiologiques sur fenêtres glissantes, calculées à partir des records : ce que
+data_exploration.py regarde sur un nuage Distance / FC et que analysis_script.py résume par des
+moyennes de séries (analysis_engine.analyse_drifts).
+
+Pour chaque record et chaque fenêtre de ROLLING_WINDOWS_S (30 s, 5 min, 20 min de elapsed_time_s
+se terminant au record) :
+- hr_<fenêtre> : fréquence cardiaque moyenne ;
+- speed_kmh_<fenêtre> : vitesse moyenne ;
+- ef_<fenêtre> : facteur d'efficience, vitesse moyenne (m/min) / FC moyenne ;
+- pa_hr_<fenêtre> : découplage allure / FC (Pa:HR, %), baisse du facteur d'efficience entre la
+  première et la seconde moitié de la fenêtre ;
+- hr_drift_<fenêtre>, cadence_drift_<fenêtre>, stance_time_drift_<fenêtre> : dérive (%) de la FC,
+  de la cadence et du temps de contact au sol entre la première et la seconde moitié de la fenêtre.
+
+Une seule somme cumulée par métrique (valeurs manquantes ignorées) ; les bornes de toutes les fenêtres
+sont trouvées par recherche dichotomique dans elapsed_time_s, et chaque moyenne est une différence de
+sommes cumulées : aucune boucle Python par fenêtre ou par record. Les valeurs restent NaN tant que la
+fenêtre n'est pas couverte depuis le début de l'activité, ou si une moitié de fenêtre est vide.
+
+La table (une ligne par record, dans l'ordre des records) est enregistrée à côté des records
+(<base>_rolling_metrics.csv, cf. sidecars).
+"""
+import numpy as np
+import pandas as pd
+
+from compact_schema import metric_values
+
+ROLLING_X = 'elapsed_time_s'
+# Fenêtres : suffixe des colonnes -> durée (s)
+ROLLING_WINDOWS_S = {'30s': 30.0, '5min': 300.0, '20min': 1200.0}
+# Métriques dont la dérive entre les deux moitiés de chaque fenêtre est calculée
+DRIFT_METRICS = {'hr': 'heart_rate', 'cadence': 'cadence_step_per_min', 'stance_time': 'stance_time'}
+ROLLING_COLUMNS = (ROLLING_X, 'speed_kmh', 'heart_rate', 'cadence_step_per_min', 'stance_time')
+ROLLING_DECIMALS = 3
+KMH_TO_M_PER_MIN = 1000.0 / 60.0
+
+
+def _cumulative(values):
+    """Sommes et nombres de valeurs cumulés (précédés d'un zéro) : somme sur [i, j) = c[j] - c[i]."""
+    finite = ~np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(finite, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(finite)))
+    return sums, counts
+
+
+def _mean(cumulative, lo, hi):
+    """Moyenne des valeurs entre les indices lo (inclus) et hi (exclu) de chaque record ; NaN si aucune."""
+    sums, counts = cumulative
+    n = counts[hi] - counts[lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n > 0, (sums[hi] - sums[lo]) / n, np.nan)
+
+
+def _change_percent(first, second):
+    """Variation (%) de la première à la seconde moitié de fenêtre."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(first != 0, (second - first) / first * 100.0, np.nan)
+
+
+def build_rolling_metrics(df):
+    """
+    Table des métriques sur fenêtres glissantes de la table des records (cf. docstring du module).
+
+    Returns:
+        pd.DataFrame: Une ligne par record, dans l'ordre de df : elapsed_time_s puis les métriques
+        disponibles pour chaque fenêtre (vide si la table n'a pas de records ou pas de elapsed_time_s).
+    """
+    if len(df) == 0 or ROLLING_X not in df.columns:
+        return pd.DataFrame(columns=[ROLLING_X])
+
+    # Records triés par temps (tri stable, inutile s'ils le sont déjà) ; résultats remis dans l'ordre de df
+    times = df[ROLLING_X].to_numpy(dtype=np.float64, na_value=np.nan)
+    order = None
+    if np.any(times[1:] < times[:-1]) or np.isnan(times).any():
+        order = np.argsort(times, kind='stable')
+        times = times[order]
+
+    def sorted_column(col):
+        if col not in df.columns:
+            return None
+        values = metric_values(df[col])
+        return values if order is None else values[order]
+
+    heart_rate = sorted_column('heart_rate')
+    speed = sorted_column('speed_kmh')
+    cumulative = {name: _cumulative(values) for name, values in (
+        [('hr', heart_rate), ('speed_kmh', speed)]
+        + [(name, sorted_column(col)) for name, col in DRIFT_METRICS.items() if name != 'hr']
+    ) if values is not None}
+
+    metrics = {}
+    n = len(times)
+    hi = np.arange(1, n + 1)
+    start = times[0]
+    for label, window_s in ROLLING_WINDOWS_S.items():
+        # Fenêtre ]t - durée, t] de chaque record, coupée en deux moitiés [lo, mid) et [mid, hi)
+        lo = np.searchsorted(times, times - window_s, side='right')
+        mid = np.searchsorted(times, times - window_s / 2.0, side='right')
+        covered = times - start >= window_s
+
+        means = {name: _mean(c, lo, hi) for name, c in cumulative.items()}
+        halves = {name: (_mean(c, lo, mid), _mean(c, mid, hi)) for name, c in cumulative.items()}
+        window_metrics = {}
+        if 'hr' in means:
+            window_metrics[f"hr_{label}"] = means['hr']
+        if 'speed_kmh' in means:
+            window_metrics[f"speed_kmh_{label}"] = means['speed_kmh']
+        if 'hr' in means and 'speed_kmh' in means:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                window_metrics[f"ef_{label}"] = means['speed_kmh'] * KMH_TO_M_PER_MIN / means['hr']
+                ef_first = halves['speed_kmh'][0] / halves['hr'][0]
+                ef_second = halves['speed_kmh'][1] / halves['hr'][1]
+                window_metrics[f"pa_hr_{label}"] = np.where(ef_first != 0, (ef_first - ef_second) / ef_first * 100.0, np.nan)
+        for name in DRIFT_METRICS:
+            if name in halves:
+                window_metrics[f"{name}_drift_{label}"] = _change_percent(*halves[name])
+
+        for col, values in window_metrics.items():
+            values = np.where(covered & np.isfinite(values), values, np.nan)
+            if order is not None:
+                unsorted = np.empty_like(values)
+                unsorted[order] = values
+                values = unsorted
+            metrics[col] = values
+
+    df_rolling = pd.DataFrame({ROLLING_X: df[ROLLING_X].to_numpy(), **metrics})
+    # + 0.0 : pas de "-0.0" pour les petites valeurs négatives arrondies
+    df_rolling[list(metrics)] = df_rolling[list(metrics)].round(ROLLING_DECIMALS) + 0.0
+    return df_rolling
+
+
+def write_rolling_metrics(df, path):
+    """Écrit la table des métriques sur fenêtres glissantes (CSV, comme les tables lues par le dashboard)."""
+    build_rolling_metrics(df).to_csv(path, index=False)
+    return path
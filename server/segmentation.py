@@ -0,0 +1,96 @@
+"""
+Moteur de segmentation des séances fractionnées de analysis_engine.py (et donc de
+analysis_script.py et correlations_script.py, src/utils).
+
+Un lap commence au début de la séance (puis à chaque pause retenue) et se termine
+juste avant la première pause (is_resting) située à au moins `rest_distance_m`
+mètres de son début, dès que la distance parcourue depuis ce début atteint
+`trigger_distance_m`.
+
+Les frontières sont trouvées en un seul passage : la distance étant cumulative,
+le premier record situé à X mètres d'un début de lap s'obtient par recherche
+dichotomique, et la pause suivante par lecture directe d'un tableau
+« prochain record en pause » calculé une fois pour toute la séance.
+"""
+import numpy as np
+
+# Nombre de laps par série (S1: Laps 1-8, S2: Laps 9-16)
+LAPS_PER_SERIES = 8
+MAX_LAPS = 16
+
+
+def next_true_index(mask):
+    """
+    Pour chaque position k, indice du premier True à partir de k (len(mask) s'il n'y en a plus).
+    """
+    n = len(mask)
+    positions = np.where(mask, np.arange(n), n)
+    return np.minimum.accumulate(positions[::-1])[::-1]
+
+
+def _first_reaching(distance, start, threshold, from_index, monotonic):
+    """
+    Premier indice i >= from_index tel que distance[i] - distance[start] >= threshold
+    (len(distance) s'il n'existe pas).
+    """
+    n = len(distance)
+    if from_index >= n:
+        return n
+    if not monotonic:
+        hits = np.flatnonzero(distance[from_index:] - distance[start] >= threshold)
+        return from_index + int(hits[0]) if len(hits) else n
+
+    # Distance cumulative : recherche dichotomique, puis ajustement pour reproduire
+    # exactement la comparaison distance[i] - distance[start] >= threshold
+    i = max(from_index, int(np.searchsorted(distance, distance[start] + threshold, side='left')))
+    while i > from_index and distance[i - 1] - distance[start] >= threshold:
+        i -= 1
+    while i < n and not distance[i] - distance[start] >= threshold:
+        i += 1
+    return i
+
+
+def find_lap_boundaries(distance, is_resting, trigger_distance_m, rest_distance_m, max_laps=MAX_LAPS):
+    """
+    Calcule les bornes des laps d'une séance fractionnée.
+
+    Args:
+        distance (array-like): Distance cumulée de chaque record (m).
+        is_resting (array-like): Indicateur de pause/marche lente de chaque record.
+        trigger_distance_m (float): Distance depuis le début du lap à partir de laquelle la pause est cherchée.
+        rest_distance_m (float): Distance minimale depuis le début du lap d'une pause de fin de lap.
+        max_laps (int): Nombre maximal de laps.
+
+    Returns:
+        list: Bornes (début, fin exclue) de chaque lap, en positions.
+    """
+    distance = np.asarray(distance, dtype=np.float64)
+    is_resting = np.asarray(is_resting, dtype=bool)
+    n = len(distance)
+    if n == 0:
+        return []
+
+    monotonic = not np.isnan(distance).any() and bool(np.all(np.diff(distance) >= 0))
+    next_rest = next_true_index(is_resting)
+
+    boundaries = []
+    start, scanned = 0, 0
+    while len(boundaries) < max_laps:
+        # Première pause à au moins rest_distance_m du début du lap
+        if monotonic:
+            reached = _first_reaching(distance, start, rest_distance_m, start, True)
+            rest_index = int(next_rest[reached]) if reached < n else n
+        else:
+            hits = np.flatnonzero(is_resting[start:] & (distance[start:] - distance[start] >= rest_distance_m))
+            rest_index = start + int(hits[0]) if len(hits) else n
+        if rest_index >= n:
+            break
+
+        # La pause n'est retenue qu'une fois trigger_distance_m parcourus (au plus tôt à la pause elle-même)
+        trigger_index = _first_reaching(distance, start, trigger_distance_m, max(rest_index, scanned + 1), monotonic)
+        if trigger_index >= n:
+            break
+
+        boundaries.append((start, rest_index))
+        start, scanned = rest_index, trigger_index
+    return boundaries
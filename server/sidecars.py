@@ -0,0 +1,116 @@
+"""
+Fichiers annexes calculés à partir de la table des records, écrits à côté d'elle.
+
+Chaque fichier annexe (SIDECARS) a un nom, un suffixe (<base>_records.csv -> <base><suffixe>) et le
+module qui le calcule, importé seulement quand le fichier est demandé : la constante du module qui
+liste les colonnes des records dont il a besoin (None : toutes) et sa fonction d'écriture write(df, chemin).
+Ils sont demandés avec l'option --sidecars de extract_fit_file.py (ex: --sidecars chart_series,pyramid).
+L'analyse des séances fractionnées (analysis) vient de analysis_engine.py, partagé avec les scripts
+d'analyse de src/utils.
+
+Quand la table n'est plus en mémoire (mode streaming, résultat du cache), seules les colonnes utiles
+sont relues depuis les fichiers de records, dans les types du schéma compact (un CSV relu donnerait
+int64 / float64 / chaînes) ; un fichier annexe plus récent que les records est réutilisé.
+"""
+import importlib
+from collections import namedtuple
+from pathlib import Path
+
+from table_outputs import READ_PREFERENCE, read_table
+from compact_schema import compact_column
+from stage_timings import timed_stage
+
+Sidecar = namedtuple('Sidecar', ['suffix', 'module', 'columns', 'write'])
+
+SIDECARS = {
+    'chart_series': Sidecar('_chart_series.json', 'chart_series', 'CHART_COLUMNS', 'write_chart_series'),
+    # Toutes les métriques numériques des records
+    'pyramid': Sidecar('_pyramid.npz', 'metric_pyramid', None, 'write_pyramid'),
+    'lap_stats': Sidecar('_lap_stats.csv', 'lap_stats', 'LAP_STATS_COLUMNS', 'write_lap_stats'),
+    # Voisin du CSV de records : lu à sa place par records_io.py
+    'records_bin': Sidecar('_records.bin', 'records_binary', None, 'write_records_binary'),
+    'analysis': Sidecar('_analysis.json', 'analysis_engine', 'ANALYSIS_COLUMNS', 'write_analysis'),
+    'best_efforts': Sidecar('_best_efforts.json', 'best_efforts', 'BEST_EFFORTS_COLUMNS', 'write_best_efforts'),
+    'rolling_metrics': Sidecar('_rolling_metrics.csv', 'rolling_metrics', 'ROLLING_COLUMNS', 'write_rolling_metrics'),
+}
+
+RECORDS_SUFFIX = '_records'
+
+
+def parse_sidecars(value):
+    """
+    Normalise une liste de fichiers annexes : "chart_series" ou ['chart_series'] -> ('chart_series',).
+    Lève ValueError pour un nom inconnu ; une liste vide est permise.
+    """
+    if isinstance(value, str):
+        value = value.split(',')
+    names = []
+    for name in value or ():
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in SIDECARS:
+            raise ValueError(f"Fichier annexe inconnu: {name} (disponibles: {', '.join(SIDECARS)})")
+        if name not in names:
+            names.append(name)
+    return tuple(names)
+
+
+def sidecar_path(records_paths, name):
+    """Chemin du fichier annexe : <base>_records.<ext> -> <base><suffixe>."""
+    records_path = Path(next(iter(records_paths.values())))
+    base = records_path.stem
+    if base.endswith(RECORDS_SUFFIX):
+        base = base[:-len(RECORDS_SUFFIX)]
+    return records_path.with_name(base + SIDECARS[name].suffix)
+
+
+def load_sidecar(name):
+    """Importe le module d'un fichier annexe : (colonnes des records utilisées ou None, fonction d'écriture)."""
+    sidecar = SIDECARS[name]
+    module = importlib.import_module(sidecar.module)
+    columns = None if sidecar.columns is None else list(getattr(module, sidecar.columns))
+    return columns, getattr(module, sidecar.write)
+
+
+def _is_up_to_date(path, records_paths):
+    if not path.exists():
+        return False
+    mtime = path.stat().st_mtime
+    return all(Path(records_path).stat().st_mtime <= mtime for records_path in records_paths.values())
+
+
+def _read_records(records_paths, columns, schema):
+    df = read_table(records_paths, columns)
+    if schema is not None:
+        for col in df.columns:
+            df[col] = compact_column(df[col], schema(col))
+    return df
+
+
+def write_sidecars(names, records_paths, df=None, timings=None, reuse=False, schema=None):
+    """
+    Écrit les fichiers annexes demandés.
+
+    Args:
+        names (tuple): Noms des fichiers annexes (cf. parse_sidecars).
+        records_paths (dict): Format -> chemin des fichiers de records écrits.
+        df (pd.DataFrame | None): Table des records en mémoire, ou None pour la relire depuis records_paths.
+        timings (StageTimings | None): Chronométrage (étape sidecar_<nom>).
+        reuse (bool): Garder un fichier annexe existant plus récent que les records (résultat du cache).
+        schema (callable | None): Colonne -> type compact (ou None), appliqué aux records relus.
+
+    Returns:
+        dict: Nom -> chemin du fichier annexe.
+    """
+    paths = {}
+    records_paths = {fmt: records_paths[fmt] for fmt in READ_PREFERENCE if fmt in records_paths}
+    for name in names:
+        path = sidecar_path(records_paths, name)
+        if not (reuse and _is_up_to_date(path, records_paths)):
+            with timed_stage(timings, f'sidecar_{name}'):
+                columns, write = load_sidecar(name)
+                records = df if df is not None else _read_records(records_paths, columns, schema)
+                write(records, path)
+        paths[name] = str(path)
+    return paths
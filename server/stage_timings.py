@@ -0,0 +1,52 @@
+"""
+Chronométrage optionnel des étapes de l'extraction (option --timings).
+
+Les fonctions instrumentées reçoivent un StageTimings (ou None, par défaut) et
+entourent chaque étape de timed_stage(timings, 'nom') : sans chronométrage, ce
+n'est qu'un contexte vide. Les durées d'une même étape s'additionnent (mode
+streaming : une mesure par bloc de records).
+"""
+import time
+import contextlib
+
+
+class StageTimings(object):
+    """Durées cumulées par étape (dans l'ordre de première exécution) et compteurs (records, laps...)."""
+
+    def __init__(self):
+        self.durations = {}
+        self.counts = {}
+        self._start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name, value):
+        self.counts[name] = value
+
+    def as_dict(self, ndigits=4):
+        """
+        Returns:
+            dict: {"total_s", "stages_s": {étape: durée}, compteurs...} pour le JSON de résultat.
+        """
+        total_s = time.perf_counter() - self._start
+        result = {
+            "total_s": round(total_s, ndigits),
+            "stages_s": {name: round(duration, ndigits) for name, duration in self.durations.items()},
+            **self.counts,
+        }
+        if self.counts.get("records") and total_s > 0:
+            result["records_per_s"] = round(self.counts["records"] / total_s)
+        return result
+
+
+def timed_stage(timings, name):
+    """Contexte chronométrant l'étape `name` si timings est un StageTimings, contexte vide sinon."""
+    if timings is None:
+        return contextlib.nullcontext()
+    return timings.stage(name)
@@ -0,0 +1,224 @@
+"""
+Écriture des tables produites par les scripts d'extraction (records, laps).
+
+Formats disponibles :
+    - csv     : <base>.csv (format historique, lu par le dashboard React)
+    - parquet : <base>.parquet, colonnes typées et compressées (zstd)
+    - arrow   : <base>.arrow, fichier Arrow IPC (Feather v2) compressé (zstd)
+
+Parquet et Arrow nécessitent pyarrow, importé seulement quand ces formats sont demandés.
+
+TableStreamWriter écrit une table bloc par bloc (mode streaming de l'extraction),
+sans jamais la matérialiser en entier ; iter_table_chunks la relit bloc par bloc.
+"""
+from pathlib import Path
+
+OUTPUT_FORMATS = ('csv', 'parquet', 'arrow')
+OUTPUT_SUFFIXES = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+DEFAULT_OUTPUT_FORMATS = ('csv',)
+
+# Compression des formats colonnaires
+COLUMNAR_COMPRESSION = 'zstd'
+
+# Formats relus en priorité par iter_table_chunks (types conservés, pas de parsing)
+READ_PREFERENCE = ('parquet', 'arrow', 'csv')
+
+
+def parse_output_formats(value):
+    """
+    Normalise une liste de formats : "csv,parquet" ou ['csv', 'parquet'] -> ('csv', 'parquet').
+    Lève ValueError pour un format inconnu ou une liste vide.
+    """
+    if isinstance(value, str):
+        value = value.split(',')
+    formats = []
+    for fmt in value:
+        fmt = fmt.strip().lower()
+        if not fmt:
+            continue
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Format de sortie inconnu: {fmt} (formats disponibles: {', '.join(OUTPUT_FORMATS)})")
+        if fmt not in formats:
+            formats.append(fmt)
+    if not formats:
+        raise ValueError("Aucun format de sortie demandé")
+    return tuple(formats)
+
+
+def output_path(output_base, fmt):
+    """Chemin du fichier <base>.<extension du format>."""
+    output_base = Path(output_base)
+    return output_base.with_name(output_base.name + OUTPUT_SUFFIXES[fmt])
+
+
+def _import_pyarrow(fmt):
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError(f"Le format '{fmt}' nécessite le paquet pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def write_table(df, output_base, fmt):
+    """
+    Écrit le DataFrame dans le format demandé (sans l'index) et renvoie le chemin du fichier.
+    """
+    path = output_path(output_base, fmt)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    if fmt == 'csv':
+        df.to_csv(path, index=False)
+        return path
+
+    pa = _import_pyarrow(fmt)
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if fmt == 'parquet':
+        pq.write_table(table, path, compression=COLUMNAR_COMPRESSION)
+    else:
+        feather.write_feather(table, path, compression=COLUMNAR_COMPRESSION)
+    return path
+
+
+def write_tables(df, output_base, formats=DEFAULT_OUTPUT_FORMATS):
+    """
+    Écrit le DataFrame dans chacun des formats demandés.
+
+    Returns:
+        dict: Format -> chemin du fichier écrit.
+    """
+    return {fmt: str(write_table(df, output_base, fmt)) for fmt in formats}
+
+
+class TableStreamWriter(object):
+    """
+    Écrit une table bloc par bloc dans chacun des formats demandés : CSV en ajout (en-tête au
+    premier bloc), Parquet par row groups, Arrow IPC par record batches.
+
+    Tous les blocs doivent avoir les mêmes colonnes et les mêmes types. schema_sample (DataFrame)
+    fixe le schéma Arrow/Parquet ; à défaut, il est déduit du premier bloc (une colonne vide
+    dans ce bloc serait alors typée null). csv_date_format fixe le format des dates du CSV, que
+    pandas choisirait sinon bloc par bloc.
+    """
+
+    def __init__(self, output_base, formats=DEFAULT_OUTPUT_FORMATS, schema_sample=None, csv_date_format=None):
+        self.paths = {fmt: output_path(output_base, fmt) for fmt in formats}
+        self.schema_sample = schema_sample
+        self.csv_date_format = csv_date_format
+        self._schema = None
+        self._writers = {}
+        self._started = False
+
+    def _open(self, df):
+        for path in self.paths.values():
+            path.parent.mkdir(parents=True, exist_ok=True)
+        columnar = [fmt for fmt in self.paths if fmt != 'csv']
+        if columnar:
+            pa = _import_pyarrow(columnar[0])
+            import pyarrow.parquet as pq
+
+            sample = df if self.schema_sample is None else self.schema_sample
+            self._schema = pa.Schema.from_pandas(sample, preserve_index=False)
+            for fmt in columnar:
+                if fmt == 'parquet':
+                    self._writers[fmt] = pq.ParquetWriter(self.paths[fmt], self._schema,
+                                                          compression=COLUMNAR_COMPRESSION)
+                else:
+                    options = pa.ipc.IpcWriteOptions(compression=COLUMNAR_COMPRESSION)
+                    self._writers[fmt] = pa.ipc.new_file(self.paths[fmt], self._schema, options=options)
+        self._started = True
+
+    def write(self, df):
+        """Ajoute un bloc de lignes à chacun des fichiers."""
+        first = not self._started
+        if first:
+            self._open(df)
+        if 'csv' in self.paths:
+            df.to_csv(self.paths['csv'], index=False, header=first, mode='w' if first else 'a',
+                      date_format=self.csv_date_format)
+        if self._writers:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            for writer in self._writers.values():
+                writer.write_table(table)
+
+    def close(self):
+        """
+        Termine les fichiers.
+
+        Returns:
+            dict: Format -> chemin du fichier écrit.
+        """
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+        return {fmt: str(path) for fmt, path in self.paths.items()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _available_columns(path, fmt, columns):
+    """Colonnes demandées présentes dans le fichier (None : toutes)."""
+    if columns is None:
+        return None
+    if fmt == 'csv':
+        import pandas as pd
+        names = pd.read_csv(path, nrows=0).columns
+    elif fmt == 'parquet':
+        import pyarrow.parquet as pq
+        names = pq.read_schema(path).names
+    else:
+        import pyarrow as pa
+        with pa.ipc.open_file(path) as reader:
+            names = reader.schema.names
+    return [col for col in columns if col in names]
+
+
+def iter_table_chunks(paths, chunk_size=10000, columns=None):
+    """
+    Relit une table écrite par write_tables / TableStreamWriter, par blocs d'au plus chunk_size lignes.
+    paths : format -> chemin ; le format colonnaire est préféré au CSV (dont les dates sont relues en datetime).
+    columns : colonnes à relire (les colonnes absentes du fichier sont ignorées), None pour toutes.
+
+    Yields:
+        pd.DataFrame: Blocs de lignes, dans l'ordre du fichier.
+    """
+    import pandas as pd
+
+    fmt = next(fmt for fmt in READ_PREFERENCE if fmt in paths)
+    path = paths[fmt]
+    columns = _available_columns(path, fmt, columns)
+    if fmt == 'csv':
+        for df in pd.read_csv(path, chunksize=chunk_size, usecols=columns):
+            if 'timestamp' in df.columns:
+                df['timestamp'] = pd.to_datetime(df['timestamp'])
+            yield df
+        return
+
+    pa = _import_pyarrow(fmt)
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    with pa.ipc.open_file(path) as reader:
+        for index in range(reader.num_record_batches):
+            batch = reader.get_batch(index)
+            if columns is not None:
+                batch = batch.select(columns)
+            for offset in range(0, batch.num_rows, chunk_size):
+                yield batch.slice(offset, chunk_size).to_pandas()
+
+
+def read_table(paths, columns=None):
+    """Relit une table entière (cf. iter_table_chunks), éventuellement limitée à certaines colonnes."""
+    import pandas as pd
+    chunks = list(iter_table_chunks(paths, chunk_size=1 << 20, columns=columns))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
@@ -0,0 +1,111 @@
+"""
+Formatage des durées (secondes -> chaînes MM:SS ou H:MM:SS).
+
+format_seconds_to_min_sec (extract_fit_file.py) et format_seconds_to_hms
+(extract_fit_file_for_V3.py) formatent une valeur ; leurs versions vectorisées
+format_seconds_column_* formatent une colonne de records entière. Au lieu d'un
+appel Python et d'un f-string par ligne, les chaînes sont prises dans une table
+précalculée des 3600 "MM:SS" d'une heure, et seules les heures (ou les minutes
+au-delà de 59) sont formatées, une fois par valeur distincte.
+
+Le résultat est identique à celui des fonctions ligne par ligne : troncature
+vers zéro comme int(), None pour les valeurs manquantes. Les valeurs négatives
+ou infinies (absentes des données réelles) passent par la fonction ligne par
+ligne, qui garde son comportement.
+"""
+import numpy as np
+import pandas as pd
+
+SECONDS_PER_HOUR = 3600
+
+# "MM:SS" de 0 à 3599 secondes et ":SS" de 0 à 59 secondes (indice = secondes)
+_MM_SS = np.array([f"{m:02d}:{s:02d}" for m in range(60) for s in range(60)], dtype=object)
+_COLON_SS = np.array([f":{s:02d}" for s in range(60)], dtype=object)
+
+
+def format_seconds_to_min_sec(seconds):
+    if pd.isna(seconds):
+        return None
+    total_seconds = int(seconds)
+    minutes = total_seconds // 60
+    seconds = total_seconds % 60
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def format_seconds_to_hms(seconds):
+    """Convertit un nombre de secondes en format H:MM:SS ou MM:SS si < 1h."""
+    if pd.isna(seconds):
+        return None
+    total_seconds = int(seconds)
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    secs = total_seconds % 60
+    
+    if hours > 0:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes:02d}:{secs:02d}"
+
+
+def _seconds_to_int(seconds):
+    """
+    Returns:
+        tuple: (secondes tronquées en int64, masque des valeurs manquantes, masque des valeurs
+        négatives ou infinies), la valeur des deux dernières catégories dans le premier tableau étant 0.
+    """
+    values = pd.Series(seconds).to_numpy(dtype=np.float64, na_value=np.nan)
+    missing = np.isnan(values)
+    special = ~missing & (~np.isfinite(values) | (values < 0))
+    total_seconds = np.where(missing | special, 0.0, np.trunc(values)).astype(np.int64)
+    return total_seconds, missing, special
+
+
+def _prefixes(values, template):
+    """template.format(valeur) pour chaque valeur, avec un seul formatage par valeur distincte."""
+    unique_values, inverse = np.unique(values, return_inverse=True)
+    return np.array([template.format(value) for value in unique_values], dtype=object)[inverse]
+
+
+def _finalize(formatted, seconds, missing, special, scalar_formatter):
+    if not len(formatted):
+        # Colonne vide : même type de résultat que .apply
+        return pd.Series(seconds).apply(scalar_formatter)
+    formatted[missing] = None
+    if special.any():
+        values = pd.Series(seconds).to_numpy(dtype=object)
+        formatted[special] = [scalar_formatter(value) for value in values[special]]
+    index = seconds.index if isinstance(seconds, pd.Series) else None
+    return pd.Series(formatted, index=index)
+
+
+def format_seconds_column_min_sec(seconds):
+    """
+    Équivalent vectorisé de seconds.apply(format_seconds_to_min_sec) : "MM:SS", minutes
+    non bornées ("61:40" pour 3700 s), None si la valeur est manquante.
+
+    Returns:
+        pd.Series: chaînes (ou None), même index que seconds.
+    """
+    total_seconds, missing, special = _seconds_to_int(seconds)
+    formatted = _MM_SS[total_seconds % SECONDS_PER_HOUR]
+    over_one_hour = total_seconds >= SECONDS_PER_HOUR
+    if over_one_hour.any():
+        long_seconds = total_seconds[over_one_hour]
+        formatted[over_one_hour] = _prefixes(long_seconds // 60, "{:02d}") + _COLON_SS[long_seconds % 60]
+    return _finalize(formatted, seconds, missing, special, format_seconds_to_min_sec)
+
+
+def format_seconds_column_hms(seconds):
+    """
+    Équivalent vectorisé de seconds.apply(format_seconds_to_hms) : "H:MM:SS", ou "MM:SS"
+    en dessous d'une heure, None si la valeur est manquante.
+
+    Returns:
+        pd.Series: chaînes (ou None), même index que seconds.
+    """
+    total_seconds, missing, special = _seconds_to_int(seconds)
+    formatted = _MM_SS[total_seconds % SECONDS_PER_HOUR]
+    over_one_hour = total_seconds >= SECONDS_PER_HOUR
+    if over_one_hour.any():
+        hours = total_seconds[over_one_hour] // SECONDS_PER_HOUR
+        formatted[over_one_hour] = _prefixes(hours, "{}:") + formatted[over_one_hour]
+    return _finalize(formatted, seconds, missing, special, format_seconds_to_hms)
@@ -1,14 +1,24 @@
+import sys
 import pandas as pd
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
+from pathlib import Path
+
+# Modules partagés avec le pipeline d'extraction (records_io), dans server/
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'server'))
+
+from records_io import read_records
 
 # --- 1. Chargement et Préparation des Données ---
 
 # Nom du fichier CSV (il doit se trouver dans le même répertoire que le script)
+# Un fichier Parquet / Arrow du même nom est lu à la place s'il existe (seules les colonnes utiles sont chargées)
 file_path = './public/activity_data.csv'
+used_columns = ['speed_kmh', 'heart_rate', 'cadence_step_per_min', 'stance_time', 'step_length',
+                'vertical_ratio', 'distance', 'altitude', 'temperature', 'stance_time_balance']
 try:
-    df = pd.read_csv(file_path)
+    df = read_records(file_path, columns=used_columns)
 except FileNotFoundError:
     print(f"Erreur : Le fichier {file_path} n'a pas été trouvé.")
     exit()